@@ -0,0 +1,45 @@
+"""
+Per-user access record kept in Django's cache: the user row plus the ids of
+every list the user owns or has been shared with. It backs both the auth
+backend's get_user() and the views' access checks, so neither needs a query
+once the record is cached. Records are invalidated by compras.signals.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Lista
+from .replicas import primario
+
+
+def _chave(user_id):
+    return f'compras:acesso:{user_id}'
+
+
+def registo(user_id):
+    """Return {'user': User, 'listas': frozenset} for user_id, or None if it doesn't exist."""
+    chave = _chave(user_id)
+    dados = cache.get(chave)
+    if dados is None:
+        with primario():
+            user = get_user_model().objects.filter(pk=user_id).first()
+            if user is None:
+                return None
+            listas = frozenset(Lista.objects.filter(
+                Q(dono_id=user_id) | Q(partilhas__utilizador_id=user_id)
+            ).values_list('pk', flat=True))
+        dados = {'user': user, 'listas': listas}
+        cache.set(chave, dados, getattr(settings, 'ACESSOS_TTL', 3600))
+    return dados
+
+
+def listas_acessiveis(user):
+    """Ids of the lists the user owns or has shared access to."""
+    dados = registo(user.pk)
+    return dados['listas'] if dados else frozenset()
+
+
+def invalidar(*user_ids):
+    """Drop the cached records of the given users."""
+    cache.delete_many([_chave(user_id) for user_id in user_ids])
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ComprasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'compras'
+
+    def ready(self):
+        # Receivers: cache invalidation, and the query counter of the metrics
+        from . import metricas, signals  # noqa: F401
@@ -2,6 +2,8 @@ import hashlib
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
 
+from . import senhas
+
 User = get_user_model()
 
 
@@ -23,17 +25,18 @@ class HashedPasswordBackend(BaseBackend):
             user = User.objects.get(username=username)
         except User.DoesNotExist:
             return None
-        if user.check_password(secret):
+        # Hashing runs in the bounded pool of compras.senhas (may raise Sobrecarga)
+        if senhas.verificar(user, secret):
             return user
         # If plain password was provided (e.g. Django admin), try SHA-256 hashing it
         if password and not password_hash:
             hashed = hashlib.sha256(password.encode()).hexdigest()
-            if user.check_password(hashed):
+            if senhas.verificar(user, hashed):
                 return user
         return None
 
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        # Served from the shared cache (see compras.acessos), not a query per request
+        from .acessos import registo
+        dados = registo(user_id)
+        return dados['user'] if dados else None
@@ -0,0 +1,87 @@
+"""
+Email outbox.
+
+Views never talk to the SMTP server: enfileirar() stores the message in
+EmailPendente (one INSERT) and returns. ``manage.py enviar_emails`` (the
+"correio" service) drains the table with enviar_pendentes(), LOTE emails at
+a time over one SMTP connection. A message the server refuses is retried
+after EMAILS_ESPERA seconds, twice as long after each further failure, up to
+EMAILS_TENTATIVAS attempts; then it stays in the table with its last error.
+"""
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import EmailPendente
+
+# Emails sent per transaction
+LOTE = 50
+
+
+def enfileirar(assunto, corpo, destinatario, remetente=None):
+    return EmailPendente.objects.create(
+        assunto=assunto,
+        corpo=corpo,
+        remetente=remetente or settings.DEFAULT_FROM_EMAIL,
+        destinatario=destinatario,
+    )
+
+
+def _falhou(email, erro, agora):
+    email.tentativas += 1
+    email.erro = f'{type(erro).__name__}: {erro}'
+    if email.tentativas >= getattr(settings, 'EMAILS_TENTATIVAS', 6):
+        email.proxima_tentativa = None
+    else:
+        espera = getattr(settings, 'EMAILS_ESPERA', 60) * 2 ** (email.tentativas - 1)
+        email.proxima_tentativa = agora + timedelta(seconds=espera)
+
+
+def enviar_pendentes(conexao, lote=LOTE):
+    """
+    Send up to ``lote`` due emails, oldest first, over the mail backend
+    ``conexao``, which is opened if needed and left open for the next call.
+    Return (sent, failed). The rows are locked while they are sent (skipping
+    rows already locked, where supported), so concurrent senders never send
+    the same email twice.
+
+    Errors opening the connection mean the server is unreachable, not that
+    the message is bad: the batch stops, the emails already sent are
+    recorded, and the error is raised without counting an attempt.
+    """
+    agora = timezone.now()
+    enviados, falhados = [], []
+    erro_ligacao = None
+    with transaction.atomic():
+        pendentes = EmailPendente.objects.filter(
+            proxima_tentativa__lte=agora,
+        ).order_by('proxima_tentativa').select_for_update(
+            skip_locked=connection.features.has_select_for_update_skip_locked,
+        )[:lote]
+        for email in pendentes:
+            try:
+                conexao.open()
+            except (smtplib.SMTPException, OSError) as e:
+                erro_ligacao = e
+                break
+            try:
+                EmailMessage(
+                    email.assunto, email.corpo, email.remetente, [email.destinatario],
+                    connection=conexao,
+                ).send()
+            except (smtplib.SMTPException, OSError) as e:
+                # The connection may be unusable now; the next email reopens it
+                conexao.close()
+                _falhou(email, e, agora)
+                falhados.append(email)
+            else:
+                enviados.append(email.pk)
+        EmailPendente.objects.filter(pk__in=enviados).delete()
+        EmailPendente.objects.bulk_update(falhados, ['tentativas', 'proxima_tentativa', 'erro'])
+    if erro_ligacao is not None:
+        raise erro_ligacao
+    return len(enviados), len(falhados)
@@ -0,0 +1,103 @@
+"""
+Latency and SQL query counts of the hot views, shared by the
+``medir_desempenho`` command and compras.tests.
+
+ORCAMENTO_CONSULTAS is the most queries each view may run on a warm cache,
+whatever the size of the list: a view whose count grows with the data has an
+N+1 and fails the run. The counts include the session and transaction
+statements Django sends.
+"""
+import math
+import statistics
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import tokens
+from .models import Artigo
+from .views import CLONAR_BATCH
+
+ORCAMENTO_CONSULTAS = {
+    'index': 8,
+    'check_updates': 4,
+    'alteracoes': 5,
+    'ver_link': 8,
+    'link_check_updates': 2,
+    'pagina_artigos': 4,
+    'link_pagina_artigos': 3,
+    'procurar': 3,
+    # Served from the per-process LRU after the first lookup
+    'sugerir_artigos': 2,
+    # With one INSERT batch of items; see orcamento()
+    'clonar_lista': 16,
+}
+
+
+def orcamento(nome, artigos):
+    """Query budget of a view for lists of ``artigos`` items."""
+    limite = ORCAMENTO_CONSULTAS[nome]
+    if nome == 'clonar_lista':
+        # Copying the items takes one INSERT per batch; the batch is CLONAR_BATCH
+        # rows or less where the backend caps query parameters (SQLite)
+        campos = [f for f in Artigo._meta.concrete_fields if not f.primary_key]
+        lote = min(CLONAR_BATCH, connection.ops.bulk_batch_size(campos, [None] * CLONAR_BATCH))
+        limite += max(math.ceil(artigos / lote) - 1, 0)
+    return limite
+
+
+def cenarios(lista, link):
+    """(name, method, url, logged in) of each benchmarked view, for a seeded list."""
+    token = tokens.token_publico(link)
+    return [
+        ('index', 'get', reverse('index'), True),
+        ('check_updates', 'get', reverse('check_updates'), True),
+        ('alteracoes', 'get', reverse('alteracoes') + '?desde=0', True),
+        ('ver_link', 'get', reverse('ver_link', args=[token]), False),
+        ('link_check_updates', 'get', reverse('link_check_updates', args=[token]), False),
+        ('pagina_artigos', 'get', reverse('pagina_artigos', args=[lista.pk]) + '?seccao=despensa', True),
+        ('link_pagina_artigos', 'get', reverse('link_pagina_artigos', args=[token]) + '?seccao=despensa', False),
+        ('procurar', 'get', reverse('procurar') + '?q=pao', True),
+        ('sugerir_artigos', 'get', reverse('sugerir_artigos') + '?q=le', True),
+        ('clonar_lista', 'post', reverse('clonar_lista', args=[lista.pk]), True),
+    ]
+
+
+def cliente(user, lista, host=None):
+    """Client logged in as user with lista selected, plus an anonymous one."""
+    extra = {'HTTP_HOST': host} if host else {}
+    autenticado = Client(**extra)
+    autenticado.force_login(user)
+    autenticado.get(reverse('selecionar_lista', args=[lista.pk]))
+    return autenticado, Client(**extra)
+
+
+def medir(client, metodo, url, repeticoes):
+    """
+    Request url ``repeticoes`` times after one warm-up request.
+    Return {'p50', 'p95' (ms), 'consultas' (max per request), 'estado'}.
+    """
+    pedir = getattr(client, metodo)
+    pedir(url)
+    tempos, consultas, estado = [], 0, None
+    for _ in range(repeticoes):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            resposta = pedir(url)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        consultas = max(consultas, len(capturadas))
+        estado = resposta.status_code
+    return {
+        'p50': statistics.median(tempos),
+        'p95': percentil(tempos, 95),
+        'consultas': consultas,
+        'estado': estado,
+    }
+
+
+def percentil(valores, p):
+    """Nearest-rank percentile."""
+    ordenados = sorted(valores)
+    return ordenados[max(0, -(-len(ordenados) * p // 100) - 1)]
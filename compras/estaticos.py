@@ -0,0 +1,35 @@
+"""
+WhiteNoise for an async middleware chain.
+
+WhiteNoiseMiddleware is sync-only, and one sync middleware makes Django run the
+whole chain below it in a thread per request under ASGI. EstaticosMiddleware
+serves the same files, but lets every other request go down the chain on the
+event loop.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class EstaticosMiddleware(WhiteNoiseMiddleware):
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Looks in the file system (DEBUG)
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens the file
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,202 @@
+"""
+Fan-out of list change notifications to the Server-Sent Events streams.
+
+Every open tab subscribes to one or more channels (``lista:<pk>`` and
+``utilizador:<pk>``) and waits for their revision to move past the one it
+already knows. Publishing is done by the sync views (see views._tocar_lista);
+waiting is done by the async event-stream views, so the backends must be
+thread-safe and wake asyncio waiters through ``call_soon_threadsafe``.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def canal_lista(pk):
+    return f'lista:{pk}'
+
+
+def canal_utilizador(pk):
+    return f'utilizador:{pk}'
+
+
+def backend():
+    """Return the process-wide backend configured in settings.EVENTOS_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                classe = import_string(getattr(
+                    settings, 'EVENTOS_BACKEND', 'compras.eventos.BaseDadosBackend'
+                ))
+                _backend = classe()
+    return _backend
+
+
+def publicar(canal, revisao):
+    """Notify the subscribers of a channel that it reached a new revision."""
+    backend().publicar(canal, revisao)
+
+
+class MemoriaBackend:
+    """
+    In-process fan-out. Only sees revisions published by this process, so it
+    is suitable for a single worker (e.g. runserver or one uvicorn process).
+
+    The revision of a channel with subscribers is kept while they stay. Of the
+    channels without any, only the EVENTOS_CANAIS_INATIVOS most recently
+    published or left are remembered: enough for a stream that is between two
+    esperar() calls, without growing with every list written in the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revisoes = {}
+        self._subscritores = {}
+        # Channels in _revisoes with no subscriber, oldest first
+        self._inativos = OrderedDict()
+        self.inativos_max = getattr(settings, 'EVENTOS_CANAIS_INATIVOS', 1000)
+
+    def _inativo(self, canal):
+        """Mark a channel as having no subscriber; forget the oldest past the limit. Holds _lock."""
+        self._inativos[canal] = None
+        self._inativos.move_to_end(canal)
+        while len(self._inativos) > self.inativos_max:
+            antigo, _ = self._inativos.popitem(last=False)
+            del self._revisoes[antigo]
+
+    def publicar(self, canal, revisao):
+        if revisao is None:
+            return
+        with self._lock:
+            if revisao <= self._revisoes.get(canal, -1):
+                return
+            self._revisoes[canal] = revisao
+            subscritores = list(self._subscritores.get(canal, ()))
+            if not subscritores:
+                self._inativo(canal)
+        for loop, evento in subscritores:
+            loop.call_soon_threadsafe(evento.set)
+
+    def _alteradas(self, conhecidas):
+        with self._lock:
+            return {
+                canal: self._revisoes[canal]
+                for canal, revisao in conhecidas.items()
+                if self._revisoes.get(canal, -1) > revisao
+            }
+
+    def _subscrever(self, canais, subscritor):
+        with self._lock:
+            for canal in canais:
+                self._subscritores.setdefault(canal, set()).add(subscritor)
+                self._inativos.pop(canal, None)
+
+    def _cancelar(self, canais, subscritor):
+        with self._lock:
+            for canal in canais:
+                subscritores = self._subscritores.get(canal)
+                if subscritores is not None:
+                    subscritores.discard(subscritor)
+                    if not subscritores:
+                        del self._subscritores[canal]
+                        if canal in self._revisoes:
+                            self._inativo(canal)
+
+    async def esperar(self, conhecidas, timeout):
+        """
+        Wait until any channel in ``conhecidas`` ({canal: revisao}) moves to
+        another revision. Return {canal: nova_revisao}, or {} on timeout.
+        """
+        evento = asyncio.Event()
+        subscritor = (asyncio.get_running_loop(), evento)
+        self._subscrever(conhecidas, subscritor)
+        try:
+            evento.clear()
+            alteradas = self._alteradas(conhecidas)
+            if alteradas:
+                return alteradas
+            try:
+                await asyncio.wait_for(evento.wait(), timeout)
+            except asyncio.TimeoutError:
+                return {}
+            return self._alteradas(conhecidas)
+        finally:
+            self._cancelar(conhecidas, subscritor)
+
+
+class BaseDadosBackend(MemoriaBackend):
+    """
+    In-process fan-out fed by a single polling thread per process, so changes
+    made by other gunicorn/uvicorn workers are seen without Redis. While there
+    are subscribers the thread reads the revisions of every subscribed list and
+    user with one query each, every EVENTOS_INTERVALO seconds, no matter how
+    many connections are open. With no subscribers it sleeps and does nothing.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.intervalo = getattr(settings, 'EVENTOS_INTERVALO', 2)
+        self._acordar = threading.Event()
+        self._thread = None
+
+    def _subscrever(self, canais, subscritor):
+        super()._subscrever(canais, subscritor)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._ciclo, name='compras-eventos', daemon=True
+                )
+                self._thread.start()
+        self._acordar.set()
+
+    def _canais_subscritos(self):
+        with self._lock:
+            return list(self._subscritores)
+
+    def _ciclo(self):
+        while True:
+            canais = self._canais_subscritos()
+            if not canais:
+                connections.close_all()
+                self._acordar.wait()
+                self._acordar.clear()
+                continue
+            try:
+                for canal, revisao in self._ler_revisoes(canais):
+                    self.publicar(canal, revisao)
+            except Exception:
+                logger.exception('Falha ao ler revisões para os eventos')
+                close_old_connections()
+            time.sleep(self.intervalo)
+
+    def _ler_revisoes(self, canais):
+        from .models import Lista, RevisaoUtilizador
+
+        listas, utilizadores = [], []
+        for canal in canais:
+            tipo, _, pk = canal.partition(':')
+            if tipo == 'lista':
+                listas.append(int(pk))
+            elif tipo == 'utilizador':
+                utilizadores.append(int(pk))
+        if listas:
+            for pk, revisao in Lista.objects.filter(pk__in=listas).values_list('pk', 'revisao'):
+                yield canal_lista(pk), revisao
+        if utilizadores:
+            revisoes = RevisaoUtilizador.objects.filter(
+                utilizador_id__in=utilizadores
+            ).values_list('utilizador_id', 'revisao')
+            for pk, revisao in revisoes:
+                yield canal_utilizador(pk), revisao
@@ -0,0 +1,65 @@
+"""
+Cached HTML fragments of the list pages.
+
+The item sections and the sidebar are rendered once and kept in the shared
+cache under a key that carries the revision they were rendered at (the list's
+``revisao`` for the items, the user's RevisaoUtilizador for the sidebar) and
+the viewer's permission shape. Every write bumps the revision, so an entry is
+never invalidated explicitly: the next render simply asks for a new key and the
+old one ages out after FRAGMENTOS_TTL. Keys also carry versao(), so a deploy
+that changes the markup never serves fragments rendered by the old templates.
+
+Fragments are rendered with a placeholder instead of the CSRF token, which is
+per request; the real token is substituted each time a fragment is served. The
+placeholder is a tag, and a secret one: escaped user text never contains ``<``,
+so no item or list name can be mistaken for it.
+"""
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.utils.crypto import salted_hmac
+from django.utils.safestring import mark_safe
+
+
+@lru_cache(maxsize=None)
+def versao():
+    """Fingerprint of the deployed templates and static file names (also part of the page ETags)."""
+    h = hashlib.sha256()
+    for caminho in sorted((Path(__file__).parent / 'templates').rglob('*.html')):
+        h.update(caminho.read_bytes())
+    for ficheiro in ('compras/css/index.css', 'compras/js/index.js', 'compras/css/link.css', 'compras/js/link.js'):
+        h.update(static(ficheiro).encode())
+    return h.hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def marca_csrf():
+    """CSRF placeholder of this deploy: the same in every worker, unknown to users."""
+    return mark_safe(f'<csrf-{salted_hmac("compras.fragmentos.csrf", versao()).hexdigest()[:16]}>')
+
+
+def chave(*partes):
+    return ':'.join(['compras:fragmento', versao(), *(str(parte) for parte in partes)])
+
+
+def chave_token(token):
+    """Hashed link token: the raw one may be long or not a valid memcached key."""
+    return hashlib.sha256(str(token).encode()).hexdigest()[:32]
+
+
+def renderizar(request, chave, template, contexto):
+    """
+    Return ``template`` rendered with ``contexto()`` (only called on a miss),
+    from the cache when ``chave`` is present.
+    """
+    html = cache.get(chave)
+    if html is None:
+        html = render_to_string(template, {**contexto(), 'csrf_token': marca_csrf()})
+        cache.set(chave, html, getattr(settings, 'FRAGMENTOS_TTL', 3600))
+    return mark_safe(html.replace(marca_csrf(), get_token(request)))
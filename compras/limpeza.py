@@ -0,0 +1,31 @@
+"""
+Batched deletes for the periodic cleanup jobs, so purging a large backlog
+never holds locks on a big range of rows or builds one huge transaction.
+"""
+import time
+
+LOTE = 1000
+
+
+def apagar_em_lotes(queryset, lote=LOTE, pausa=0, ao_apagar=None):
+    """
+    Delete the rows of ``queryset`` ``lote`` primary keys at a time, sleeping
+    ``pausa`` seconds between batches. ``ao_apagar(n, segundos)`` is called
+    after each batch with the rows it deleted and how long it took. Return the
+    number of rows deleted.
+    """
+    modelo = queryset.model
+    total = 0
+    while True:
+        inicio = time.perf_counter()
+        pks = list(queryset.order_by().values_list('pk', flat=True)[:lote])
+        if not pks:
+            return total
+        apagados = modelo._base_manager.filter(pk__in=pks).delete()[1].get(modelo._meta.label, 0)
+        total += apagados
+        if ao_apagar is not None:
+            ao_apagar(apagados, time.perf_counter() - inicio)
+        if len(pks) < lote:
+            return total
+        if pausa:
+            time.sleep(pausa)
@@ -0,0 +1,54 @@
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from compras.correio import LOTE, enviar_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        'Send the emails waiting in the outbox (EmailPendente), --lote at a time '
+        'over one SMTP connection. With --ciclo, check for new ones every '
+        '--intervalo seconds (the "correio" service of docker-compose).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=LOTE, help='Emails sent per batch')
+        parser.add_argument('--ciclo', action='store_true', help='Keep running, checking every --intervalo seconds')
+        parser.add_argument(
+            '--intervalo', type=float, default=getattr(settings, 'EMAILS_INTERVALO', 5),
+            help='Seconds between checks with --ciclo',
+        )
+
+    def handle(self, *args, **opts):
+        if not opts['ciclo']:
+            self.enviar(opts['lote'])
+            return
+        while True:
+            close_old_connections()
+            try:
+                self.enviar(opts['lote'])
+            except (DatabaseError, smtplib.SMTPException, OSError) as e:
+                self.stderr.write(f'Envio falhou: {type(e).__name__}: {e}')
+            time.sleep(opts['intervalo'])
+
+    def enviar(self, lote):
+        """Drain the due emails, then close the connection instead of keeping it idle."""
+        conexao = get_connection(fail_silently=False)
+        try:
+            while True:
+                inicio = time.perf_counter()
+                enviados, falhados = enviar_pendentes(conexao, lote)
+                if enviados or falhados:
+                    self.stdout.write(
+                        f'{enviados} enviados, {falhados} falhados em '
+                        f'{(time.perf_counter() - inicio) * 1000:.0f} ms'
+                    )
+                if enviados + falhados < lote:
+                    return
+        finally:
+            conexao.close()
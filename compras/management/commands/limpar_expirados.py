@@ -0,0 +1,105 @@
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from compras.limpeza import LOTE, apagar_em_lotes
+from compras.models import ArtigoApagado, LinkPartilha, Lista, OperacaoAplicada
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete share links expired more than --carencia days ago, expired '
+        'sessions, item tombstones older than APAGADOS_RETENCAO_DIAS and the '
+        'offline operation ids older than OPERACOES_RETENCAO_DIAS, '
+        'in batches of --lote rows. With --ciclo, repeat every '
+        '--intervalo seconds (the "limpeza" service of docker-compose).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--carencia', type=float, default=getattr(settings, 'LINKS_CARENCIA_DIAS', 7),
+            help='Days an expired link is kept before being deleted',
+        )
+        parser.add_argument('--lote', type=int, default=LOTE, help='Rows deleted per batch')
+        parser.add_argument(
+            '--pausa', type=float, default=getattr(settings, 'LIMPEZA_PAUSA', 0.1),
+            help='Seconds to sleep between batches',
+        )
+        parser.add_argument('--ciclo', action='store_true', help='Keep running, once every --intervalo seconds')
+        parser.add_argument(
+            '--intervalo', type=float, default=getattr(settings, 'LIMPEZA_INTERVALO', 3600),
+            help='Seconds between runs with --ciclo',
+        )
+
+    def handle(self, *args, **opts):
+        if not opts['ciclo']:
+            self.limpar(**opts)
+            return
+        while True:
+            # Connections left open for an hour are dropped by MariaDB's wait_timeout
+            close_old_connections()
+            try:
+                self.limpar(**opts)
+            except DatabaseError as e:
+                self.stderr.write(f'Limpeza falhou: {e}')
+            time.sleep(opts['intervalo'])
+
+    def limpar(self, carencia, lote, pausa, **_):
+        agora = timezone.now()
+        inicio = time.perf_counter()
+        links = self.apagar(
+            'links',
+            LinkPartilha.objects.filter(expira_em__lt=agora - timedelta(days=carencia)),
+            lote, pausa,
+        )
+        sessoes = 0
+        # Only the database-backed engines keep rows to purge
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if hasattr(store, 'get_model_class'):
+            sessoes = self.apagar(
+                'sessões',
+                store.get_model_class().objects.filter(expire_date__lt=agora),
+                lote, pausa,
+            )
+        apagados = self.apagar_tombstones(
+            agora - timedelta(days=getattr(settings, 'APAGADOS_RETENCAO_DIAS', 30)), lote, pausa,
+        )
+        # Past this, a queue replayed again would apply its operations twice
+        retencao = timedelta(days=getattr(settings, 'OPERACOES_RETENCAO_DIAS', 30))
+        operacoes = self.apagar(
+            'operações',
+            OperacaoAplicada.objects.filter(criado_em__lt=agora - retencao),
+            lote, pausa,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{links} links, {sessoes} sessões, {apagados} tombstones e {operacoes} operações apagados '
+            f'em {time.perf_counter() - inicio:.2f} s.'
+        ))
+
+    def apagar_tombstones(self, corte, lote, pausa):
+        """
+        Delete tombstones older than ``corte``, first raising each affected
+        list's revisao_purgada to the newest revision being dropped, so a
+        delta sync from before it reloads instead of missing deletions.
+        """
+        antigos = ArtigoApagado.objects.filter(apagado_em__lt=corte)
+        maximo = antigos.filter(lista=OuterRef('pk')).order_by().values('lista').annotate(
+            maximo=Max('revisao'),
+        ).values('maximo')
+        Lista.objects.filter(pk__in=antigos.values('lista')).update(
+            revisao_purgada=Greatest(F('revisao_purgada'), Subquery(maximo)),
+        )
+        return self.apagar('tombstones', antigos, lote, pausa)
+
+    def apagar(self, nome, queryset, lote, pausa):
+        def relatar(n, segundos):
+            self.stdout.write(f'{nome}: lote de {n} apagado em {segundos * 1000:.0f} ms')
+
+        return apagar_em_lotes(queryset, lote=lote, pausa=pausa, ao_apagar=relatar)
@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from compras import desempenho
+from compras.models import LinkPartilha, Lista
+
+from .semear_dados import Command as Semear
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed datasets of several sizes (see semear_dados) and report p50/p95 latency '
+        'and SQL queries of the hot views. Fails when a view exceeds its query budget '
+        '(compras.desempenho.ORCAMENTO_CONSULTAS). Seeded users are removed at the end. '
+        'Runs only with DEBUG or --confirmar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanhos', default='10,100,1000',
+            help='Comma-separated items per list (K) to benchmark',
+        )
+        parser.add_argument('--utilizadores', type=int, default=20)
+        parser.add_argument('--listas', type=int, default=3)
+        parser.add_argument('--partilhas', type=int, default=2)
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--prefixo', default='bench')
+        parser.add_argument(
+            '--host', help='Host header of the requests (default: first plain host in ALLOWED_HOSTS)',
+        )
+        parser.add_argument(
+            '--confirmar', action='store_true',
+            help='Run even without DEBUG: seeds and deletes users in the configured database',
+        )
+
+    def handle(self, *args, **opts):
+        Semear.exigir_confirmacao(opts['confirmar'])
+        try:
+            tamanhos = [int(t) for t in opts['tamanhos'].split(',') if t.strip()]
+        except ValueError:
+            raise CommandError('--tamanhos deve ser uma lista de inteiros, ex: 10,100,1000.')
+
+        if not opts['host']:
+            opts['host'] = next(
+                (h for h in settings.ALLOWED_HOSTS if '*' not in h and not h.startswith('.')),
+                'testserver',
+            )
+
+        excedidos = []
+        try:
+            for tamanho in tamanhos:
+                excedidos += self.medir_tamanho(tamanho, opts)
+        finally:
+            Semear.limpar(opts['prefixo'])
+
+        if excedidos:
+            raise CommandError('Orçamento de consultas excedido: ' + '; '.join(excedidos))
+        self.stdout.write(self.style.SUCCESS('Todas as vistas dentro do orçamento.'))
+
+    def medir_tamanho(self, tamanho, opts):
+        call_command(
+            'semear_dados', stdout=StringIO(),
+            utilizadores=opts['utilizadores'], listas=opts['listas'], artigos=tamanho,
+            partilhas=opts['partilhas'], semente=opts['semente'], prefixo=opts['prefixo'],
+            confirmar=True,
+        )
+        user = Semear.utilizadores(opts['prefixo']).order_by('pk').first()
+        lista = Lista.objects.filter(dono=user).order_by('pk').first()
+        link = LinkPartilha.objects.filter(lista=lista).first()
+        autenticado, anonimo = desempenho.cliente(user, lista, host=opts['host'])
+
+        self.stdout.write(f'\nK={tamanho} artigos por lista')
+        self.stdout.write(f'  {"vista":<20} {"p50 ms":>8} {"p95 ms":>8} {"SQL":>5} {"máx":>5}')
+        excedidos = []
+        for nome, metodo, url, login in desempenho.cenarios(lista, link):
+            resultado = desempenho.medir(
+                autenticado if login else anonimo, metodo, url, opts['repeticoes']
+            )
+            orcamento = desempenho.orcamento(nome, tamanho)
+            linha = (
+                f'  {nome:<20} {resultado["p50"]:>8.1f} {resultado["p95"]:>8.1f} '
+                f'{resultado["consultas"]:>5} {orcamento:>5}'
+            )
+            if resultado['estado'] >= 400:
+                excedidos.append(f'{nome} (K={tamanho}) respondeu {resultado["estado"]}')
+                linha = self.style.ERROR(linha + f'  HTTP {resultado["estado"]}')
+            elif resultado['consultas'] > orcamento:
+                excedidos.append(f'{nome} (K={tamanho}) {resultado["consultas"]} > {orcamento}')
+                linha = self.style.ERROR(linha)
+            self.stdout.write(linha)
+        return excedidos
@@ -0,0 +1,137 @@
+import random
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from compras.models import Artigo, LinkPartilha, Lista, ListaPartilha
+
+User = get_user_model()
+
+NOMES_ARTIGOS = (
+    'leite', 'pão', 'ovos', 'arroz', 'massa', 'azeite', 'café', 'açúcar',
+    'farinha', 'manteiga', 'queijo', 'fiambre', 'iogurte', 'maçãs', 'bananas',
+    'batatas', 'cebolas', 'alho', 'tomate', 'alface', 'frango', 'atum',
+    'detergente', 'papel higiénico', 'sabonete', 'champô', 'água', 'sumo',
+)
+UNIDADES = ('x', 'x', 'x', 'g', 'kg', 'L', ' pacotes')
+LOTE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a deterministic dataset: N users with M lists each, K items per list, '
+        'S shares per list and one share link per list. Users are named <prefixo><n> '
+        'and can be removed with --limpar. Runs only with DEBUG or --confirmar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilizadores', type=int, default=10, help='Number of users (N)')
+        parser.add_argument('--listas', type=int, default=3, help='Lists per user (M)')
+        parser.add_argument('--artigos', type=int, default=50, help='Items per list (K)')
+        parser.add_argument('--partilhas', type=int, default=2, help='Other users each list is shared with')
+        parser.add_argument('--semente', type=int, default=42, help='Random seed')
+        parser.add_argument('--prefixo', default='bench', help='Username prefix of the seeded users')
+        parser.add_argument('--password', default='bench', help='Password of every seeded user')
+        parser.add_argument('--limpar', action='store_true', help='Only delete the users with this prefix (and their lists)')
+        parser.add_argument(
+            '--confirmar', action='store_true',
+            help='Run even without DEBUG: the users with this prefix are deleted from the configured database',
+        )
+
+    def handle(self, *args, **opts):
+        self.exigir_confirmacao(opts['confirmar'])
+        apagados = self.limpar(opts['prefixo'])
+        if opts['limpar']:
+            self.stdout.write(f'{apagados} utilizadores apagados.')
+            return
+        if opts['partilhas'] >= opts['utilizadores'] > 0:
+            raise CommandError('--partilhas tem de ser menor que --utilizadores.')
+        totais = self.semear(**opts)
+        self.stdout.write(self.style.SUCCESS(
+            '{utilizadores} utilizadores, {listas} listas, {artigos} artigos, '
+            '{partilhas} partilhas, {links} links.'.format(**totais)
+        ))
+
+    @staticmethod
+    def exigir_confirmacao(confirmar):
+        """Refuse to create and delete users outside DEBUG unless --confirmar was given."""
+        if not (settings.DEBUG or confirmar):
+            nome = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+            raise CommandError(
+                f'Sem DEBUG, isto cria e apaga utilizadores na base de dados {nome}. '
+                'Use --confirmar para continuar.'
+            )
+
+    @staticmethod
+    def utilizadores(prefixo):
+        """Seeded users: exactly <prefixo><n>, so real accounts are never matched."""
+        return User.objects.filter(username__regex=rf'^{re.escape(prefixo)}[0-9]+$')
+
+    @classmethod
+    def limpar(cls, prefixo):
+        """Delete the seeded users; lists, items, shares and links go by cascade."""
+        return cls.utilizadores(prefixo).delete()[1].get(User._meta.label, 0)
+
+    @transaction.atomic
+    def semear(self, utilizadores, listas, artigos, partilhas, semente, prefixo, password, **_):
+        rnd = random.Random(semente)
+        hash_password = make_password(password)
+        User.objects.bulk_create([
+            User(username=f'{prefixo}{n}', email=f'{prefixo}{n}@exemplo.pt', password=hash_password)
+            for n in range(utilizadores)
+        ], batch_size=LOTE)
+        users = list(self.utilizadores(prefixo).order_by('pk'))
+
+        Lista.objects.bulk_create([
+            Lista(nome=f'Lista {m}', dono=user)
+            for user in users
+            for m in range(listas)
+        ], batch_size=LOTE)
+        todas = list(Lista.objects.filter(dono__in=users).order_by('pk'))
+
+        novos = []
+        n_artigos = 0
+        for lista in todas:
+            for k in range(artigos):
+                novos.append(Artigo(
+                    lista=lista,
+                    nome=f'{rnd.choice(NOMES_ARTIGOS)} {k}',
+                    qtd=rnd.randint(1, 12),
+                    unidade=rnd.choice(UNIDADES),
+                    comprar=rnd.random() < 0.4,
+                ))
+            if len(novos) >= LOTE:
+                Artigo.objects.bulk_create(novos, batch_size=LOTE)
+                n_artigos += len(novos)
+                novos = []
+        Artigo.objects.bulk_create(novos, batch_size=LOTE)
+        n_artigos += len(novos)
+
+        ListaPartilha.objects.bulk_create([
+            ListaPartilha(lista=lista, utilizador=outro)
+            for lista in todas
+            for outro in rnd.sample([u for u in users if u.pk != lista.dono_id], partilhas)
+        ], batch_size=LOTE)
+
+        expira = timezone.now() + timedelta(days=1)
+        LinkPartilha.objects.bulk_create([
+            LinkPartilha(
+                lista=lista, expira_em=expira,
+                pode_adicionar=True, pode_editar=True, pode_apagar=True, pode_toggle=True,
+            )
+            for lista in todas
+        ], batch_size=LOTE)
+
+        return {
+            'utilizadores': len(users),
+            'listas': len(todas),
+            'artigos': n_artigos,
+            'partilhas': len(todas) * partilhas,
+            'links': len(todas),
+        }
@@ -0,0 +1,232 @@
+"""
+Per-request instrumentation and Prometheus metrics.
+
+MetricasMiddleware measures, for every request, the SQL queries and time
+(through an execute wrapper installed on every connection), the template
+rendering time (through the TemplatesMedidos backend) and the total wall
+time. The measurement lives in a context variable, so it also follows async
+requests into the threads of their sync_to_async calls. It sends them back in a
+``Server-Timing`` header and adds them to per-view histograms.
+
+Each gunicorn worker keeps its histograms in memory and writes a snapshot to
+``METRICAS_DIR/<pid>.json`` at most every METRICAS_INTERVALO seconds; the
+metrics endpoint (views.ver_metricas) sums the snapshots of every worker.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+# Upper bounds (seconds) of the latency histogram buckets
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_medicao = ContextVar('compras_medicao', default=None)
+
+
+class _Medicao:
+    __slots__ = ('sql_n', 'sql_s', 'tpl_s')
+
+    def __init__(self):
+        self.sql_n = 0
+        self.sql_s = 0.0
+        self.tpl_s = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_n += 1
+            self.sql_s += time.perf_counter() - inicio
+
+
+def _medir(execute, sql, params, many, context):
+    medicao = _medicao.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    return medicao(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _instalar(sender, connection, **kwargs):
+    # A wrapper reconnects (CONN_MAX_AGE) without being created again
+    if _medir not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir)
+
+
+def _vazio():
+    return {'baldes': [0] * len(LIMITES), 'n': 0, 'soma': 0.0, 'sql_n': 0, 'sql_s': 0.0, 'tpl_s': 0.0}
+
+
+class _Histogramas:
+    """Per-view histograms of this process, flushed to its own file."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vistas = {}
+        self._gravado_em = 0.0
+
+    def registar(self, vista, total, medicao):
+        with self._lock:
+            dados = self._vistas.get(vista)
+            if dados is None:
+                dados = self._vistas[vista] = _vazio()
+            for i, limite in enumerate(LIMITES):
+                if total <= limite:
+                    dados['baldes'][i] += 1
+                    break
+            dados['n'] += 1
+            dados['soma'] += total
+            dados['sql_n'] += medicao.sql_n
+            dados['sql_s'] += medicao.sql_s
+            dados['tpl_s'] += medicao.tpl_s
+        if time.monotonic() - self._gravado_em >= getattr(settings, 'METRICAS_INTERVALO', 5):
+            self.gravar()
+
+    def gravar(self):
+        """Write this process' snapshot atomically (write to a temp file, then rename)."""
+        pasta = _pasta()
+        with self._lock:
+            self._gravado_em = time.monotonic()
+            conteudo = json.dumps(self._vistas)
+        try:
+            pasta.mkdir(parents=True, exist_ok=True)
+            fd, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+            with os.fdopen(fd, 'w') as ficheiro:
+                ficheiro.write(conteudo)
+            os.replace(temporario, pasta / f'{os.getpid()}.json')
+        except OSError:
+            pass
+
+
+_histogramas = _Histogramas()
+
+
+def _pasta():
+    return Path(getattr(settings, 'METRICAS_DIR', '/tmp/lista_compras_metricas'))
+
+
+class TemplatesMedidos(DjangoTemplates):
+    """DjangoTemplates backend that adds render time to the current request's measurement."""
+
+    def from_string(self, template_code):
+        return _TemplateMedido(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TemplateMedido(super().get_template(template_name))
+
+
+class _TemplateMedido:
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, nome):
+        return getattr(self._template, nome)
+
+    def render(self, context=None, request=None):
+        medicao = _medicao.get()
+        if medicao is None:
+            return self._template.render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            medicao.tpl_s += time.perf_counter() - inicio
+
+
+class MetricasMiddleware:
+    """Measure each request, add a Server-Timing header and feed the histograms."""
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicao = _Medicao()
+        token = _medicao.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        return self._registar(request, response, medicao, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        medicao = _Medicao()
+        token = _medicao.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        return self._registar(request, response, medicao, time.perf_counter() - inicio)
+
+    def _registar(self, request, response, medicao, total):
+        match = request.resolver_match
+        vista = match.view_name if match else 'sem_rota'
+        _histogramas.registar(vista, total, medicao)
+        response['Server-Timing'] = (
+            f'db;dur={medicao.sql_s * 1000:.1f};desc="{medicao.sql_n} queries", '
+            f'tpl;dur={medicao.tpl_s * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        return response
+
+
+def _agregar():
+    """Sum the snapshots of every worker."""
+    _histogramas.gravar()
+    vistas = {}
+    for ficheiro in _pasta().glob('*.json'):
+        try:
+            dados = json.loads(ficheiro.read_text())
+        except (OSError, ValueError):
+            continue
+        for vista, valores in dados.items():
+            soma = vistas.setdefault(vista, _vazio())
+            for i, contagem in enumerate(valores['baldes'][:len(LIMITES)]):
+                soma['baldes'][i] += contagem
+            for chave in ('n', 'soma', 'sql_n', 'sql_s', 'tpl_s'):
+                soma[chave] += valores[chave]
+    return vistas
+
+
+def exportar():
+    """All workers' metrics in the Prometheus text exposition format."""
+    vistas = _agregar()
+    linhas = [
+        '# HELP compras_pedido_duracao_segundos Request wall time by view.',
+        '# TYPE compras_pedido_duracao_segundos histogram',
+    ]
+    for vista, dados in sorted(vistas.items()):
+        acumulado = 0
+        for limite, contagem in zip(LIMITES, dados['baldes']):
+            acumulado += contagem
+            linhas.append(f'compras_pedido_duracao_segundos_bucket{{vista="{vista}",le="{limite}"}} {acumulado}')
+        linhas.append(f'compras_pedido_duracao_segundos_bucket{{vista="{vista}",le="+Inf"}} {dados["n"]}')
+        linhas.append(f'compras_pedido_duracao_segundos_sum{{vista="{vista}"}} {dados["soma"]:.6f}')
+        linhas.append(f'compras_pedido_duracao_segundos_count{{vista="{vista}"}} {dados["n"]}')
+    for nome, chave, ajuda in (
+        ('compras_sql_consultas_total', 'sql_n', 'SQL queries run by view.'),
+        ('compras_sql_segundos_total', 'sql_s', 'Time spent in SQL by view.'),
+        ('compras_template_segundos_total', 'tpl_s', 'Time spent rendering templates by view.'),
+    ):
+        linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} counter']
+        for vista, dados in sorted(vistas.items()):
+            valor = dados[chave]
+            linhas.append(f'{nome}{{vista="{vista}"}} {valor if chave == "sql_n" else f"{valor:.6f}"}')
+    return '\n'.join(linhas) + '\n'
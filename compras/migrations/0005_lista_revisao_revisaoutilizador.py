@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-18 09:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('compras', '0004_linkpartilha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevisaoUtilizador',
+            fields=[
+                ('utilizador', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='revisao_listas', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('revisao', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='lista',
+            name='revisao',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
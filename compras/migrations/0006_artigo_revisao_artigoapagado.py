@@ -0,0 +1,41 @@
+# Generated by Django 4.2.28 on 2026-10-18 09:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0005_lista_revisao_revisaoutilizador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtigoApagado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('artigo_id', models.BigIntegerField()),
+                ('revisao', models.PositiveBigIntegerField()),
+                ('apagado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='artigo',
+            name='revisao',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='artigo',
+            index=models.Index(fields=['lista', 'revisao'], name='artigo_lista_revisao_idx'),
+        ),
+        migrations.AddField(
+            model_name='artigoapagado',
+            name='lista',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artigos_apagados', to='compras.lista'),
+        ),
+        migrations.AddIndex(
+            model_name='artigoapagado',
+            index=models.Index(fields=['lista', 'revisao'], name='apagado_lista_revisao_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.28 on 2026-10-18 09:54
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+QUANTIDADE_RE = re.compile(r'^\s*(\d{1,9}(?:[.,]\d+)?)(.*?)\s*$')
+LOTE = 1000
+
+
+def separar(texto):
+    # Frozen copy of compras.models.separar_quantidade
+    texto = (texto or '').strip()
+    if not texto:
+        return Decimal(1), ''
+    match = QUANTIDADE_RE.match(texto)
+    if not match:
+        return None, texto[:50]
+    numero, unidade = match.groups()
+    try:
+        qtd = Decimal(numero.replace(',', '.')).quantize(Decimal('0.001'))
+    except InvalidOperation:
+        return None, texto[:50]
+    return qtd, unidade[:50]
+
+
+def preencher_qtd(apps, schema_editor):
+    Artigo = apps.get_model('compras', 'Artigo')
+    artigos = Artigo.objects.exclude(quantidade='1x').only('pk', 'quantidade').order_by('pk')
+    pendentes = []
+    for artigo in artigos.iterator(chunk_size=LOTE):
+        artigo.qtd, artigo.unidade = separar(artigo.quantidade)
+        pendentes.append(artigo)
+        if len(pendentes) >= LOTE:
+            Artigo.objects.bulk_update(pendentes, ['qtd', 'unidade'])
+            pendentes = []
+    if pendentes:
+        Artigo.objects.bulk_update(pendentes, ['qtd', 'unidade'])
+
+
+def repor_quantidade(apps, schema_editor):
+    Artigo = apps.get_model('compras', 'Artigo')
+    artigos = Artigo.objects.only('pk', 'qtd', 'unidade').order_by('pk')
+    pendentes = []
+    for artigo in artigos.iterator(chunk_size=LOTE):
+        if artigo.qtd is None:
+            artigo.quantidade = artigo.unidade
+        else:
+            artigo.quantidade = f"{artigo.qtd.normalize():f}{artigo.unidade}"[:50]
+        pendentes.append(artigo)
+        if len(pendentes) >= LOTE:
+            Artigo.objects.bulk_update(pendentes, ['quantidade'])
+            pendentes = []
+    if pendentes:
+        Artigo.objects.bulk_update(pendentes, ['quantidade'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0006_artigo_revisao_artigoapagado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artigo',
+            name='qtd',
+            # Nullable already, so text with no number is backfilled as it is
+            field=models.DecimalField(decimal_places=3, default=1, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='artigo',
+            name='unidade',
+            field=models.CharField(blank=True, default='x', max_length=50),
+        ),
+        migrations.RunPython(preencher_qtd, repor_quantidade),
+        migrations.RemoveField(
+            model_name='artigo',
+            name='quantidade',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.28 on 2026-10-18 09:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+# auth_user.email has no index; recuperar_password and adicionar_email look users up by it
+EMAIL_INDEX = models.Index(fields=['email'], name='compras_user_email_idx')
+
+
+def _utilizador(apps):
+    return apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+
+def criar_indice_email(apps, schema_editor):
+    schema_editor.add_index(_utilizador(apps), EMAIL_INDEX)
+
+
+def apagar_indice_email(apps, schema_editor):
+    schema_editor.remove_index(_utilizador(apps), EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('compras', '0007_artigo_qtd_unidade'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artigo',
+            index=models.Index(fields=['lista', 'comprar', '-movido_em'], name='artigo_lista_comprar_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='linkpartilha',
+            index=models.Index(fields=['lista', 'expira_em'], name='link_lista_expira_idx'),
+        ),
+        migrations.RunPython(criar_indice_email, apagar_indice_email),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0008_indices_acesso'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='artigo',
+            options={'ordering': ['-movido_em', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='artigo',
+            name='artigo_lista_comprar_idx',
+        ),
+        migrations.AddIndex(
+            model_name='artigo',
+            index=models.Index(fields=['lista', 'comprar', '-movido_em', '-id'], name='artigo_lista_comprar_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:16
+
+import unicodedata
+
+from django.db import migrations, models
+
+LOTE = 1000
+
+
+def normalizar(texto):
+    # Frozen copy of compras.models.normalizar_nome
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())[:500]
+
+
+def preencher_nome_normalizado(apps, schema_editor):
+    Artigo = apps.get_model('compras', 'Artigo')
+    artigos = Artigo.objects.only('pk', 'nome').order_by('pk')
+    pendentes = []
+    for artigo in artigos.iterator(chunk_size=LOTE):
+        artigo.nome_normalizado = normalizar(artigo.nome)
+        pendentes.append(artigo)
+        if len(pendentes) >= LOTE:
+            Artigo.objects.bulk_update(pendentes, ['nome_normalizado'])
+            pendentes = []
+    if pendentes:
+        Artigo.objects.bulk_update(pendentes, ['nome_normalizado'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0009_artigo_ordem_paginas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artigo',
+            name='nome_normalizado',
+            field=models.CharField(default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(preencher_nome_normalizado, migrations.RunPython.noop),
+        # Built after the backfill, so the rows are not re-indexed one by one
+        migrations.AddIndex(
+            model_name='artigo',
+            index=models.Index(fields=['lista', 'nome_normalizado'], name='artigo_lista_nome_idx'),
+        ),
+    ]
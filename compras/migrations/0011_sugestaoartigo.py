@@ -0,0 +1,78 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:19
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+LOTE = 1000
+
+
+def normalizar(texto):
+    # Frozen copy of compras.models.normalizar_nome
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())[:500]
+
+
+def semear_sugestoes(apps, schema_editor):
+    """Start each list's suggestions from the items it has now (who added them is unknown)."""
+    Artigo = apps.get_model('compras', 'Artigo')
+    SugestaoArtigo = apps.get_model('compras', 'SugestaoArtigo')
+    artigos = Artigo.objects.exclude(lista=None).order_by('lista_id', 'movido_em').values_list(
+        'lista_id', 'nome', 'qtd', 'unidade', 'movido_em',
+    )
+    lista_atual, linhas, pendentes = None, {}, []
+    for lista_id, nome, qtd, unidade, movido_em in artigos.iterator(chunk_size=LOTE):
+        if lista_id != lista_atual:
+            pendentes += linhas.values()
+            lista_atual, linhas = lista_id, {}
+            if len(pendentes) >= LOTE:
+                SugestaoArtigo.objects.bulk_create(pendentes)
+                pendentes = []
+        chave = normalizar(nome)
+        if not chave:
+            continue
+        linha = linhas.get(chave)
+        if linha is None:
+            linha = linhas[chave] = SugestaoArtigo(lista_id=lista_id, nome_normalizado=chave)
+        # Oldest first, so the last one seen sets the name and quantity
+        linha.nome, linha.qtd, linha.unidade, linha.usado_em = nome, qtd, unidade, movido_em
+        linha.usos += 1
+    SugestaoArtigo.objects.bulk_create(pendentes + list(linhas.values()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('compras', '0010_artigo_nome_normalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SugestaoArtigo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome_normalizado', models.CharField(max_length=500)),
+                ('nome', models.CharField(max_length=500)),
+                ('qtd', models.DecimalField(decimal_places=3, default=1, max_digits=12)),
+                ('unidade', models.CharField(blank=True, default='x', max_length=50)),
+                ('usos', models.PositiveIntegerField(default=0)),
+                ('usado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lista', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sugestoes', to='compras.lista')),
+                ('utilizador', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sugestoes_artigos', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sugestaoartigo',
+            constraint=models.UniqueConstraint(fields=('lista', 'nome_normalizado'), name='sugestao_lista_nome_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='sugestaoartigo',
+            constraint=models.UniqueConstraint(fields=('utilizador', 'nome_normalizado'), name='sugestao_utilizador_nome_uniq'),
+        ),
+        migrations.RunPython(semear_sugestoes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0011_sugestaoartigo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='linkpartilha',
+            index=models.Index(fields=['expira_em'], name='link_expira_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0012_linkpartilha_expira_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assunto', models.CharField(max_length=255)),
+                ('corpo', models.TextField()),
+                ('remetente', models.CharField(max_length=254)),
+                ('destinatario', models.EmailField(max_length=254)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now, null=True)),
+                ('erro', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['proxima_tentativa'], name='email_proxima_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0013_emailpendente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperacaoAplicada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64)),
+                ('resultado', models.JSONField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('lista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='operacoes_aplicadas', to='compras.lista')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['criado_em'], name='operacao_criado_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='operacaoaplicada',
+            constraint=models.UniqueConstraint(fields=('lista', 'chave'), name='operacao_lista_chave_uniq'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0014_operacaoaplicada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lista',
+            name='revisao_purgada',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='artigoapagado',
+            index=models.Index(fields=['apagado_em'], name='apagado_em_idx'),
+        ),
+    ]
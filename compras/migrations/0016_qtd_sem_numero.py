@@ -0,0 +1,24 @@
+# Generated by Django 4.2.28 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0015_tombstones_retencao'),
+    ]
+
+    operations = [
+        # 0007 now adds the column as nullable; this alters it where 0007 ran before
+        migrations.AlterField(
+            model_name='artigo',
+            name='qtd',
+            field=models.DecimalField(decimal_places=3, default=1, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sugestaoartigo',
+            name='qtd',
+            field=models.DecimalField(decimal_places=3, default=1, max_digits=12, null=True),
+        ),
+    ]
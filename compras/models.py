@@ -1,9 +1,90 @@
+import re
+import unicodedata
 import uuid
+from decimal import Decimal, InvalidOperation
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
 
 
+QUANTIDADE_RE = re.compile(r'^\s*(\d{1,9}(?:[.,]\d+)?)(.*?)\s*$')
+
+
+def separar_quantidade(texto):
+    """
+    Split free text like '2x', '500g' or '1,5 L' into (number, unit suffix).
+    Text with no leading number, like 'meia dúzia', is kept whole as
+    (None, text); empty text is (1, '').
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return Decimal(1), ''
+    match = QUANTIDADE_RE.match(texto)
+    if not match:
+        return None, texto[:50]
+    numero, unidade = match.groups()
+    try:
+        qtd = Decimal(numero.replace(',', '.')).quantize(Decimal('0.001'))
+    except InvalidOperation:
+        return None, texto[:50]
+    return qtd, unidade[:50]
+
+
+def formatar_quantidade(qtd, unidade):
+    """Inverse of separar_quantidade: Decimal('2.000'), 'x' → '2x'; None, 'meia dúzia' → 'meia dúzia'."""
+    if qtd is None:
+        return unidade
+    return f"{Decimal(qtd).normalize():f}{unidade}"
+
+
+_NUMERO = r'\d{1,9}(?:[.,]\d+)?'
+_UNIDADE = r'(?:x|kg|g|mg|l|ml|cl|dl|un|und|unid)\.?'
+# Pasted lines: "2x leite", "500 g farinha", "leite 1L", with an optional bullet
+MARCADOR_RE = re.compile(r'^(?:[-*•·–]|\[[ xX]?\])\s*')
+QTD_INICIO_RE = re.compile(rf'^(?P<qtd>{_NUMERO}(?:\s*{_UNIDADE})?)\s+(?P<nome>.+)$', re.IGNORECASE)
+QTD_FIM_RE = re.compile(rf'^(?P<nome>.+?)\s+(?P<qtd>{_NUMERO}(?:\s*{_UNIDADE})?)$', re.IGNORECASE)
+
+
+def separar_linha(linha):
+    """
+    Split one pasted line into (name, quantity text): '2x leite' → ('leite', '2x'),
+    'farinha 500 g' → ('farinha', '500 g'), '- pão' → ('pão', '1').
+    """
+    texto = MARCADOR_RE.sub('', linha.strip())
+    match = QTD_INICIO_RE.match(texto) or QTD_FIM_RE.match(texto)
+    if match:
+        return match['nome'].strip(), match['qtd']
+    return texto, '1'
+
+
+def ler_linhas(texto):
+    """
+    Parse a pasted block, one item per line, into [(nome, qtd, unidade)] in
+    the order pasted. Lines naming the same item (ignoring case and accents)
+    are collapsed into the first one, adding up their quantities when the
+    units agree.
+    """
+    artigos = {}
+    for linha in texto.splitlines():
+        nome, quantidade = separar_linha(linha)
+        chave = normalizar_nome(nome)
+        if not chave:
+            continue
+        qtd, unidade = separar_quantidade(quantidade)
+        if chave not in artigos:
+            artigos[chave] = [nome[:500], qtd, unidade]
+        elif artigos[chave][2].strip().lower() == unidade.strip().lower():
+            artigos[chave][1] += qtd
+    return [tuple(artigo) for artigo in artigos.values()]
+
+
+def normalizar_nome(texto):
+    """Case- and accent-folded item name for indexed search: ' Pão  de Forma' → 'pao de forma'."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())[:500]
+
+
 class Lista(models.Model):
     nome = models.CharField(max_length=200)
     dono = models.ForeignKey(
@@ -12,6 +93,11 @@ class Lista(models.Model):
         related_name='listas_proprias',
     )
     criado_em = models.DateTimeField(auto_now_add=True)
+    # Bumped on every change to the list or its items (see views._tocar_lista)
+    revisao = models.PositiveBigIntegerField(default=0)
+    # Newest revision whose tombstones were purged: a delta sync from before it
+    # would miss deletions (see limpar_expirados)
+    revisao_purgada = models.PositiveBigIntegerField(default=0)
 
     class Meta:
         ordering = ['nome']
@@ -44,6 +130,20 @@ class ListaPartilha(models.Model):
         return f"{self.lista.nome} → {self.utilizador.username}"
 
 
+class RevisaoUtilizador(models.Model):
+    """Per-user revision of the set of lists (created, renamed, shared, deleted)."""
+    utilizador = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='revisao_listas',
+    )
+    revisao = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.utilizador_id}: {self.revisao}"
+
+
 class LinkPartilha(models.Model):
     lista = models.ForeignKey(
         Lista,
@@ -60,6 +160,12 @@ class LinkPartilha(models.Model):
 
     class Meta:
         ordering = ['-criado_em']
+        indexes = [
+            # Active links of a list (listar_links_partilha)
+            models.Index(fields=['lista', 'expira_em'], name='link_lista_expira_idx'),
+            # Expired links of every list (limpar_expirados)
+            models.Index(fields=['expira_em'], name='link_expira_idx'),
+        ]
 
     def __str__(self):
         return f"Link: {self.lista.nome} ({self.token})"
@@ -69,6 +175,24 @@ class LinkPartilha(models.Model):
         return timezone.now() < self.expira_em
 
 
+class ArtigoQuerySet(models.QuerySet):
+    """Keeps nome_normalizado in step with nome on bulk writes, like Artigo.save()."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for artigo in objs:
+            artigo.nome_normalizado = normalizar_nome(artigo.nome)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'nome' in fields:
+            objs = list(objs)
+            for artigo in objs:
+                artigo.nome_normalizado = normalizar_nome(artigo.nome)
+            fields = [*fields, 'nome_normalizado']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Artigo(models.Model):
     lista = models.ForeignKey(
         Lista,
@@ -78,13 +202,164 @@ class Artigo(models.Model):
         blank=True,
     )
     nome = models.CharField(max_length=500)
-    quantidade = models.CharField(max_length=50, default='1x')
+    # Search key derived from nome (normalizar_nome), kept current by save() and
+    # by the bulk methods of ArtigoQuerySet
+    nome_normalizado = models.CharField(max_length=500, default='', editable=False)
+    # Numeric part of the quantity, so increments are a single UPDATE and totals
+    # can be summed in SQL; the free-text suffix ("x", "g", " units") is kept apart.
+    # NULL when the quantity has no number ("meia dúzia"): unidade holds all of it
+    qtd = models.DecimalField(max_digits=12, decimal_places=3, default=1, null=True)
+    unidade = models.CharField(max_length=50, blank=True, default='x')
     comprar = models.BooleanField(default=False)
     criado_em = models.DateTimeField(auto_now_add=True)
     movido_em = models.DateTimeField(auto_now=True)
+    # Revision of the list when this item was last written (see views._guardar_artigo)
+    revisao = models.PositiveBigIntegerField(default=0)
 
     class Meta:
-        ordering = ['-movido_em']
+        # id breaks ties between items moved in the same instant, so the order
+        # is total and pages can be fetched by keyset (see views._pagina_artigos)
+        ordering = ['-movido_em', '-id']
+        indexes = [
+            models.Index(fields=['lista', 'revisao'], name='artigo_lista_revisao_idx'),
+            # Pantry / to-buy sections of the index page, already in display order
+            models.Index(fields=['lista', 'comprar', '-movido_em', '-id'], name='artigo_lista_comprar_idx'),
+            # Search across the user's lists (views.procurar): prefix lookups seek,
+            # substring ones scan only the index entries of those lists
+            models.Index(fields=['lista', 'nome_normalizado'], name='artigo_lista_nome_idx'),
+        ]
+
+    objects = ArtigoQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.quantidade} {self.nome}"
+
+    def save(self, *args, **kwargs):
+        self.nome_normalizado = normalizar_nome(self.nome)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nome' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'nome_normalizado'}
+        super().save(*args, **kwargs)
+
+    @property
+    def quantidade(self):
+        """Quantity as typed, e.g. '2x' or '500g'."""
+        return formatar_quantidade(self.qtd, self.unidade)
+
+    @quantidade.setter
+    def quantidade(self, texto):
+        self.qtd, self.unidade = separar_quantidade(texto)
+
+
+class ArtigoApagado(models.Model):
+    """Tombstone of a deleted item, so clients can sync deletions by revision."""
+    lista = models.ForeignKey(
+        Lista,
+        on_delete=models.CASCADE,
+        related_name='artigos_apagados',
+    )
+    artigo_id = models.BigIntegerField()
+    revisao = models.PositiveBigIntegerField()
+    apagado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lista', 'revisao'], name='apagado_lista_revisao_idx'),
+            # Tombstones past their retention (limpar_expirados)
+            models.Index(fields=['apagado_em'], name='apagado_em_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.lista_id}/{self.artigo_id} @ {self.revisao}"
+
+
+class SugestaoArtigo(models.Model):
+    """
+    How often an item name was added or edited, with the name and quantity
+    last used; one row per normalized name and list, or per name and user
+    (see compras/sugestoes.py). Exactly one of lista and utilizador is set.
+    """
+    lista = models.ForeignKey(
+        Lista,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='sugestoes',
+    )
+    utilizador = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='sugestoes_artigos',
+    )
+    nome_normalizado = models.CharField(max_length=500)
+    nome = models.CharField(max_length=500)
+    qtd = models.DecimalField(max_digits=12, decimal_places=3, default=1, null=True)
+    unidade = models.CharField(max_length=50, blank=True, default='x')
+    usos = models.PositiveIntegerField(default=0)
+    usado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Also the indexes of the prefix lookups; NULLs never collide, so list
+        # rows and user rows don't constrain each other
+        constraints = [
+            models.UniqueConstraint(fields=['lista', 'nome_normalizado'], name='sugestao_lista_nome_uniq'),
+            models.UniqueConstraint(fields=['utilizador', 'nome_normalizado'], name='sugestao_utilizador_nome_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} ({self.usos})"
+
+
+class EmailPendente(models.Model):
+    """
+    Outbox of emails written by the views and sent by ``manage.py
+    enviar_emails`` (compras/correio.py). Rows are deleted once sent;
+    proxima_tentativa is when a failed one is retried, or NULL once it has
+    failed EMAILS_TENTATIVAS times.
+    """
+    assunto = models.CharField(max_length=255)
+    corpo = models.TextField()
+    remetente = models.CharField(max_length=254)
+    destinatario = models.EmailField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(null=True, default=timezone.now)
+    erro = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Due emails, oldest first (correio.enviar_pendentes)
+            models.Index(fields=['proxima_tentativa'], name='email_proxima_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.destinatario}: {self.assunto}"
+
+
+class OperacaoAplicada(models.Model):
+    """
+    An item operation sent with a client-generated id (the offline queue of
+    the service worker), and the result it got. A queue replayed after a lost
+    answer gets the stored results back instead of applying its operations
+    twice. Rows older than OPERACOES_RETENCAO_DIAS are deleted by
+    ``manage.py limpar_expirados``.
+    """
+    lista = models.ForeignKey(
+        Lista,
+        on_delete=models.CASCADE,
+        related_name='operacoes_aplicadas',
+    )
+    chave = models.CharField(max_length=64)
+    resultado = models.JSONField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lista', 'chave'], name='operacao_lista_chave_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['criado_em'], name='operacao_criado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.lista_id}/{self.chave}"
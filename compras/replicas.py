@@ -0,0 +1,131 @@
+"""
+Read replica routing (settings.DATABASES['replica'], optional).
+
+ReplicaMiddleware marks the GET/HEAD requests of the views in REPLICA_VISTAS
+(polling and public link pages: read-only, and fine with data a moment
+old), and Router sends their reads to the replica. Everything else, every
+write, and threads outside a request (the event poller) use the primary.
+
+A replica lags behind the primary, so after a user or a share link writes
+(any non-GET request), it reads from the primary for REPLICA_FIXAR seconds,
+through a key in the shared cache: nobody sees their own change disappear
+on the next poll. Lookups whose result is cached for longer than that lag
+(access records, signed links) run inside primario(), so a stale replica
+row is never kept around.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+
+from . import fragmentos
+
+REPLICA = 'replica'
+
+_na_replica = contextvars.ContextVar('compras_na_replica', default=False)
+
+
+def _chave_fixacao(request, kwargs):
+    """Pin key of the link being used (link routes), or of the logged-in user."""
+    token = kwargs.get('token')
+    if token is not None:
+        return 'compras:primario:link:' + fragmentos.chave_token(token)
+    if request.user.is_authenticated:
+        return f'compras:primario:u:{request.user.pk}'
+    return None
+
+
+@contextmanager
+def primario():
+    """Read from the primary inside the block, even in a request routed to the replica."""
+    token = _na_replica.set(False)
+    try:
+        yield
+    finally:
+        _na_replica.reset(token)
+
+
+class Router:
+    """Reads of requests marked by ReplicaMiddleware go to the replica; the rest to default."""
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if _na_replica.get() else None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from replication
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    """Route safe reads of REPLICA_VISTAS to the replica, unless the caller just wrote."""
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ativa = REPLICA in settings.DATABASES
+        self.vistas = set(getattr(settings, 'REPLICA_VISTAS', ()))
+        self.fixar = getattr(settings, 'REPLICA_FIXAR', 10)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _rota(self, request):
+        if not self.ativa:
+            return None
+        try:
+            return resolve(request.path_info)
+        except Resolver404:
+            return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        match = self._rota(request)
+        if match is None:
+            return self.get_response(request)
+        if request.method not in ('GET', 'HEAD'):
+            response = self.get_response(request)
+            # After the view, so a login or registration pins the new user
+            chave = _chave_fixacao(request, match.kwargs)
+            if chave is not None:
+                cache.set(chave, True, self.fixar)
+            return response
+        if match.url_name not in self.vistas:
+            return self.get_response(request)
+        chave = _chave_fixacao(request, match.kwargs)
+        token = _na_replica.set(chave is None or not cache.get(chave))
+        try:
+            return self.get_response(request)
+        finally:
+            _na_replica.reset(token)
+
+    async def __acall__(self, request):
+        match = self._rota(request)
+        if match is None:
+            return await self.get_response(request)
+        # request.user is lazy: loading it queries the database
+        fixacao = sync_to_async(_chave_fixacao)
+        if request.method not in ('GET', 'HEAD'):
+            response = await self.get_response(request)
+            chave = await fixacao(request, match.kwargs)
+            if chave is not None:
+                await cache.aset(chave, True, self.fixar)
+            return response
+        if match.url_name not in self.vistas:
+            return await self.get_response(request)
+        chave = await fixacao(request, match.kwargs)
+        token = _na_replica.set(chave is None or not await cache.aget(chave))
+        try:
+            return await self.get_response(request)
+        finally:
+            _na_replica.reset(token)
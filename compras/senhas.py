@@ -0,0 +1,127 @@
+"""
+Password hashing and login throttling for the auth views.
+
+Under ASGI every request runs in its own thread, so a burst of logins would
+run as many PBKDF2 computations at once as there are requests and starve list
+polling of CPU. Hashes run instead in a small per-process pool of
+SENHAS_CONCORRENCIA threads; at most SENHAS_FILA more may wait for it and any
+other is refused straight away with Sobrecarga.
+
+Attempts are also counted in the shared cache (TENTATIVAS_*), every attempt per
+client IP and failed logins per username, so floods are rejected before any
+hash is computed.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+_lock = threading.Lock()
+_executor = None
+_vagas = None
+
+
+class Sobrecarga(PermissionDenied):
+    """
+    Too many hashes in progress. A PermissionDenied, so that
+    django.contrib.auth.authenticate() (admin login) stops and fails cleanly.
+    """
+
+
+def _pool():
+    global _executor, _vagas
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                concorrencia = getattr(settings, 'SENHAS_CONCORRENCIA', 2)
+                _vagas = threading.BoundedSemaphore(concorrencia + getattr(settings, 'SENHAS_FILA', 8))
+                _executor = ThreadPoolExecutor(concorrencia, thread_name_prefix='compras-senhas')
+    return _executor, _vagas
+
+
+def _executar(funcao, *args):
+    executor, vagas = _pool()
+    if not vagas.acquire(blocking=False):
+        raise Sobrecarga
+    try:
+        return executor.submit(funcao, *args).result()
+    finally:
+        vagas.release()
+
+
+def cifrar(segredo):
+    """make_password() in the bounded pool."""
+    return _executar(hashers.make_password, segredo)
+
+
+def verificar(user, segredo):
+    """
+    Check segredo against the user's stored hash in the bounded pool. Like
+    User.check_password, re-hash and save when the hasher settings changed.
+    """
+    if not _executar(hashers.check_password, segredo, user.password):
+        return False
+    if hashers.identify_hasher(user.password).must_update(user.password):
+        user.password = cifrar(segredo)
+        user.save(update_fields=['password'])
+    return True
+
+
+# ── Throttling ───────────────────────────────────────────────────
+
+def ip_cliente(request):
+    """Client IP as seen by Caddy, the only proxy in front of the app."""
+    encaminhado = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if encaminhado:
+        return encaminhado.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _contar(chave):
+    """Count one attempt under chave in the current window; return the total."""
+    janela = getattr(settings, 'TENTATIVAS_JANELA', 300)
+    cache.add(chave, 0, janela)
+    try:
+        return cache.incr(chave)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(chave, 1, janela)
+        return 1
+
+
+def _chave_utilizador(username):
+    # Hashed: usernames typed into the form may not be valid memcached keys
+    return 'compras:tentativas:u:' + hashlib.sha256(username.lower().encode()).hexdigest()[:32]
+
+
+def bloqueado(request, username=None):
+    """
+    Count one attempt for the client IP and return True when it is over its
+    limit for the current window, or when username already failed too many
+    times in it (see falhou()).
+    """
+    excedido = _contar(f'compras:tentativas:ip:{ip_cliente(request)}') > getattr(
+        settings, 'TENTATIVAS_MAX_IP', 50,
+    )
+    if username:
+        excedido |= cache.get(_chave_utilizador(username), 0) >= getattr(
+            settings, 'TENTATIVAS_MAX_UTILIZADOR', 10,
+        )
+    return excedido
+
+
+def falhou(username):
+    """
+    Count a failed login for username. Successful ones don't count, so
+    signing in from several devices never locks the owner out.
+    """
+    _contar(_chave_utilizador(username))
+
+
+def esquecer_tentativas(username):
+    """Reset the username counter after a successful login."""
+    cache.delete(_chave_utilizador(username))
@@ -0,0 +1,43 @@
+"""
+Session engine (settings.SESSION_ENGINE = 'compras.sessoes').
+
+Django's cached_db engine (reads from the cache, writes through to the
+database) plus two changes:
+
+- save() is skipped when the session data is the same as when it was loaded,
+  so re-assigning an unchanged value (e.g. ``lista_ativa``) costs no UPDATE;
+- clear_expired() deletes in batches, so ``manage.py clearsessions`` can run
+  against a large backlog without locking the table (``limpar_expirados``
+  does the same on a schedule).
+"""
+import copy
+
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.utils import timezone
+
+from .limpeza import apagar_em_lotes
+
+
+class SessionStore(CachedDBStore):
+
+    _carregados = None
+
+    def load(self):
+        dados = super().load()
+        self._carregados = copy.deepcopy(dados)
+        return dados
+
+    def save(self, must_create=False):
+        if (
+            not must_create
+            and self.session_key is not None
+            and self._carregados is not None
+            and self._get_session() == self._carregados
+        ):
+            return
+        super().save(must_create=must_create)
+        self._carregados = copy.deepcopy(self._get_session())
+
+    @classmethod
+    def clear_expired(cls):
+        apagar_em_lotes(cls.get_model_class().objects.filter(expire_date__lt=timezone.now()))
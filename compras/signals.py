@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import acessos, tokens
+from .models import LinkPartilha, Lista, ListaPartilha
+
+
+def _depois_do_commit(using, funcao, *args):
+    """
+    Run funcao(*args) once the write's transaction commits (at once in
+    autocommit). Dropping a cache entry earlier lets a concurrent request,
+    which can't see the uncommitted rows yet, cache the old state again.
+    """
+    transaction.on_commit(lambda: funcao(*args), using=using)
+
+
+@receiver(post_save, sender=ListaPartilha)
+@receiver(post_delete, sender=ListaPartilha)
+def invalidar_partilha(sender, instance, using, **kwargs):
+    _depois_do_commit(using, acessos.invalidar, instance.utilizador_id)
+
+
+@receiver(post_save, sender=Lista)
+def invalidar_lista_criada(sender, instance, created, using, **kwargs):
+    if created:
+        _depois_do_commit(using, acessos.invalidar, instance.dono_id)
+
+
+@receiver(post_delete, sender=Lista)
+def invalidar_lista_apagada(sender, instance, using, **kwargs):
+    # Shares are deleted by cascade and invalidate their users on their own
+    _depois_do_commit(using, acessos.invalidar, instance.dono_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidar_utilizador(sender, instance, using, **kwargs):
+    _depois_do_commit(using, acessos.invalidar, instance.pk)
+
+
+@receiver(post_save, sender=LinkPartilha)
+@receiver(post_delete, sender=LinkPartilha)
+def invalidar_link(sender, instance, using, **kwargs):
+    # Revocation (apagar_link_partilha, admin, cascade) must reach signed tokens
+    _depois_do_commit(using, cache.delete, tokens.chave_cache(instance.pk))
@@ -0,0 +1,783 @@
+/* Page script of index.html; the active list id comes from <body data-lista> */
+var LISTA_ID = document.body.dataset.lista;
+
+/* Save scroll position before any form submit (also for items patched in later) */
+document.addEventListener('submit', function() {
+    sessionStorage.setItem('scrollY', window.scrollY);
+});
+
+/* Restore scroll position on page load */
+var savedScroll = sessionStorage.getItem('scrollY');
+if (savedScroll !== null) {
+    window.scrollTo(0, parseInt(savedScroll));
+    sessionStorage.removeItem('scrollY');
+}
+
+/* User menu */
+function toggleUserMenu() {
+    document.getElementById('userDropdown').classList.toggle('open');
+}
+
+/* Contact popup */
+function openContactPopup() {
+    document.getElementById('contactOverlay').classList.add('active');
+}
+function closeContactPopup() {
+    document.getElementById('contactOverlay').classList.remove('active');
+}
+function copyContactEmail() {
+    var email = document.getElementById('contactEmail').textContent;
+    var btn = document.querySelector('.contact-copy-btn');
+    if (navigator.clipboard) {
+        navigator.clipboard.writeText(email).then(function() {
+            btn.textContent = 'Copiado!';
+            setTimeout(function() { btn.textContent = 'Copiar'; }, 2000);
+        });
+    } else {
+        var range = document.createRange();
+        range.selectNodeContents(document.getElementById('contactEmail'));
+        var sel = window.getSelection();
+        sel.removeAllRanges();
+        sel.addRange(range);
+        document.execCommand('copy');
+        btn.textContent = 'Copiado!';
+        setTimeout(function() { btn.textContent = 'Copiar'; }, 2000);
+    }
+}
+
+/* List menu (three dots in tab bar) */
+function toggleListMenu(e) {
+    if (e) e.stopPropagation();
+    var dd = document.getElementById('listMenuDropdown');
+    if (!dd) return;
+    var wasOpen = dd.classList.contains('open');
+    closeAllMenus();
+    if (!wasOpen) dd.classList.add('open');
+}
+
+function closeListMenu() {
+    var dd = document.getElementById('listMenuDropdown');
+    if (dd) dd.classList.remove('open');
+}
+
+/* Three-dots menu (items) */
+function toggleMenu(btn) {
+    var dropdown = btn.nextElementSibling;
+    var wasOpen = dropdown.classList.contains('open');
+    closeAllMenus();
+    if (!wasOpen) {
+        dropdown.classList.add('open');
+    }
+}
+
+/* Hamburger menu */
+function toggleHamburger(e) {
+    if (e) e.stopPropagation();
+    var panel = document.getElementById('hamburgerPanel');
+    if (!panel) return;
+    var wasOpen = panel.classList.contains('open');
+    closeAllMenus();
+    if (!wasOpen) panel.classList.add('open');
+}
+
+function closeHamburger() {
+    var panel = document.getElementById('hamburgerPanel');
+    if (panel) panel.classList.remove('open');
+}
+
+function closeAllMenus() {
+    document.querySelectorAll('.menu-dropdown.open').forEach(function(m) {
+        m.classList.remove('open');
+    });
+    document.getElementById('userDropdown').classList.remove('open');
+    closeListMenu();
+    closeHamburger();
+}
+
+document.addEventListener('click', function(e) {
+    if (!e.target.closest('.menu-wrapper') && !e.target.closest('.user-menu-wrapper') && !e.target.closest('.list-menu-wrapper') && !e.target.closest('.hamburger-wrapper')) {
+        closeAllMenus();
+    }
+});
+
+var editPk = null;
+var deletePk = null;
+function openEdit(pk, nome, qtd) {
+    closeAllMenus();
+    editPk = pk;
+    document.getElementById('editForm').action = '/editar/' + pk + '/';
+    document.getElementById('editNome').value = nome;
+    document.getElementById('editModal').classList.add('active');
+    document.getElementById('editNome').focus();
+}
+
+function closeEdit() {
+    document.getElementById('editModal').classList.remove('active');
+}
+
+function openDelete(pk, nome) {
+    closeAllMenus();
+    deletePk = pk;
+    document.getElementById('deleteForm').action = '/apagar/' + pk + '/';
+    document.getElementById('deleteName').textContent = nome;
+    document.getElementById('deleteModal').classList.add('active');
+}
+
+function closeDelete() {
+    document.getElementById('deleteModal').classList.remove('active');
+}
+
+function openNewList() {
+    document.getElementById('newListModal').classList.add('active');
+}
+
+function closeNewList() {
+    document.getElementById('newListModal').classList.remove('active');
+}
+
+function openRenameList() {
+    var el = document.getElementById('renameListModal');
+    if (el) {
+        el.classList.add('active');
+        var inp = document.getElementById('renameListInput');
+        inp.focus();
+        inp.select();
+    }
+}
+
+function closeRenameList() {
+    var el = document.getElementById('renameListModal');
+    if (el) el.classList.remove('active');
+}
+
+function clonarLista() {
+    var form = document.createElement('form');
+    form.method = 'POST';
+    form.action = LISTA_ID ? '/lista/' + LISTA_ID + '/clonar/' : '';
+    var csrf = document.createElement('input');
+    csrf.type = 'hidden';
+    csrf.name = 'csrfmiddlewaretoken';
+    csrf.value = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    form.appendChild(csrf);
+    document.body.appendChild(form);
+    form.submit();
+}
+
+function openDeleteList() {
+    document.getElementById('deleteListModal').classList.add('active');
+}
+
+function closeDeleteList() {
+    document.getElementById('deleteListModal').classList.remove('active');
+}
+
+/* Share modal */
+function openShareModal() {
+    var el = document.getElementById('shareModal');
+    if (el) {
+        var fb = document.getElementById('shareFeedback');
+        fb.className = 'share-feedback';
+        fb.style.display = 'none';
+        document.getElementById('shareUsername').value = '';
+        el.classList.add('active');
+        document.getElementById('shareUsername').focus();
+    }
+}
+
+function closeShareModal() {
+    var el = document.getElementById('shareModal');
+    if (el) el.classList.remove('active');
+}
+
+function submitShare(e) {
+    e.preventDefault();
+    var form = document.getElementById('shareForm');
+    var fb = document.getElementById('shareFeedback');
+    var username = document.getElementById('shareUsername').value.trim();
+    if (!username) return false;
+    var csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    var url = LISTA_ID ? '/lista/' + LISTA_ID + '/partilhar/' : '/';
+    fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'X-Requested-With': 'XMLHttpRequest',
+            'X-CSRFToken': csrfToken
+        },
+        body: 'username=' + encodeURIComponent(username)
+    })
+    .then(function(r) { return r.json(); })
+    .then(function(data) {
+        fb.textContent = data.msg;
+        fb.className = 'share-feedback ' + (data.ok ? 'ok' : 'fail');
+        fb.style.display = 'block';
+        if (data.ok) {
+            document.getElementById('shareUsername').value = '';
+            setTimeout(function() { location.reload(); }, 1500);
+        }
+    })
+    .catch(function() {
+        fb.textContent = 'Erro de ligação.';
+        fb.className = 'share-feedback fail';
+        fb.style.display = 'block';
+    });
+    return false;
+}
+
+/* Import modal */
+function openImportModal() {
+    document.getElementById('importModal').classList.add('active');
+}
+
+function closeImportModal() {
+    document.getElementById('importModal').classList.remove('active');
+}
+
+function submitImport(e) {
+    e.preventDefault();
+    var form = document.getElementById('importForm');
+    var fb = document.getElementById('importFeedback');
+    var botao = document.getElementById('importSubmit');
+    var csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    botao.disabled = true;
+    fb.textContent = 'A importar…';
+    fb.className = 'share-feedback ok';
+    fetch('/importar/', {
+        method: 'POST',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest',
+            'X-CSRFToken': csrfToken
+        },
+        body: new FormData(form)
+    })
+    .then(function(r) { return r.json(); })
+    .then(function(data) {
+        fb.textContent = data.msg;
+        fb.className = 'share-feedback ' + (data.ok ? 'ok' : 'fail');
+        botao.disabled = false;
+        if (data.ok) {
+            setTimeout(function() { location.reload(); }, 1500);
+        }
+    })
+    .catch(function() {
+        fb.textContent = 'Erro de ligação.';
+        fb.className = 'share-feedback fail';
+        botao.disabled = false;
+    });
+    return false;
+}
+
+/* Link share modal — wire up permission toggles */
+document.querySelectorAll('#permGrid .perm-toggle input[type=checkbox]').forEach(function(cb) {
+    cb.addEventListener('change', function() {
+        if (this.checked) {
+            this.parentElement.classList.add('checked');
+        } else {
+            this.parentElement.classList.remove('checked');
+        }
+    });
+});
+
+function openLinkModal() {
+    var el = document.getElementById('linkModal');
+    if (!el) return;
+    document.getElementById('linkResult').style.display = 'none';
+    el.classList.add('active');
+    carregarLinks();
+}
+
+function closeLinkModal() {
+    var el = document.getElementById('linkModal');
+    if (el) el.classList.remove('active');
+}
+
+function criarLink() {
+    var duracao = document.getElementById('linkDuracao').value;
+    var unidade = document.getElementById('linkUnidade').value;
+    var params = 'duracao=' + encodeURIComponent(duracao) + '&unidade=' + encodeURIComponent(unidade);
+    if (document.getElementById('permAdicionar').checked) params += '&pode_adicionar=1';
+    if (document.getElementById('permEditar').checked) params += '&pode_editar=1';
+    if (document.getElementById('permApagar').checked) params += '&pode_apagar=1';
+    if (document.getElementById('permToggle').checked) params += '&pode_toggle=1';
+    var csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    var url = LISTA_ID ? '/lista/' + LISTA_ID + '/link/criar/' : '/';
+    fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'X-Requested-With': 'XMLHttpRequest',
+            'X-CSRFToken': csrfToken
+        },
+        body: params
+    })
+    .then(function(r) { return r.json(); })
+    .then(function(data) {
+        if (data.ok) {
+            document.getElementById('linkUrl').value = data.url;
+            document.getElementById('linkResult').style.display = 'block';
+            carregarLinks();
+        }
+    })
+    .catch(function() {});
+}
+
+function copiarLink() {
+    var inp = document.getElementById('linkUrl');
+    inp.select();
+    inp.setSelectionRange(0, 99999);
+    navigator.clipboard.writeText(inp.value).then(function() {
+        var btn = document.querySelector('.btn-copy');
+        btn.textContent = 'Copiado!';
+        setTimeout(function() { btn.textContent = 'Copiar'; }, 2000);
+    }).catch(function() {
+        document.execCommand('copy');
+    });
+}
+
+function carregarLinks() {
+    var url = LISTA_ID ? '/lista/' + LISTA_ID + '/links/' : null;
+    if (!url) return;
+    fetch(url)
+    .then(function(r) { return r.json(); })
+    .then(function(data) {
+        var container = document.getElementById('existingLinks');
+        if (!data.links || data.links.length === 0) {
+            container.innerHTML = '';
+            return;
+        }
+        var html = '<label style="display:block;color:#aaa;font-size:0.9rem;margin-bottom:6px;">Links ativos</label>';
+        data.links.forEach(function(lnk) {
+            var perms = [];
+            if (lnk.pode_adicionar) perms.push('Adicionar');
+            if (lnk.pode_editar) perms.push('Editar');
+            if (lnk.pode_apagar) perms.push('Apagar');
+            if (lnk.pode_toggle) perms.push('Mover');
+            html += '<div class="existing-link-row">';
+            html += '<div class="existing-link-info">';
+            html += '<a href="' + lnk.url + '" target="_blank">' + lnk.url.replace(/^https?:\/\//, '') + '</a>';
+            html += '<span class="link-expiry">Expira: ' + lnk.expira_em + ' · ' + (perms.length ? perms.join(', ') : 'Só ver') + '</span>';
+            html += '</div>';
+            html += '<button type="button" class="link-delete-btn" onclick="apagarLink(' + lnk.id + ')">Apagar</button>';
+            html += '</div>';
+        });
+        container.innerHTML = html;
+    })
+    .catch(function() {});
+}
+
+function apagarLink(linkId) {
+    var csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    var url = LISTA_ID ? '/lista/' + LISTA_ID + '/link/' + linkId + '/apagar/' : '/';
+    fetch(url, {
+        method: 'POST',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest',
+            'X-CSRFToken': csrfToken
+        }
+    })
+    .then(function(r) { return r.json(); })
+    .then(function(data) {
+        if (data.ok) carregarLinks();
+    })
+    .catch(function() {});
+}
+
+document.querySelectorAll('.modal-overlay').forEach(function(overlay) {
+    overlay.addEventListener('click', function(e) {
+        if (e.target === this) {
+            this.classList.remove('active');
+        }
+    });
+});
+
+/* ── Search mode ── */
+var searchMode = false;
+
+function toggleSearchMode() {
+    searchMode = !searchMode;
+    var input = document.getElementById('addInput');
+    var addBtn = document.getElementById('addBtn');
+    var toggle = document.getElementById('searchToggle');
+    var form = document.getElementById('addForm');
+    if (searchMode) {
+        toggle.classList.add('active');
+        addBtn.style.display = 'none';
+        input.placeholder = 'Pesquisar artigo...';
+        input.removeAttribute('required');
+        input.removeAttribute('list');
+        input.value = '';
+        input.addEventListener('input', filterItems);
+        input.addEventListener('input', pesquisar);
+        form.addEventListener('submit', preventSubmitInSearch);
+        input.focus();
+    } else {
+        toggle.classList.remove('active');
+        addBtn.style.display = '';
+        input.placeholder = 'Novo artigo...';
+        input.setAttribute('required', '');
+        input.setAttribute('list', 'sugestoesNomes');
+        input.value = '';
+        input.removeEventListener('input', filterItems);
+        input.removeEventListener('input', pesquisar);
+        form.removeEventListener('submit', preventSubmitInSearch);
+        clearFilter();
+        mostrarResultados(null);
+    }
+}
+
+function preventSubmitInSearch(e) {
+    e.preventDefault();
+}
+
+function filterItems() {
+    var query = document.getElementById('addInput').value.toLowerCase().trim();
+    document.querySelectorAll('.item').forEach(function(item) {
+        var nameBtn = item.querySelector('.item-name');
+        if (!nameBtn) return;
+        var name = nameBtn.textContent.toLowerCase();
+        if (!query || name.indexOf(query) !== -1) {
+            item.classList.remove('search-hidden');
+        } else {
+            item.classList.add('search-hidden');
+        }
+    });
+}
+
+/* Server search over all the user's lists; the items already on the page are
+   filtered in place above, so only the others are listed here */
+var searchTimer = null;
+var searchSeq = 0;
+function pesquisar() {
+    clearTimeout(searchTimer);
+    var seq = ++searchSeq;
+    var q = document.getElementById('addInput').value.trim();
+    if (!q) return mostrarResultados(null);
+    searchTimer = setTimeout(function() {
+        fetch('/procurar/?q=' + encodeURIComponent(q))
+            .then(function(r) { return r.json(); })
+            .then(function(data) { if (seq === searchSeq && searchMode) mostrarResultados(data); })
+            .catch(function() {});
+    }, 250);
+}
+
+function mostrarResultados(data) {
+    var painel = document.getElementById('resultadosPesquisa');
+    painel.textContent = '';
+    var n = 0;
+    (data ? data.listas : []).forEach(function(grupo) {
+        var artigos = grupo.artigos.filter(function(a) {
+            return !document.querySelector('.item[data-id="' + a.id + '"]');
+        });
+        if (artigos.length === 0) return;
+        var bloco = document.createElement('div');
+        bloco.className = 'search-group';
+        var titulo = document.createElement('a');
+        titulo.className = 'search-group-title';
+        titulo.href = '/lista/' + grupo.id + '/selecionar/';
+        titulo.textContent = grupo.nome;
+        bloco.appendChild(titulo);
+        var ul = document.createElement('ul');
+        artigos.forEach(function(a) {
+            var li = document.createElement('li');
+            li.className = 'search-result' + (a.comprar ? '' : ' despensa-item');
+            li.textContent = a.nome + ' ';
+            var qtd = document.createElement('span');
+            qtd.className = 'search-qtd';
+            qtd.textContent = a.quantidade;
+            li.appendChild(qtd);
+            ul.appendChild(li);
+        });
+        bloco.appendChild(ul);
+        painel.appendChild(bloco);
+        n += artigos.length;
+    });
+    if (data && data.mais) {
+        var nota = document.createElement('p');
+        nota.className = 'empty-msg';
+        nota.textContent = 'Há mais resultados; escreva mais letras.';
+        painel.appendChild(nota);
+    }
+    painel.hidden = n === 0;
+}
+
+function clearFilter() {
+    document.querySelectorAll('.item.search-hidden').forEach(function(item) {
+        item.classList.remove('search-hidden');
+    });
+}
+
+/* Name suggestions from the list's history; picking one also sets its last quantity */
+var suggestTimer = null;
+var suggestSeq = 0;
+var suggestQtd = {};
+function sugerirNomes() {
+    var input = document.getElementById('addInput');
+    document.getElementById('addQtd').value = suggestQtd[input.value] || '';
+    clearTimeout(suggestTimer);
+    var seq = ++suggestSeq;
+    var q = input.value.trim();
+    if (!q || searchMode) return;
+    suggestTimer = setTimeout(function() {
+        fetch('/sugestoes/?q=' + encodeURIComponent(q))
+            .then(function(r) { return r.json(); })
+            .then(function(data) {
+                if (seq !== suggestSeq) return;
+                var datalist = document.getElementById('sugestoesNomes');
+                datalist.textContent = '';
+                suggestQtd = {};
+                data.sugestoes.forEach(function(s) {
+                    var opt = document.createElement('option');
+                    opt.value = s.nome;
+                    opt.label = s.quantidade;
+                    datalist.appendChild(opt);
+                    suggestQtd[s.nome] = s.quantidade;
+                });
+            })
+            .catch(function() {});
+    }, 120);
+}
+if (document.getElementById('addInput')) {
+    document.getElementById('addInput').addEventListener('input', sugerirNomes);
+    document.getElementById('addInput').addEventListener('paste', colarLinhas);
+}
+
+/* Pasting several lines (a recipe, a note) adds them all in one request; the
+   new rows then arrive like any other change, through alteracoes */
+function colarLinhas(e) {
+    if (searchMode) return;
+    var texto = (e.clipboardData || window.clipboardData).getData('text');
+    if (texto.trim().indexOf('\n') === -1) return;
+    e.preventDefault();
+    var form = document.getElementById('addForm');
+    var corpo = new URLSearchParams();
+    corpo.append('linhas', texto);
+    fetch(form.action, {
+        method: 'POST',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest',
+            'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value
+        },
+        body: corpo
+    })
+    .then(function(r) { if (!r.ok) throw new Error(r.status); return r.json(); })
+    .then(function(data) {
+        document.getElementById('addInput').value = '';
+        if (data.rev !== null) {
+            if (data.rev > latestRev) latestRev = data.rev;
+            syncDelta();
+        }
+    })
+    .catch(reloadPage);
+}
+
+/* Live updates — pushed by /eventos/, falls back to polling every 3 seconds */
+function reloadPage() {
+    sessionStorage.setItem('scrollY', window.scrollY);
+    location.reload();
+}
+
+function removeItem(id) {
+    var li = document.querySelector('.item[data-id="' + id + '"]');
+    if (li) li.remove();
+}
+
+/* Counts are section totals from the server; only part of a section may be loaded */
+function refreshSection(listId, emptyId, countId) {
+    var ul = document.getElementById(listId);
+    ul.hidden = ul.children.length === 0;
+    document.getElementById(emptyId).hidden = parseInt(document.getElementById(countId).textContent, 10) > 0;
+}
+
+function addToCount(countId, n) {
+    var el = document.getElementById(countId);
+    el.textContent = Math.max(0, parseInt(el.textContent, 10) + n);
+}
+
+/* Patch the item lists with the rows returned by /alteracoes/ */
+function applyDelta(data) {
+    data.apagados.forEach(removeItem);
+    data.artigos.forEach(function(a) {
+        removeItem(a.id);
+        var tpl = document.createElement('template');
+        tpl.innerHTML = a.html.trim();
+        var ul = document.getElementById(a.comprar ? 'listaComprar' : 'listaDespensa');
+        ul.insertBefore(tpl.content.firstChild, ul.firstChild);
+    });
+    document.getElementById('countComprar').textContent = data.totais.comprar;
+    document.getElementById('countDespensa').textContent = data.totais.despensa;
+    refreshSection('listaComprar', 'vazioComprar', 'countComprar');
+    refreshSection('listaDespensa', 'vazioDespensa', 'countDespensa');
+    if (searchMode) filterItems();
+    paginaAlterada = true;
+}
+
+/* Further pages of a section, fetched as its "Mostrar mais" button scrolls into view */
+function carregarMais(btn) {
+    if (btn.disabled) return;
+    btn.disabled = true;
+    fetch('/lista/' + LISTA_ID + '/artigos/' + '?seccao=' + btn.dataset.seccao + '&depois=' + encodeURIComponent(btn.dataset.depois))
+        .then(function(r) { if (!r.ok) throw new Error(r.status); return r.json(); })
+        .then(function(data) {
+            var ul = document.getElementById(btn.dataset.lista);
+            var tpl = document.createElement('template');
+            tpl.innerHTML = data.html;
+            tpl.content.querySelectorAll('.item').forEach(function(li) {
+                // Skip items that a live update already brought in
+                if (!document.querySelector('.item[data-id="' + li.dataset.id + '"]')) ul.appendChild(li);
+            });
+            ul.hidden = ul.children.length === 0;
+            if (searchMode) filterItems();
+            if (data.depois) {
+                btn.dataset.depois = data.depois;
+                btn.disabled = false;
+                if (btn.getBoundingClientRect().top < window.innerHeight) carregarMais(btn);
+            } else {
+                btn.remove();
+            }
+        })
+        .catch(function() { btn.disabled = false; });
+}
+if (window.IntersectionObserver) {
+    var pageObserver = new IntersectionObserver(function(entries) {
+        entries.forEach(function(e) { if (e.isIntersecting) carregarMais(e.target); });
+    }, {rootMargin: '400px'});
+    document.querySelectorAll('.carregar-mais').forEach(function(btn) { pageObserver.observe(btn); });
+}
+
+/* Toggles, edits and deletes change the page at once and are sent in order to
+   /sincronizar/ (through the service worker's queue when offline); toggles
+   made in quick succession go together */
+var pendingOps = [];
+var flushTimer = null;
+function moveItem(li, comprar) {
+    li.classList.toggle('despensa-item', !comprar);
+    li.querySelector('[name=destino]').value = comprar ? 'despensa' : 'comprar';
+    var ul = document.getElementById(comprar ? 'listaComprar' : 'listaDespensa');
+    ul.insertBefore(li, ul.firstChild);
+    addToCount(comprar ? 'countComprar' : 'countDespensa', 1);
+    addToCount(comprar ? 'countDespensa' : 'countComprar', -1);
+    refreshSection('listaComprar', 'vazioComprar', 'countComprar');
+    refreshSection('listaDespensa', 'vazioDespensa', 'countDespensa');
+    if (searchMode) filterItems();
+}
+
+function flushOps() {
+    if (pendingOps.length === 0) return;
+    var ops = pendingOps;
+    pendingOps = [];
+    enviarOperacoes('/sincronizar/', {lista: parseInt(LISTA_ID, 10), operacoes: ops});
+}
+window.addEventListener('pagehide', flushOps);
+
+function queueOp(op, espera) {
+    op.op_id = novoOpId();
+    pendingOps.push(op);
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushOps, espera);
+}
+
+document.addEventListener('submit', function(e) {
+    var form = e.target;
+    if (!form.classList.contains('toggle-form')) return;
+    e.preventDefault();
+    var li = form.closest('.item');
+    var destino = form.querySelector('[name=destino]').value;
+    moveItem(li, destino === 'comprar');
+    queueOp({op: 'toggle', id: parseInt(li.dataset.id, 10), destino: destino}, 400);
+});
+
+if (LISTA_ID) {
+    document.getElementById('editForm').addEventListener('submit', function(e) {
+        e.preventDefault();
+        var op = {op: 'editar', id: editPk, nome: document.getElementById('editNome').value.trim()};
+        if (!op.nome) return;
+        aplicarOperacao(op);
+        queueOp(op, 0);
+        closeEdit();
+    });
+    document.getElementById('deleteForm').addEventListener('submit', function(e) {
+        e.preventDefault();
+        var op = {op: 'apagar', id: deletePk};
+        aplicarOperacao(op);
+        queueOp(op, 0);
+        closeDelete();
+    });
+    /* Adding waits for the server's page unless the service worker can queue it */
+    document.getElementById('addForm').addEventListener('submit', function(e) {
+        if (searchMode || !controlador()) return;
+        e.preventDefault();
+        var op = {
+            op: 'adicionar',
+            nome: document.getElementById('addInput').value.trim(),
+            quantidade: document.getElementById('addQtd').value.trim()
+        };
+        if (!op.nome) return;
+        aplicarOperacao(op);
+        queueOp(op, 0);
+        document.getElementById('addInput').value = '';
+        document.getElementById('addQtd').value = '';
+    });
+    restaurarPendentes('/sincronizar/', parseInt(LISTA_ID, 10));
+}
+
+/* State the page was rendered at (<body data-rev>), so changes made before the
+   first poll or event are fetched too */
+var known = {
+    lista: LISTA_ID ? parseInt(LISTA_ID, 10) : null,
+    rev: document.body.dataset.rev ? parseInt(document.body.dataset.rev, 10) : null,
+    rev_listas: parseInt(document.body.dataset.revListas, 10)
+};
+var latestRev = known.rev;
+var syncing = false;
+function syncDelta() {
+    if (syncing || latestRev === known.rev) return;
+    syncing = true;
+    fetch('/alteracoes/?desde=' + known.rev)
+        .then(function(r) { return r.json(); })
+        .then(function(data) {
+            if (data.recarregar || data.lista !== known.lista) return reloadPage();
+            applyDelta(data);
+            known.rev = data.rev;
+        })
+        .catch(function() {})
+        .then(function() {
+            syncing = false;
+            if (latestRev > known.rev) syncDelta();
+        });
+}
+
+function onUpdate(data) {
+    if (data.lista !== known.lista || data.rev_listas !== known.rev_listas) {
+        reloadPage();
+    } else if (data.rev !== latestRev) {
+        latestRev = data.rev;
+        syncDelta();
+    }
+}
+function pollUpdates() {
+    fetch('/check_updates/')
+        .then(function(r) { return r.json(); })
+        .then(onUpdate)
+        .catch(function() {});
+}
+var pollTimer = null;
+function startPolling() {
+    if (pollTimer === null) {
+        pollTimer = setInterval(pollUpdates, 3000);
+        pollUpdates();
+    }
+}
+function stopPolling() {
+    if (pollTimer !== null) {
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+}
+if (window.EventSource) {
+    var eventSource = new EventSource('/eventos/');
+    eventSource.addEventListener('estado', function(e) { onUpdate(JSON.parse(e.data)); });
+    eventSource.onopen = stopPolling;
+    eventSource.onerror = startPolling;
+} else {
+    startPolling();
+}
@@ -0,0 +1,344 @@
+/* Page script of link.html; the link token comes from <body data-token> */
+var TOKEN = document.body.dataset.token;
+var SINCRONIZAR_URL = '/link/' + TOKEN + '/sincronizar/';
+
+/* Save scroll position before any form submit (also for items patched in later) */
+document.addEventListener('submit', function() {
+    sessionStorage.setItem('scrollY', window.scrollY);
+});
+
+var savedScroll = sessionStorage.getItem('scrollY');
+if (savedScroll !== null) {
+    window.scrollTo(0, parseInt(savedScroll));
+    sessionStorage.removeItem('scrollY');
+}
+
+/* Three-dots menu */
+function toggleMenu(btn) {
+    var dropdown = btn.nextElementSibling;
+    var wasOpen = dropdown.classList.contains('open');
+    closeAllMenus();
+    if (!wasOpen) dropdown.classList.add('open');
+}
+
+function closeAllMenus() {
+    document.querySelectorAll('.menu-dropdown.open').forEach(function(m) {
+        m.classList.remove('open');
+    });
+}
+
+document.addEventListener('click', function(e) {
+    if (!e.target.closest('.menu-wrapper')) {
+        closeAllMenus();
+    }
+});
+
+var editPk = null;
+var deletePk = null;
+function openEdit(pk, nome, qtd) {
+    closeAllMenus();
+    editPk = pk;
+    document.getElementById('editForm').action = '/link/' + TOKEN + '/editar/' + pk + '/';
+    document.getElementById('editNome').value = nome;
+    document.getElementById('editQtd').value = qtd;
+    document.getElementById('editModal').classList.add('active');
+    document.getElementById('editNome').focus();
+}
+
+function closeEdit() {
+    document.getElementById('editModal').classList.remove('active');
+}
+
+function openDelete(pk, nome) {
+    closeAllMenus();
+    deletePk = pk;
+    document.getElementById('deleteForm').action = '/link/' + TOKEN + '/apagar/' + pk + '/';
+    document.getElementById('deleteName').textContent = nome;
+    document.getElementById('deleteModal').classList.add('active');
+}
+
+function closeDelete() {
+    document.getElementById('deleteModal').classList.remove('active');
+}
+
+document.querySelectorAll('.modal-overlay').forEach(function(overlay) {
+    overlay.addEventListener('click', function(e) {
+        if (e.target === this) this.classList.remove('active');
+    });
+});
+
+/* Name suggestions from the list's history; picking one also sets its last quantity */
+var suggestTimer = null;
+var suggestSeq = 0;
+var suggestQtd = {};
+function sugerirNomes() {
+    var input = document.getElementById('addInput');
+    document.getElementById('addQtd').value = suggestQtd[input.value] || '';
+    clearTimeout(suggestTimer);
+    var seq = ++suggestSeq;
+    var q = input.value.trim();
+    if (!q) return;
+    suggestTimer = setTimeout(function() {
+        fetch('/link/' + TOKEN + '/sugestoes/?q=' + encodeURIComponent(q))
+            .then(function(r) { return r.json(); })
+            .then(function(data) {
+                if (seq !== suggestSeq) return;
+                var datalist = document.getElementById('sugestoesNomes');
+                datalist.textContent = '';
+                suggestQtd = {};
+                data.sugestoes.forEach(function(s) {
+                    var opt = document.createElement('option');
+                    opt.value = s.nome;
+                    opt.label = s.quantidade;
+                    datalist.appendChild(opt);
+                    suggestQtd[s.nome] = s.quantidade;
+                });
+            })
+            .catch(function() {});
+    }, 120);
+}
+if (document.getElementById('addInput')) {
+    document.getElementById('addInput').addEventListener('input', sugerirNomes);
+    document.getElementById('addInput').addEventListener('paste', colarLinhas);
+}
+
+/* Pasting several lines (a recipe, a note) adds them all in one request; the
+   new rows then arrive like any other change, through alteracoes */
+function colarLinhas(e) {
+    var texto = (e.clipboardData || window.clipboardData).getData('text');
+    if (texto.trim().indexOf('\n') === -1) return;
+    e.preventDefault();
+    var form = document.getElementById('addForm');
+    var corpo = new URLSearchParams();
+    corpo.append('linhas', texto);
+    fetch(form.action, {
+        method: 'POST',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest',
+            'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value
+        },
+        body: corpo
+    })
+    .then(function(r) { if (!r.ok) throw new Error(r.status); return r.json(); })
+    .then(function(data) {
+        document.getElementById('addInput').value = '';
+        if (data.rev !== null) {
+            if (data.rev > latestRev) latestRev = data.rev;
+            syncDelta();
+        }
+    })
+    .catch(reloadPage);
+}
+
+/* Live updates — pushed by the event stream, falls back to polling */
+function reloadPage() {
+    sessionStorage.setItem('scrollY', window.scrollY);
+    location.reload();
+}
+
+function removeItem(id) {
+    var li = document.querySelector('.item[data-id="' + id + '"]');
+    if (li) li.remove();
+}
+
+/* Counts are section totals from the server; only part of a section may be loaded */
+function refreshSection(listId, emptyId, countId) {
+    var ul = document.getElementById(listId);
+    ul.hidden = ul.children.length === 0;
+    document.getElementById(emptyId).hidden = parseInt(document.getElementById(countId).textContent, 10) > 0;
+}
+
+function addToCount(countId, n) {
+    var el = document.getElementById(countId);
+    el.textContent = Math.max(0, parseInt(el.textContent, 10) + n);
+}
+
+/* Patch the item lists with the rows returned by alteracoes/ */
+function applyDelta(data) {
+    data.apagados.forEach(removeItem);
+    data.artigos.forEach(function(a) {
+        removeItem(a.id);
+        var tpl = document.createElement('template');
+        tpl.innerHTML = a.html.trim();
+        var ul = document.getElementById(a.comprar ? 'listaComprar' : 'listaDespensa');
+        ul.insertBefore(tpl.content.firstChild, ul.firstChild);
+    });
+    document.getElementById('countComprar').textContent = data.totais.comprar;
+    document.getElementById('countDespensa').textContent = data.totais.despensa;
+    refreshSection('listaComprar', 'vazioComprar', 'countComprar');
+    refreshSection('listaDespensa', 'vazioDespensa', 'countDespensa');
+    paginaAlterada = true;
+}
+
+/* Further pages of a section, fetched as its "Mostrar mais" button scrolls into view */
+function carregarMais(btn) {
+    if (btn.disabled) return;
+    btn.disabled = true;
+    fetch('/link/' + TOKEN + '/artigos/' + '?seccao=' + btn.dataset.seccao + '&depois=' + encodeURIComponent(btn.dataset.depois))
+        .then(function(r) { if (!r.ok) throw new Error(r.status); return r.json(); })
+        .then(function(data) {
+            var ul = document.getElementById(btn.dataset.lista);
+            var tpl = document.createElement('template');
+            tpl.innerHTML = data.html;
+            tpl.content.querySelectorAll('.item').forEach(function(li) {
+                // Skip items that a live update already brought in
+                if (!document.querySelector('.item[data-id="' + li.dataset.id + '"]')) ul.appendChild(li);
+            });
+            ul.hidden = ul.children.length === 0;
+            if (data.depois) {
+                btn.dataset.depois = data.depois;
+                btn.disabled = false;
+                if (btn.getBoundingClientRect().top < window.innerHeight) carregarMais(btn);
+            } else {
+                btn.remove();
+            }
+        })
+        .catch(function() { btn.disabled = false; });
+}
+if (window.IntersectionObserver) {
+    var pageObserver = new IntersectionObserver(function(entries) {
+        entries.forEach(function(e) { if (e.isIntersecting) carregarMais(e.target); });
+    }, {rootMargin: '400px'});
+    document.querySelectorAll('.carregar-mais').forEach(function(btn) { pageObserver.observe(btn); });
+}
+
+/* Toggles, edits and deletes change the page at once and are sent in order to
+   /link/<token>/sincronizar/ (through the service worker's queue when
+   offline); toggles made in quick succession go together */
+var pendingOps = [];
+var flushTimer = null;
+function moveItem(li, comprar) {
+    li.classList.toggle('despensa-item', !comprar);
+    li.querySelector('[name=destino]').value = comprar ? 'despensa' : 'comprar';
+    var ul = document.getElementById(comprar ? 'listaComprar' : 'listaDespensa');
+    ul.insertBefore(li, ul.firstChild);
+    addToCount(comprar ? 'countComprar' : 'countDespensa', 1);
+    addToCount(comprar ? 'countDespensa' : 'countComprar', -1);
+    refreshSection('listaComprar', 'vazioComprar', 'countComprar');
+    refreshSection('listaDespensa', 'vazioDespensa', 'countDespensa');
+}
+
+function flushOps() {
+    if (pendingOps.length === 0) return;
+    var ops = pendingOps;
+    pendingOps = [];
+    enviarOperacoes(SINCRONIZAR_URL, {operacoes: ops});
+}
+window.addEventListener('pagehide', flushOps);
+
+function queueOp(op, espera) {
+    op.op_id = novoOpId();
+    pendingOps.push(op);
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushOps, espera);
+}
+
+document.addEventListener('submit', function(e) {
+    var form = e.target;
+    if (!form.classList.contains('toggle-form')) return;
+    e.preventDefault();
+    var li = form.closest('.item');
+    var destino = form.querySelector('[name=destino]').value;
+    moveItem(li, destino === 'comprar');
+    queueOp({op: 'toggle', id: parseInt(li.dataset.id, 10), destino: destino}, 400);
+});
+
+/* The forms exist only when the link allows the operation */
+if (document.getElementById('editForm')) {
+    document.getElementById('editForm').addEventListener('submit', function(e) {
+        e.preventDefault();
+        var op = {
+            op: 'editar',
+            id: editPk,
+            nome: document.getElementById('editNome').value.trim(),
+            quantidade: document.getElementById('editQtd').value.trim()
+        };
+        if (!op.nome) return;
+        aplicarOperacao(op);
+        queueOp(op, 0);
+        closeEdit();
+    });
+}
+if (document.getElementById('deleteForm')) {
+    document.getElementById('deleteForm').addEventListener('submit', function(e) {
+        e.preventDefault();
+        var op = {op: 'apagar', id: deletePk};
+        aplicarOperacao(op);
+        queueOp(op, 0);
+        closeDelete();
+    });
+}
+/* Adding waits for the server's page unless the service worker can queue it */
+if (document.getElementById('addForm')) {
+    document.getElementById('addForm').addEventListener('submit', function(e) {
+        if (!controlador()) return;
+        e.preventDefault();
+        var op = {
+            op: 'adicionar',
+            nome: document.getElementById('addInput').value.trim(),
+            quantidade: document.getElementById('addQtd').value.trim()
+        };
+        if (!op.nome) return;
+        aplicarOperacao(op);
+        queueOp(op, 0);
+        document.getElementById('addInput').value = '';
+        document.getElementById('addQtd').value = '';
+    });
+}
+restaurarPendentes(SINCRONIZAR_URL, null);
+
+/* Revision the page was rendered at (<body data-rev>), so changes made before
+   the first poll or event are fetched too */
+var lastRev = parseInt(document.body.dataset.rev, 10);
+var latestRev = lastRev;
+var syncing = false;
+function syncDelta() {
+    if (syncing || latestRev === lastRev) return;
+    syncing = true;
+    fetch('/link/' + TOKEN + '/alteracoes/?desde=' + lastRev)
+        .then(function(r) { return r.json(); })
+        .then(function(data) {
+            if (data.recarregar) return reloadPage();
+            applyDelta(data);
+            lastRev = data.rev;
+        })
+        .catch(function() {})
+        .then(function() {
+            syncing = false;
+            if (latestRev > lastRev) syncDelta();
+        });
+}
+
+function onUpdate(data) {
+    if (data.rev !== latestRev) {
+        latestRev = data.rev;
+        syncDelta();
+    }
+}
+function pollUpdates() {
+    fetch('/link/' + TOKEN + '/check_updates/')
+        .then(function(r) { return r.json(); })
+        .then(onUpdate)
+        .catch(function() {});
+}
+var pollTimer = null;
+function startPolling() {
+    if (pollTimer === null) {
+        pollTimer = setInterval(pollUpdates, 3000);
+        pollUpdates();
+    }
+}
+function stopPolling() {
+    if (pollTimer !== null) {
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+}
+if (window.EventSource) {
+    var eventSource = new EventSource('/link/' + TOKEN + '/eventos/');
+    eventSource.addEventListener('estado', function(e) { onUpdate(JSON.parse(e.data)); });
+    eventSource.onopen = stopPolling;
+    eventSource.onerror = startPolling;
+} else {
+    startPolling();
+}
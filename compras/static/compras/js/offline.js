@@ -0,0 +1,115 @@
+/* Offline support shared by index.js and link.js (loaded before them).
+   Registers the service worker (/sw.js), which queues item operations sent to
+   sincronizar/ while the network is down. Operations are applied to the page
+   at once with the page script's moveItem, addToCount and refreshSection. */
+var paginaAlterada = false;
+
+function novoOpId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+function controlador() {
+    return navigator.serviceWorker ? navigator.serviceWorker.controller : null;
+}
+
+/* "N alterações por enviar" while the queue holds this browser's operations */
+function mostrarPendentes(n) {
+    var el = document.getElementById('filaPendente');
+    if (!el) return;
+    el.textContent = n === 1 ? '1 alteração por enviar' : n + ' alterações por enviar';
+    el.hidden = n === 0;
+}
+
+/* Send {operacoes: [...]} (each with an op_id) to a sincronizar/ endpoint;
+   the service worker answers for the server when the network is down */
+function enviarOperacoes(url, corpo) {
+    fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+        },
+        body: JSON.stringify(corpo),
+        keepalive: true
+    })
+    .then(function(r) { if (!r.ok) throw new Error(r.status); return r.json(); })
+    .then(function(data) { mostrarPendentes(data.pendentes || 0); })
+    .catch(reloadPage);
+}
+
+/* Item added but not yet sent: shown greyed out, without actions, until the
+   real row arrives with the next sync */
+function mostrarNovoPendente(op) {
+    var li = document.createElement('li');
+    li.className = 'item pendente';
+    var caixa = document.createElement('div');
+    caixa.className = 'toggle-form';
+    var nome = document.createElement('span');
+    nome.className = 'item-name';
+    nome.textContent = op.nome;
+    caixa.appendChild(nome);
+    li.appendChild(caixa);
+    var ul = document.getElementById('listaComprar');
+    ul.insertBefore(li, ul.firstChild);
+    addToCount('countComprar', 1);
+    refreshSection('listaComprar', 'vazioComprar', 'countComprar');
+}
+
+/* Show an operation on the page before the server has it (idempotent) */
+function aplicarOperacao(op) {
+    if (op.op === 'adicionar') return mostrarNovoPendente(op);
+    var li = document.querySelector('.item[data-id="' + op.id + '"]');
+    if (!li) return;
+    if (op.op === 'toggle') {
+        var comprar = op.destino === 'comprar';
+        if (li.classList.contains('despensa-item') === comprar) moveItem(li, comprar);
+    } else if (op.op === 'editar') {
+        li.querySelector('.item-name').textContent = op.nome;
+    } else if (op.op === 'apagar') {
+        addToCount(li.classList.contains('despensa-item') ? 'countDespensa' : 'countComprar', -1);
+        li.remove();
+        refreshSection('listaComprar', 'vazioComprar', 'countComprar');
+        refreshSection('listaDespensa', 'vazioDespensa', 'countDespensa');
+    }
+}
+
+/* A page opened from the service worker's copy lacks what is still queued:
+   apply those operations again, and try to send them */
+function restaurarPendentes(url, lista) {
+    var sw = controlador();
+    if (!sw) return;
+    var canal = new MessageChannel();
+    canal.port1.onmessage = function(e) {
+        e.data.forEach(aplicarOperacao);
+        mostrarPendentes(e.data.length);
+    };
+    sw.postMessage({tipo: 'pendentes', url: url, lista: lista}, [canal.port2]);
+    sw.postMessage({tipo: 'esvaziar'});
+}
+
+if (navigator.serviceWorker) {
+    navigator.serviceWorker.register('/sw.js').catch(function() {});
+    navigator.serviceWorker.addEventListener('message', function(e) {
+        if (e.data.tipo === 'rejeitado') {
+            reloadPage();
+        } else if (e.data.tipo === 'sincronizado') {
+            document.querySelectorAll('.item.pendente').forEach(function(li) { li.remove(); });
+            mostrarPendentes(0);
+            pollUpdates();
+        }
+    });
+    window.addEventListener('online', function() {
+        var sw = controlador();
+        if (sw) sw.postMessage({tipo: 'esvaziar'});
+    });
+    /* Leaving the page (locking the phone before going shopping): keep an up
+       to date copy of it for offline use */
+    document.addEventListener('visibilitychange', function() {
+        var sw = controlador();
+        if (document.visibilityState === 'hidden' && paginaAlterada && sw) {
+            paginaAlterada = false;
+            sw.postMessage({tipo: 'guardar', url: location.pathname});
+        }
+    });
+}
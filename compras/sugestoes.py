@@ -0,0 +1,155 @@
+"""
+Item-name suggestions for the add forms, from the household's history.
+
+SugestaoArtigo keeps one row per normalized name for each list and for each
+user, with how often it was used and the name and quantity used last.
+registar() upserts them on every add and edit (two queries per scope,
+whatever the number of items). sugerir() answers prefix lookups by seeking
+the (scope, nome_normalizado) unique index, so its cost depends on the
+household's history, not on the size of the Artigo table.
+
+Lookups go through a small per-process LRU. Its entries expire after
+SUGESTOES_TTL seconds, so writes made by other workers show up shortly;
+writes made by this worker drop the entries of their scope at once.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import SugestaoArtigo, formatar_quantidade, normalizar_nome
+
+# Suggestions returned per lookup
+SUGESTOES_MAX = 8
+
+
+class _LRU:
+    """Thread-safe LRU of lookup results whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, tamanho, ttl):
+        self._tamanho = tamanho
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._dados = OrderedDict()
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = (valor, time.monotonic() + self._ttl)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self._tamanho:
+                self._dados.popitem(last=False)
+
+    def esquecer(self, ambito):
+        """Drop every entry of one scope (keys are (scope, prefix))."""
+        with self._lock:
+            for chave in [chave for chave in self._dados if chave[0] == ambito]:
+                del self._dados[chave]
+
+
+_cache = _LRU(
+    getattr(settings, 'SUGESTOES_CACHE', 1024),
+    getattr(settings, 'SUGESTOES_TTL', 30),
+)
+
+
+def _ambitos(lista_id, utilizador_id):
+    return [
+        (campo, valor)
+        for campo, valor in (('lista', lista_id), ('utilizador', utilizador_id))
+        if valor is not None
+    ]
+
+
+def registar(lista_id, utilizador_id, artigos):
+    """
+    Count one use of each item's name in the list's and the user's history
+    (either may be None), remembering its latest spelling and quantity.
+    Concurrent writes of the same name may lose a count; the ranking
+    doesn't need to be exact.
+    """
+    usos = Counter()
+    ultimos = {}
+    for artigo in artigos:
+        chave = normalizar_nome(artigo.nome)
+        if chave:
+            usos[chave] += 1
+            ultimos[chave] = artigo
+    if not ultimos:
+        return
+    agora = timezone.now()
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    com_alvo = connection.features.supports_update_conflicts_with_target
+    for campo, valor in _ambitos(lista_id, utilizador_id):
+        existentes = dict(SugestaoArtigo.objects.filter(
+            **{campo: valor, 'nome_normalizado__in': list(ultimos)}
+        ).values_list('nome_normalizado', 'usos'))
+        SugestaoArtigo.objects.bulk_create(
+            [
+                SugestaoArtigo(
+                    **{f'{campo}_id': valor},
+                    nome_normalizado=chave,
+                    nome=artigo.nome,
+                    qtd=artigo.qtd,
+                    unidade=artigo.unidade,
+                    usos=existentes.get(chave, 0) + usos[chave],
+                    usado_em=agora,
+                )
+                for chave, artigo in ultimos.items()
+            ],
+            update_conflicts=True,
+            unique_fields=[campo, 'nome_normalizado'] if com_alvo else None,
+            update_fields=['nome', 'qtd', 'unidade', 'usos', 'usado_em'],
+        )
+        _cache.esquecer((campo, valor))
+
+
+def _procurar(ambito, prefixo):
+    chave = (ambito, prefixo)
+    resultado = _cache.get(chave)
+    if resultado is None:
+        campo, valor = ambito
+        linhas = SugestaoArtigo.objects.filter(
+            **{campo: valor, 'nome_normalizado__istartswith': prefixo}
+        ).order_by('-usos', '-usado_em').values_list(
+            'nome_normalizado', 'nome', 'qtd', 'unidade', 'usos',
+        )[:SUGESTOES_MAX]
+        resultado = [
+            {'chave': normalizado, 'nome': nome, 'quantidade': formatar_quantidade(qtd, unidade), 'usos': n}
+            for normalizado, nome, qtd, unidade, n in linhas
+        ]
+        _cache.set(chave, resultado)
+    return resultado
+
+
+def sugerir(lista_id, utilizador_id, texto):
+    """
+    Up to SUGESTOES_MAX names starting with ``texto`` (ignoring case and
+    accents) from the list's and the user's history, most used first, each
+    with its last quantity.
+    """
+    prefixo = normalizar_nome(texto)
+    if not prefixo:
+        return []
+    melhores = {}
+    for ambito in _ambitos(lista_id, utilizador_id):
+        for sugestao in _procurar(ambito, prefixo):
+            atual = melhores.get(sugestao['chave'])
+            if atual is None or sugestao['usos'] > atual['usos']:
+                melhores[sugestao['chave']] = sugestao
+    ordenadas = sorted(melhores.values(), key=lambda s: (-s['usos'], s['chave']))
+    return [{'nome': s['nome'], 'quantidade': s['quantidade']} for s in ordenadas[:SUGESTOES_MAX]]
@@ -0,0 +1,257 @@
+{% autoescape off %}/* Service worker of ListaIsto, served at /sw.js by views.service_worker.
+
+   - App shell: the files of ESTATICOS are cached when the worker installs and
+     served from the cache (their URLs carry content hashes).
+   - Pages: the main page and link pages come from the network, and a copy of
+     each is kept; offline, the last copy opens, with the items the list had
+     when it last synced.
+   - Queue: item operations POSTed to sincronizar/ are stored in IndexedDB and
+     sent from there, in order. When the network fails they stay queued and go
+     out when it returns (Background Sync where supported, otherwise when a
+     page is back online or loads). Every operation carries an op_id, so one
+     sent twice is applied once. */
+var VERSAO = '{{ versao }}';
+var ESTATICOS = {{ estaticos }};
+var CACHE_ESTATICOS = 'estaticos-' + VERSAO;
+var CACHE_PAGINAS = 'paginas';
+var PAGINA_RE = /^\/(link\/[^/]+\/)?$/;
+var FILA_RE = /^\/(link\/[^/]+\/)?sincronizar\/$/;
+// Operations per request when sending the queue (views.LOTE_MAX)
+var LOTE = {{ lote_max }};
+
+self.addEventListener('install', function(event) {
+    event.waitUntil(
+        caches.open(CACHE_ESTATICOS)
+            .then(function(cache) { return cache.addAll(ESTATICOS); })
+            .then(function() { return self.skipWaiting(); })
+    );
+});
+
+self.addEventListener('activate', function(event) {
+    event.waitUntil(
+        caches.keys().then(function(nomes) {
+            return Promise.all(nomes.filter(function(nome) {
+                return nome.indexOf('estaticos-') === 0 && nome !== CACHE_ESTATICOS;
+            }).map(function(nome) { return caches.delete(nome); }));
+        }).then(function() { return self.clients.claim(); })
+    );
+});
+
+self.addEventListener('fetch', function(event) {
+    var pedido = event.request;
+    var url = new URL(pedido.url);
+    if (url.origin !== location.origin) return;
+    if (pedido.method === 'POST' && FILA_RE.test(url.pathname)) {
+        event.respondWith(enfileirar(pedido));
+    } else if (pedido.method !== 'GET') {
+        return;
+    } else if (ESTATICOS.indexOf(url.pathname) !== -1) {
+        event.respondWith(caches.match(pedido, {cacheName: CACHE_ESTATICOS}).then(function(resposta) {
+            return resposta || fetch(pedido);
+        }));
+    } else if (pedido.mode === 'navigate' && PAGINA_RE.test(url.pathname)) {
+        event.respondWith(pagina(event, url.origin + url.pathname));
+    } else if (pedido.mode === 'navigate' && url.pathname === '/sair/') {
+        event.respondWith(sair(pedido));
+    }
+});
+
+self.addEventListener('sync', function(event) {
+    if (event.tag === 'fila') event.waitUntil(esvaziar());
+});
+
+self.addEventListener('message', function(event) {
+    var msg = event.data || {};
+    if (msg.tipo === 'esvaziar') {
+        event.waitUntil(esvaziar());
+    } else if (msg.tipo === 'pendentes') {
+        // Operations of one page still queued, so an offline reload shows them
+        event.waitUntil(lerFila().then(function(entradas) {
+            event.ports[0].postMessage(entradas.filter(function(e) {
+                return e.valor.url === msg.url && e.valor.lista === msg.lista;
+            }).map(function(e) { return e.valor.op; }));
+        }));
+    } else if (msg.tipo === 'guardar') {
+        event.waitUntil(caches.open(CACHE_PAGINAS).then(function(cache) {
+            return guardarPagina(cache, new URL(msg.url, location.origin).href);
+        }).catch(function() {}));
+    }
+});
+
+/* ── Pages ── */
+
+function pagina(event, chave) {
+    return fetch(event.request).then(function(resposta) {
+        if (resposta.ok) {
+            var copia = resposta.clone();
+            event.waitUntil(caches.open(CACHE_PAGINAS).then(function(cache) { return cache.put(chave, copia); }));
+        } else if (resposta.type === 'opaqueredirect' || resposta.status === 404) {
+            // Logged out, or the link expired
+            event.waitUntil(caches.open(CACHE_PAGINAS).then(function(cache) { return cache.delete(chave); }));
+        }
+        return resposta;
+    }).catch(function() {
+        return caches.match(chave, {cacheName: CACHE_PAGINAS}).then(function(resposta) {
+            return resposta || Response.error();
+        });
+    });
+}
+
+function guardarPagina(cache, url) {
+    return fetch(url, {credentials: 'same-origin', redirect: 'manual'}).then(function(resposta) {
+        if (resposta.ok) return cache.put(url, resposta);
+        if (resposta.type === 'opaqueredirect' || resposta.status === 404) return cache.delete(url);
+    });
+}
+
+/* After a sync, refresh the kept pages so they show the operations just sent */
+function atualizarPaginas() {
+    return caches.open(CACHE_PAGINAS).then(function(cache) {
+        return cache.keys().then(function(pedidos) {
+            return Promise.all(pedidos.map(function(pedido) {
+                return guardarPagina(cache, pedido.url).catch(function() {});
+            }));
+        });
+    });
+}
+
+/* Send what is queued first; once the session is gone, the next user of this
+   browser must not see this one's pages nor send their operations */
+function sair(pedido) {
+    return esvaziar().then(function() {
+        return fetch(pedido);
+    }).then(function(resposta) {
+        return Promise.all([caches.delete(CACHE_PAGINAS), apagarDaFila(function(valor) {
+            return valor.url === '/sincronizar/';
+        })]).then(function() { return resposta; });
+    });
+}
+
+/* ── Queue (IndexedDB store "fila": {url, lista, csrf, op} by insertion order) ── */
+
+function abrirFila() {
+    return new Promise(function(resolve, reject) {
+        var pedido = indexedDB.open('listaisto', 1);
+        pedido.onupgradeneeded = function() {
+            pedido.result.createObjectStore('fila', {autoIncrement: true});
+        };
+        pedido.onsuccess = function() { resolve(pedido.result); };
+        pedido.onerror = function() { reject(pedido.error); };
+    });
+}
+
+/* Run fazer(store) in one transaction; resolve with its return value once committed */
+function transacao(modo, fazer) {
+    return abrirFila().then(function(db) {
+        return new Promise(function(resolve, reject) {
+            var tx = db.transaction('fila', modo);
+            var resultado = fazer(tx.objectStore('fila'));
+            tx.oncomplete = function() { db.close(); resolve(resultado); };
+            tx.onerror = tx.onabort = function() { db.close(); reject(tx.error); };
+        });
+    });
+}
+
+function lerFila() {
+    return transacao('readonly', function(fila) {
+        var entradas = [];
+        fila.openCursor().onsuccess = function(e) {
+            var cursor = e.target.result;
+            if (!cursor) return;
+            entradas.push({chave: cursor.key, valor: cursor.value});
+            cursor.continue();
+        };
+        return entradas;
+    });
+}
+
+function apagarDaFila(filtro) {
+    return transacao('readwrite', function(fila) {
+        fila.openCursor().onsuccess = function(e) {
+            var cursor = e.target.result;
+            if (!cursor) return;
+            if (filtro(cursor.value, cursor.key)) cursor.delete();
+            cursor.continue();
+        };
+    });
+}
+
+function avisar(msg) {
+    return self.clients.matchAll().then(function(clientes) {
+        clientes.forEach(function(cliente) { cliente.postMessage(msg); });
+    });
+}
+
+/* Store the operations of a page's request, then try to send the queue.
+   The page gets {ok, pendentes}: how many operations are still waiting. */
+function enfileirar(pedido) {
+    var url = new URL(pedido.url).pathname;
+    var csrf = pedido.headers.get('X-CSRFToken');
+    return pedido.json().then(function(corpo) {
+        var lista = typeof corpo.lista === 'number' ? corpo.lista : null;
+        return transacao('readwrite', function(fila) {
+            corpo.operacoes.forEach(function(op) {
+                fila.add({url: url, lista: lista, csrf: csrf, op: op});
+            });
+        });
+    }).then(esvaziar).then(lerFila).then(function(entradas) {
+        return new Response(JSON.stringify({ok: true, pendentes: entradas.length}), {
+            headers: {'Content-Type': 'application/json'}
+        });
+    });
+}
+
+/* One sender at a time, so operations always reach the server in order */
+var envio = Promise.resolve();
+// Operations waited in the queue, so the kept pages miss them
+var retida = false;
+function esvaziar() {
+    envio = envio.then(function() {
+        return enviarFila(false).catch(function() {
+            retida = true;
+            if (self.registration.sync) return self.registration.sync.register('fila').catch(function() {});
+        });
+    });
+    return envio;
+}
+
+/* Send the queue a request at a time: the leading operations for the same
+   endpoint and list, up to LOTE. Operations the server refuses (no access any
+   more, expired link, ended session) can never succeed, so they are dropped
+   and the pages reload to show the real state. Network errors and 5xx keep
+   them for the next try. */
+function enviarFila(enviou) {
+    return lerFila().then(function(entradas) {
+        if (entradas.length === 0) {
+            if (!enviou) return;
+            var atualizar = retida ? atualizarPaginas() : Promise.resolve();
+            retida = false;
+            return atualizar.then(function() { return avisar({tipo: 'sincronizado'}); });
+        }
+        var primeira = entradas[0].valor;
+        var lote = [];
+        for (var i = 0; i < entradas.length && lote.length < LOTE; i++) {
+            var valor = entradas[i].valor;
+            if (valor.url !== primeira.url || valor.lista !== primeira.lista) break;
+            lote.push(entradas[i]);
+        }
+        var corpo = {operacoes: lote.map(function(e) { return e.valor.op; })};
+        if (primeira.lista !== null) corpo.lista = primeira.lista;
+        return fetch(primeira.url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            redirect: 'manual',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': primeira.csrf},
+            body: JSON.stringify(corpo)
+        }).then(function(resposta) {
+            if (resposta.status >= 500) throw new Error(resposta.status);
+            var chaves = lote.map(function(e) { return e.chave; });
+            return apagarDaFila(function(valor, chave) {
+                return chaves.indexOf(chave) !== -1;
+            }).then(function() {
+                if (!resposta.ok) return avisar({tipo: 'rejeitado'});
+            }).then(function() { return enviarFila(true); });
+        });
+    });
+}
+{% endautoescape %}
@@ -1,3 +1,1284 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import re
+import socketserver
+import tempfile
+import threading
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.conf import settings
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.templatetags.static import static
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from lista_compras.asgi import Handler
+
+from . import (
+    acessos, correio, desempenho, eventos, fragmentos, metricas, replicas, senhas, sugestoes, tokens, transferencia,
+    views,
+)
+from .models import Artigo, ArtigoApagado, EmailPendente, LinkPartilha, Lista, ListaPartilha, formatar_quantidade
+
+User = get_user_model()
+
+CACHE_TESTES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'compras-testes'}}
+# Unhashed static URLs: the manifest storage needs collectstatic to have run
+STORAGES_TESTES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+async def abrir_asgi(app, caminho, cookies=''):
+    """Start a GET of caminho on an ASGI app; return its task and the queue of the messages it sends."""
+    mensagens = asyncio.Queue()
+    pedido = [{'type': 'http.request', 'body': b''}]
+
+    async def receber():
+        if pedido:
+            return pedido.pop()
+        await asyncio.Event().wait()  # the client never leaves
+
+    caminho, _, query = caminho.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': caminho, 'raw_path': caminho.encode(), 'query_string': query.encode(),
+        'root_path': '', 'client': ('127.0.0.1', 5000), 'server': ('testserver', 80),
+        'headers': [(b'host', b'testserver'), (b'cookie', cookies.encode())],
+    }
+    return asyncio.create_task(app(scope, receber, mensagens.put)), mensagens
+
+
+@override_settings(CACHES=CACHE_TESTES, STORAGES=STORAGES_TESTES)
+class CacheIsoladoTestCase(TestCase):
+    """
+    TestCase on a private cache, emptied before each test. Cached entries are
+    keyed by pk (access records, links), and the pks of rolled-back rows are
+    reused, so entries left by an earlier test or run would answer for rows
+    they never described. Pages render without collectstatic.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class PlanosConsultaTests(CacheIsoladoTestCase):
+    """
+    The hot queries must keep using their composite indexes (see migration
+    0008_indices_acesso). EXPLAIN output differs per backend, so the checks
+    only look for the index name and for the words each backend uses for an
+    extra sort step (MySQL/MariaDB "Using filesort", SQLite "TEMP B-TREE").
+    """
+
+    UTILIZADORES = 2000
+    LISTAS = 40
+    ARTIGOS_POR_LISTA = 150
+    LINKS_POR_LISTA = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(username=f'u{i}', email=f'u{i}@exemplo.pt', password='!')
+            for i in range(cls.UTILIZADORES)
+        )
+        dono = User.objects.get(username='u0')
+        Lista.objects.bulk_create(
+            Lista(nome=f'Lista {i}', dono=dono) for i in range(cls.LISTAS)
+        )
+        listas = list(Lista.objects.all())
+        agora = timezone.now()
+        Artigo.objects.bulk_create(
+            [
+                Artigo(lista=lista, nome=f'artigo {i}', comprar=i % 3 == 0, revisao=i)
+                for lista in listas
+                for i in range(cls.ARTIGOS_POR_LISTA)
+            ],
+            batch_size=1000,
+        )
+        LinkPartilha.objects.bulk_create(
+            LinkPartilha(lista=lista, expira_em=agora + timedelta(hours=i - 2))
+            for lista in listas
+            for i in range(cls.LINKS_POR_LISTA)
+        )
+        cls.lista = listas[len(listas) // 2]
+
+    def assertUsaIndice(self, queryset, indice, ordenado=True):
+        plano = queryset.explain()
+        self.assertIn(indice, plano, f'{indice} não usado:\n{plano}')
+        if ordenado:
+            for ordenacao in ('filesort', 'TEMP B-TREE'):
+                self.assertNotIn(ordenacao, plano, f'Ordenação extra:\n{plano}')
+
+    # Django only compares booleans with "= 1" on MySQL/MariaDB; elsewhere it
+    # emits a bare "WHERE comprar", which can't seek on the index column
+    @skipUnless(connection.vendor == 'mysql', 'Plano só relevante em MySQL/MariaDB')
+    def test_seccoes_da_lista(self):
+        for comprar in (True, False):
+            with self.subTest(comprar=comprar):
+                self.assertUsaIndice(
+                    self.lista.artigos.filter(comprar=comprar), 'artigo_lista_comprar_idx'
+                )
+                # Later pages seek from the last item shown (views._pagina_artigos)
+                ultimo = self.lista.artigos.filter(comprar=comprar)[20]
+                self.assertUsaIndice(
+                    self.lista.artigos.filter(comprar=comprar, movido_em__lte=ultimo.movido_em)
+                    .exclude(movido_em=ultimo.movido_em, pk__gte=ultimo.pk)[:100],
+                    'artigo_lista_comprar_idx',
+                )
+
+    def test_alteracoes_desde_revisao(self):
+        self.assertUsaIndice(
+            Artigo.objects.filter(lista=self.lista, revisao__gt=self.ARTIGOS_POR_LISTA - 5)
+            .order_by('revisao'),
+            'artigo_lista_revisao_idx',
+        )
+
+    @skipUnless(connection.vendor == 'mysql', 'LIKE só usa índices em MySQL/MariaDB')
+    def test_pesquisa_por_prefixo(self):
+        ids = list(Lista.objects.values_list('pk', flat=True)[:5])
+        self.assertUsaIndice(
+            Artigo.objects.filter(lista_id__in=ids, nome_normalizado__istartswith='artigo 1'),
+            'artigo_lista_nome_idx',
+            ordenado=False,
+        )
+
+    def test_links_ativos(self):
+        # Few rows per list, so sorting them by criado_em is fine
+        self.assertUsaIndice(
+            self.lista.links_partilha.filter(expira_em__gt=timezone.now()),
+            'link_lista_expira_idx',
+            ordenado=False,
+        )
+
+    def test_links_expirados(self):
+        # The batches of limpar_expirados, across every list
+        self.assertUsaIndice(
+            LinkPartilha.objects.filter(expira_em__lt=timezone.now() - timedelta(days=7))
+            .order_by().values_list('pk', flat=True)[:1000],
+            'link_expira_idx',
+            ordenado=False,
+        )
+
+    def test_utilizador_por_email(self):
+        self.assertUsaIndice(
+            User.objects.filter(email='u1234@exemplo.pt'), 'compras_user_email_idx'
+        )
+
+
+# A replica only sees committed rows, never the data of a TestCase
+@override_settings(REPLICA_VISTAS=[])
+class OrcamentoConsultasTests(CacheIsoladoTestCase):
+    """Hot views stay within compras.desempenho.ORCAMENTO_CONSULTAS at every list size."""
+
+    TAMANHOS = (5, 300)
+
+    def test_orcamentos(self):
+        for tamanho in self.TAMANHOS:
+            call_command(
+                'semear_dados', stdout=StringIO(),
+                utilizadores=6, listas=2, artigos=tamanho, partilhas=2, confirmar=True,
+            )
+            user = User.objects.get(username='bench0')
+            lista = Lista.objects.filter(dono=user).order_by('pk').first()
+            link = lista.links_partilha.get()
+            autenticado, anonimo = desempenho.cliente(user, lista)
+            for nome, metodo, url, login in desempenho.cenarios(lista, link):
+                with self.subTest(vista=nome, artigos=tamanho):
+                    resultado = desempenho.medir(autenticado if login else anonimo, metodo, url, 1)
+                    self.assertLess(resultado['estado'], 400)
+                    self.assertLessEqual(resultado['consultas'], desempenho.orcamento(nome, tamanho))
+
+    def test_sem_debug_pede_confirmacao(self):
+        User.objects.create(username='bench7')
+        for comando in ('semear_dados', 'medir_desempenho'):
+            with self.subTest(comando=comando), self.assertRaisesMessage(CommandError, '--confirmar'):
+                call_command(comando, stdout=StringIO())
+        self.assertTrue(User.objects.filter(username='bench7').exists())
+        with override_settings(DEBUG=True):
+            call_command('semear_dados', '--limpar', stdout=StringIO())
+        self.assertFalse(User.objects.filter(username='bench7').exists())
+
+
+class MetricasTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = Path(pasta.name)
+        definicoes = self.settings(METRICAS_DIR=pasta.name, METRICAS_TOKEN='segredo')
+        definicoes.enable()
+        self.addCleanup(definicoes.disable)
+        self.user = User.objects.create(username='ana')
+        Lista.objects.create(nome='Casa', dono=self.user)
+        self.client.force_login(self.user)
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/')
+        match = re.fullmatch(
+            r'db;dur=[\d.]+;desc="(\d+) queries", tpl;dur=([\d.]+), total;dur=[\d.]+',
+            resposta['Server-Timing'],
+        )
+        self.assertIsNotNone(match, resposta['Server-Timing'])
+        self.assertEqual(int(match[1]), len(consultas))
+        self.assertGreater(float(match[2]), 0)
+
+    def test_soma_os_histogramas_de_todos_os_workers(self):
+        self.client.get('/')
+        outro = metricas._vazio()
+        outro.update(n=5, sql_n=40)
+        (self.pasta / '1.json').write_text(json.dumps({'index': outro}))
+        proprio = metricas._histogramas._vistas['index']
+        texto = self.client.get('/metricas/', HTTP_AUTHORIZATION='Bearer segredo').content.decode()
+        self.assertIn(f'compras_pedido_duracao_segundos_count{{vista="index"}} {proprio["n"] + 5}\n', texto)
+        self.assertIn(f'compras_sql_consultas_total{{vista="index"}} {proprio["sql_n"] + 40}\n', texto)
+
+    def test_so_staff_ou_token(self):
+        self.assertEqual(self.client.get('/metricas/').status_code, 404)
+        self.assertEqual(self.client.get('/metricas/', HTTP_AUTHORIZATION='Bearer outro').status_code, 404)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(self.client.get('/metricas/').status_code, 200)
+
+
+@override_settings(REPLICA_VISTAS=[])
+class CondicionalTests(CacheIsoladoTestCase):
+    """Conditional GETs (views._condicional): what the ETag of each polled view must follow."""
+
+    # Views whose body embeds CSRF tokens
+    COM_CSRF = ('index', 'pagina_artigos', 'ver_link', 'link_pagina_artigos')
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        Artigo.objects.create(lista=self.lista, nome='leite', quantidade='1')
+        link = LinkPartilha.objects.create(
+            lista=self.lista, expira_em=timezone.now() + timedelta(hours=1), pode_toggle=True,
+        )
+        token = tokens.token_publico(link)
+        self.urls = {
+            'index': '/',
+            'check_updates': '/check_updates/',
+            'pagina_artigos': f'/lista/{self.lista.pk}/artigos/?seccao=comprar',
+            'ver_link': f'/link/{token}/',
+            'link_check_updates': f'/link/{token}/check_updates/',
+            'link_pagina_artigos': f'/link/{token}/artigos/?seccao=comprar',
+        }
+        self.client.force_login(self.user)
+        self.client.get(f'/lista/{self.lista.pk}/selecionar/')
+        self.client.get('/')  # sets the CSRF cookie
+
+    def etags(self):
+        return {nome: self.client.get(url)['ETag'] for nome, url in self.urls.items()}
+
+    def test_etag_igual_304_sem_consultar_artigos(self):
+        for nome, etag in self.etags().items():
+            with self.subTest(vista=nome):
+                # Nothing cached: a rendered body would have to read the items
+                cache.clear()
+                with CaptureQueriesContext(connection) as consultas:
+                    resposta = self.client.get(self.urls[nome], HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(resposta.status_code, 304)
+                self.assertEqual(resposta.content, b'')
+                self.assertEqual(resposta['ETag'], etag)
+                self.assertFalse([c for c in consultas.captured_queries if re.search(r'\bcompras_artigo\b', c['sql'])])
+
+    def test_etag_muda_depois_de_escrever(self):
+        antes = self.etags()
+        self.client.post('/adicionar/', {'nome': 'pão'})
+        depois = self.etags()
+        for nome, url in self.urls.items():
+            with self.subTest(vista=nome):
+                self.assertNotEqual(depois[nome], antes[nome])
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=antes[nome]).status_code, 200)
+
+    def test_etag_muda_com_novo_token_csrf(self):
+        antes = self.etags()
+        # As rotate_token() does on login
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = get_random_string(32)
+        depois = self.etags()
+        for nome in self.urls:
+            with self.subTest(vista=nome):
+                if nome in self.COM_CSRF:
+                    self.assertNotEqual(depois[nome], antes[nome])
+                else:
+                    self.assertEqual(depois[nome], antes[nome])
+
+
+class AcessosTests(CacheIsoladoTestCase):
+
+    def test_lista_criada_numa_transacao_visivel_depois_do_commit(self):
+        user = User.objects.create(username='ana')
+        antes = acessos.registo(user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                lista = Lista.objects.create(nome='Casa', dono=user)
+                # A request on another connection can't see the new list yet
+                # and caches the record from before it
+                cache.set(acessos._chave(user.pk), antes)
+                self.assertNotIn(lista.pk, acessos.registo(user.pk)['listas'])
+        self.assertIn(lista.pk, acessos.registo(user.pk)['listas'])
+
+
+# Link pages read from the replica, which never sees the data of a TestCase
+@override_settings(REPLICA_VISTAS=[])
+class LinksAssinadosTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        self.link = LinkPartilha.objects.create(
+            lista=self.lista, expira_em=timezone.now() + timedelta(hours=1), pode_toggle=True,
+        )
+        self.token = tokens.assinar(self.link)
+
+    def ver(self, token):
+        return self.client.get(f'/link/{token}/').status_code
+
+    def test_token_valido(self):
+        self.assertEqual(self.ver(self.token), 200)
+
+    def test_assinatura_alterada(self):
+        valor, assinatura = self.token.split(':')
+        self.assertEqual(self.ver(f'{valor}:{assinatura[:-1]}{"B" if assinatura[-1] == "A" else "A"}'), 404)
+        # The signature covers the values too
+        link, lista, expira, permissoes = valor.split('.')
+        self.assertEqual(self.ver(f'{link}.{lista}.{int(expira) + 3600}.{permissoes}:{assinatura}'), 404)
+
+    def test_token_expirado_sem_consultas(self):
+        self.link.expira_em = timezone.now() - timedelta(minutes=1)
+        self.link.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ver(tokens.assinar(self.link)), 404)
+
+    def test_permissoes_diferentes_da_linha(self):
+        valor = tokens._signer.unsign(self.token).rsplit('.', 1)[0]
+        todas = (1 << len(tokens.PERMISSOES)) - 1
+        self.assertEqual(self.ver(tokens._signer.sign(f'{valor}.{todas}')), 404)
+        # Permissions changed on the row: the old token no longer matches
+        self.assertEqual(self.ver(self.token), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.link.pode_apagar = True
+            self.link.save()
+        self.assertEqual(self.ver(self.token), 404)
+        self.assertEqual(self.ver(tokens.assinar(self.link)), 200)
+
+    def test_link_apagado_revogado_de_imediato(self):
+        self.assertEqual(self.ver(self.token), 200)
+        self.assertIsNotNone(cache.get(tokens.chave_cache(self.link.pk)))
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/lista/{self.lista.pk}/link/{self.link.pk}/apagar/')
+        self.assertIsNone(cache.get(tokens.chave_cache(self.link.pk)))
+        self.assertEqual(self.ver(self.token), 404)
+
+    def test_token_uuid_antigo(self):
+        self.assertEqual(self.ver(self.link.token), 200)
+        self.assertEqual(self.ver('00000000-0000-4000-8000-000000000000'), 404)
+
+
+class FragmentosTests(CacheIsoladoTestCase):
+
+    def test_nomes_nunca_tomados_pelo_token_csrf(self):
+        user = User.objects.create(username='ana')
+        lista = Lista.objects.create(nome='Casa', dono=user)
+        for nome in ('csrf-fragmento', fragmentos.marca_csrf()):
+            Artigo.objects.create(lista=lista, nome=nome, quantidade='1')
+        self.client.force_login(user)
+        for _ in range(2):  # rendered, then from the cache
+            html = self.client.get('/').content.decode()
+            self.assertIn('>csrf-fragmento<', html)
+            self.assertIn(fragmentos.marca_csrf().replace('<', '&lt;').replace('>', '&gt;'), html)
+            self.assertIn('name="csrfmiddlewaretoken"', html)
+            self.assertNotIn(f'value="{fragmentos.marca_csrf()}"', html)
+
+
+@override_settings(REPLICA_VISTAS=[])
+class SessoesTests(CacheIsoladoTestCase):
+
+    def escritas_sessao(self, caminho):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(caminho)
+        return [
+            q['sql'] for q in consultas.captured_queries
+            if q['sql'].split()[0] in ('INSERT', 'UPDATE') and 'django_session' in q['sql']
+        ]
+
+    def test_mesmo_valor_nao_grava_sessao(self):
+        user = User.objects.create(username='ana')
+        lista = Lista.objects.create(nome='Casa', dono=user)
+        self.client.force_login(user)
+        self.client.get('/')
+        # Selecting the active list again assigns the same value: nothing to write
+        self.assertEqual(self.escritas_sessao(f'/lista/{lista.pk}/selecionar/'), [])
+        self.assertEqual(self.client.session['lista_ativa'], lista.pk)
+
+    def test_link_anonimo_sem_sessao(self):
+        user = User.objects.create(username='ana')
+        link = LinkPartilha.objects.create(
+            lista=Lista.objects.create(nome='Casa', dono=user), expira_em=timezone.now() + timedelta(days=1),
+        )
+        self.assertEqual(self.escritas_sessao(f'/link/{tokens.token_publico(link)}/'), [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_limpar_sessoes_expiradas_por_lotes(self):
+        agora = timezone.now()
+        for n in range(3):
+            Session.objects.create(session_key=f'velha{n}', session_data='', expire_date=agora - timedelta(days=1))
+        Session.objects.create(session_key='nova', session_data='', expire_date=agora + timedelta(days=1))
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('clearsessions')
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['nova'])
+        apagar = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertTrue(apagar and all(' IN (' in sql for sql in apagar), apagar)
+
+
+@override_settings(TENTATIVAS_MAX_UTILIZADOR=2, TENTATIVAS_MAX_IP=5)
+class EntrarTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.hash = hashlib.sha256(b'segredo').hexdigest()
+        User.objects.create(username='ana', email='ana@exemplo.pt', password=make_password(self.hash))
+
+    def entrar(self, username='ana', password_hash=None):
+        resposta = self.client.post('/entrar/', {'username': username, 'password_hash': password_hash or self.hash})
+        self.client.logout()
+        return resposta.status_code
+
+    def registar(self, username):
+        return self.client.post('/registar/', {'username': username, 'password_hash': self.hash}).status_code
+
+    def test_falhas_por_utilizador(self):
+        self.assertEqual([self.entrar(password_hash='0' * 64) for _ in range(2)], [200, 200])
+        # Locked, even with the right password, but only that username
+        self.assertEqual(self.entrar(), 429)
+        self.assertEqual(self.entrar('rui'), 200)
+
+    def test_entradas_certas_nao_contam(self):
+        self.assertEqual([self.entrar() for _ in range(3)], [302] * 3)
+        self.assertEqual(self.entrar(password_hash='0' * 64), 200)
+        self.assertEqual(self.entrar(), 302)
+
+    def test_limite_por_ip(self):
+        self.assertEqual([self.entrar(f'u{i}') for i in range(5)], [200] * 5)
+        self.assertEqual(self.entrar(), 429)
+        self.assertEqual(self.registar('rui'), 429)
+        self.assertFalse(User.objects.filter(username='rui').exists())
+
+    @override_settings(SENHAS_CONCORRENCIA=1, SENHAS_FILA=0)
+    def test_503_com_a_fila_de_hashes_cheia(self):
+        # A pool sized by these settings, instead of the one of the process
+        with mock.patch.object(senhas, '_executor', None), mock.patch.object(senhas, '_vagas', None):
+            _, vagas = senhas._pool()
+            vagas.acquire()  # the one hash allowed is in progress
+            try:
+                self.assertEqual([self.entrar() for _ in range(2)], [503, 503])
+                self.assertEqual(self.registar('rui'), 503)
+            finally:
+                vagas.release()
+            # Refused unchecked: not failed logins
+            self.assertEqual(self.entrar(), 302)
+            senhas._executor.shutdown()
+
+
+@override_settings(REPLICA_VISTAS=[])
+class AlteracoesTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        self.client.force_login(self.user)
+        for nome in ('leite', 'pão', 'ovos'):
+            self.client.post('/adicionar/', {'nome': nome})
+        self.leite, self.pao, self.ovos = self.lista.artigos.order_by('pk')
+
+    def revisao(self):
+        return self.client.get('/check_updates/').json()['rev']
+
+    def alteracoes(self, desde):
+        return self.client.get(f'/alteracoes/?desde={desde}').json()
+
+    def test_so_o_que_mudou_desde_a_revisao(self):
+        desde = self.revisao()
+        self.client.post(f'/toggle/{self.leite.pk}/', {'destino': 'despensa'})
+        self.client.post(f'/apagar/{self.pao.pk}/')
+        delta = self.alteracoes(desde)
+        self.assertEqual([(a['id'], a['comprar']) for a in delta['artigos']], [(self.leite.pk, False)])
+        self.assertEqual(delta['apagados'], [self.pao.pk])
+        self.assertEqual(delta['totais'], {'comprar': 1, 'despensa': 1})
+        vazio = self.alteracoes(delta['rev'])
+        self.assertEqual((vazio['artigos'], vazio['apagados']), ([], []))
+
+    def test_revisao_anterior_aos_tombstones_guardados_recarrega(self):
+        desde = self.revisao()
+        self.client.post(f'/apagar/{self.pao.pk}/')
+        ArtigoApagado.objects.update(apagado_em=timezone.now() - timedelta(days=31))
+        call_command('limpar_expirados', stdout=StringIO())
+        self.assertFalse(ArtigoApagado.objects.exists())
+        self.assertTrue(self.alteracoes(desde)['recarregar'])
+        self.assertNotIn('recarregar', self.alteracoes(self.revisao()))
+
+    def test_pagina_traz_a_revisao_em_que_foi_gerada(self):
+        link = LinkPartilha.objects.create(lista=self.lista, expira_em=timezone.now() + timedelta(days=1))
+        self.client.post(f'/toggle/{self.leite.pk}/')
+        self.lista.refresh_from_db()
+        estado = self.client.get('/check_updates/').json()
+        self.assertContains(
+            self.client.get('/'), f'data-rev="{estado["rev"]}" data-rev-listas="{estado["rev_listas"]}"',
+        )
+        self.assertContains(self.client.get(f'/link/{tokens.token_publico(link)}/'), f'data-rev="{self.lista.revisao}"')
+
+    def test_renomear_nao_repoe_revisao_lida(self):
+        ler = views.get_object_or_404
+
+        def ler_e_alterar(*args, **kwargs):
+            lista = ler(*args, **kwargs)
+            views._incrementar_quantidade(self.lista.pk, self.leite.pk, 'mais')  # after the rename read the list
+            return lista
+
+        desde = self.revisao()
+        with mock.patch.object(views, 'get_object_or_404', ler_e_alterar):
+            self.client.post(f'/lista/{self.lista.pk}/renomear/', {'nome': 'Praia'})
+        self.lista.refresh_from_db()
+        self.assertEqual((self.lista.nome, self.lista.revisao), ('Praia', desde + 2))
+        self.assertEqual([a['id'] for a in self.alteracoes(desde)['artigos']], [self.leite.pk])
+
+
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: no extensions, no auth."""
+
+    def responder(self, linha):
+        self.wfile.write(f'{linha}\r\n'.encode())
+
+    def handle(self):
+        self.server.ligacoes += 1
+        self.responder('220 stub')
+        for linha in self.rfile:
+            comando = linha.decode().strip()
+            verbo = comando[:4].upper()
+            if verbo == 'QUIT':
+                self.responder('221 adeus')
+                return
+            if verbo == 'RCPT' and any(r in comando for r in self.server.recusar):
+                self.responder('550 destinatario recusado')
+            elif verbo == 'DATA':
+                self.responder('354 continue')
+                corpo = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.mensagens.append(corpo.decode())
+                self.responder('250 ok')
+            else:
+                self.responder('250 ok')
+
+
+class EnvioEmailsTests(CacheIsoladoTestCase):
+    """enviar_emails against a local stub SMTP server."""
+
+    def setUp(self):
+        super().setUp()
+        self.servidor = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SessaoSMTP)
+        self.servidor.daemon_threads = True
+        self.servidor.ligacoes = 0
+        self.servidor.mensagens = []
+        self.servidor.recusar = []
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        smtp = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.servidor.server_address[1],
+            EMAIL_HOST_USER='', EMAIL_USE_SSL=False, EMAIL_USE_TLS=False,
+        )
+        smtp.enable()
+        self.addCleanup(smtp.disable)
+
+    def enviar(self):
+        call_command('enviar_emails', lote=2, stdout=StringIO())
+
+    def test_envia_lotes_numa_ligacao(self):
+        for i in range(5):
+            correio.enfileirar(f'Assunto {i}', 'corpo', f'u{i}@exemplo.pt')
+        self.enviar()
+        self.assertEqual(len(self.servidor.mensagens), 5)
+        self.assertEqual(self.servidor.ligacoes, 1)
+        self.assertFalse(EmailPendente.objects.exists())
+
+    def test_recusado_volta_a_tentar_mais_tarde(self):
+        self.servidor.recusar = ['mau@exemplo.pt']
+        correio.enfileirar('Assunto', 'corpo', 'mau@exemplo.pt')
+        correio.enfileirar('Assunto', 'corpo', 'bom@exemplo.pt')
+        self.enviar()
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.destinatario, 'mau@exemplo.pt')
+        self.assertEqual(email.tentativas, 1)
+        self.assertGreater(email.proxima_tentativa, timezone.now())
+        self.assertIn('SMTPRecipientsRefused', email.erro)
+        self.assertEqual(len(self.servidor.mensagens), 1)
+        # Not due yet
+        self.enviar()
+        self.assertEqual(EmailPendente.objects.get().tentativas, 1)
+
+    def test_recuperar_password_nao_envia_no_pedido(self):
+        User.objects.create(username='ana', email='ana@exemplo.pt')
+        self.client.post('/recuperar-password/', {'email': 'ana@exemplo.pt'})
+        self.assertEqual(self.servidor.ligacoes, 0)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(EmailPendente.objects.get().destinatario, 'ana@exemplo.pt')
+
+
+class ExportarImportarTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.client.force_login(self.user)
+
+    def importar(self, nome, conteudo):
+        # Cached access records are dropped on commit (compras.signals)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/importar/', {'ficheiro': SimpleUploadedFile(nome, conteudo.encode('utf-8-sig'))},
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            ).json()
+
+    def exportar(self, formato):
+        resposta = self.client.get(f'/exportar/?formato={formato}')
+
+        async def ler():
+            return b''.join([parte async for parte in resposta]).decode()
+
+        return async_to_sync(ler)()
+
+    def test_exportar_em_asgi_pagina_a_pagina(self):
+        lista = Lista.objects.create(nome='Casa', dono=self.user)
+        Artigo.objects.bulk_create(Artigo(lista=lista, nome=f'a{i}', comprar=True) for i in range(5))
+        sessao = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        async def pedir():
+            tarefa, mensagens = await abrir_asgi(Handler(), '/exportar/?formato=ndjson', sessao)
+            partes = [await asyncio.wait_for(mensagens.get(), 5)]
+            while partes[-1]['type'] == 'http.response.start' or partes[-1].get('more_body'):
+                partes.append(await asyncio.wait_for(mensagens.get(), 5))
+            await tarefa
+            return partes
+
+        with mock.patch.object(transferencia, 'LOTE', 2), warnings.catch_warnings(record=True) as avisos:
+            warnings.simplefilter('always')
+            inicio, *corpo = async_to_sync(pedir)()
+        self.assertEqual(inicio['status'], 200)
+        # Sent as read, a page per part, not collected into a list first
+        self.assertFalse([aviso for aviso in avisos if 'StreamingHttpResponse' in str(aviso.message)])
+        paginas = [parte['body'].decode() for parte in corpo if parte.get('body')]
+        self.assertEqual([pagina.count('\n') for pagina in paginas], [2, 2, 1])
+        self.assertEqual(
+            [json.loads(linha)['nome'] for linha in ''.join(paginas).splitlines()], [f'a{i}' for i in range(5)],
+        )
+
+    def test_ida_e_volta(self):
+        resposta = self.importar(
+            'folha.csv',
+            'lista;nome;quantidade;seccao\nCasa;=SOMA(A1);2x;comprar\nCasa;leite;1 L;despensa\n;;;\nCasa;pão;;\n',
+        )
+        self.assertEqual((resposta['artigos'], resposta['listas']), (3, 1))
+        exportado = self.exportar('csv')
+        self.assertIn("'=SOMA(A1)", exportado)
+        # Importing the export rebuilds the same sections in the same order
+        with self.captureOnCommitCallbacks(execute=True):
+            Lista.objects.filter(dono=self.user).delete()
+        self.assertEqual(self.importar('listas.csv', exportado.lstrip('\ufeff'))['artigos'], 3)
+        self.assertEqual(self.exportar('csv'), exportado)
+        self.assertEqual(
+            [json.loads(linha) for linha in self.exportar('ndjson').splitlines()][0],
+            {'lista': 'Casa', 'nome': '=SOMA(A1)', 'quantidade': '2x', 'seccao': 'comprar'},
+        )
+
+    def test_ficheiro_invalido_nao_importa_nada(self):
+        resposta = self.importar('a.ndjson', '{"lista": "Casa", "nome": "leite"}\n{"nome": "ovos", "seccao": "?"}\n')
+        self.assertFalse(resposta['ok'])
+        self.assertIn('Linha 2', resposta['msg'])
+        self.assertFalse(Lista.objects.exists())
+
+
+# Link pages read from the replica, which never sees the data of a TestCase
+@override_settings(REPLICA_VISTAS=[])
+class PaginasArtigosTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=user)
+        Artigo.objects.bulk_create([Artigo(lista=self.lista, nome=f'a{n}') for n in range(5)])
+        Artigo.objects.create(lista=self.lista, nome='leite', comprar=True)
+        # Ties on movido_em: the keyset must break them by id
+        Artigo.objects.update(movido_em=timezone.now())
+        self.despensa = list(self.lista.artigos.filter(comprar=False).values_list('pk', flat=True))
+        link = LinkPartilha.objects.create(lista=self.lista, expira_em=timezone.now() + timedelta(days=1))
+        self.link = f'/link/{tokens.token_publico(link)}'
+        self.client.force_login(user)
+        paginas = mock.patch.object(views, 'PAGINA_ARTIGOS', 2)
+        paginas.start()
+        self.addCleanup(paginas.stop)
+
+    def percorrer(self, pagina, url_seguinte):
+        """Ids of the pantry section: first page in ``pagina``, the rest fetched page by page."""
+        seccao = pagina.split('id="listaDespensa"')[1]
+        ids = [int(pk) for pk in re.findall(r'data-id="(\d+)"', seccao.split('</ul>')[0])]
+        depois = re.search(r'data-seccao="despensa"[^>]*data-depois="([^"]+)"', seccao)
+        depois = depois and depois[1]
+        while depois:
+            dados = self.client.get(url_seguinte, {'seccao': 'despensa', 'depois': depois}).json()
+            ids += [int(pk) for pk in re.findall(r'data-id="(\d+)"', dados['html'])]
+            depois = dados['depois']
+        return ids
+
+    def test_paginas_percorrem_a_seccao_pela_ordem(self):
+        indice = self.client.get('/').content.decode()
+        self.assertIn('<span class="count" id="countDespensa">5</span>', indice)
+        self.assertEqual(self.percorrer(indice, f'/lista/{self.lista.pk}/artigos/'), self.despensa)
+        pagina_link = self.client.get(f'{self.link}/').content.decode()
+        self.assertEqual(self.percorrer(pagina_link, f'{self.link}/artigos/'), self.despensa)
+
+    def test_primeira_pagina_nao_cresce_com_a_lista(self):
+        with CaptureQueriesContext(connection) as poucos:
+            self.client.get(f'{self.link}/')
+        Artigo.objects.bulk_create([Artigo(lista=self.lista, nome=f'b{n}') for n in range(300)])
+        cache.clear()
+        with CaptureQueriesContext(connection) as muitos:
+            resposta = self.client.get(f'{self.link}/')
+        self.assertEqual(len(muitos), len(poucos))
+        self.assertEqual(resposta.content.decode().count('class="item despensa-item"'), 2)
+
+    def test_pedido_invalido(self):
+        url = f'/lista/{self.lista.pk}/artigos/'
+        for parametros in ({'seccao': 'outra'}, {'seccao': 'despensa', 'depois': 'x_1'}):
+            with self.subTest(**parametros):
+                self.assertEqual(self.client.get(url, parametros).status_code, 400)
+
+
+class PesquisaTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        rui = User.objects.create(username='rui')
+        self.casa = Lista.objects.create(nome='Casa', dono=self.user)
+        self.praia = Lista.objects.create(nome='Praia', dono=rui)
+        ListaPartilha.objects.create(lista=self.praia, utilizador=self.user)
+        alheia = Lista.objects.create(nome='Rui', dono=rui)
+        for lista, nome in (
+            (self.casa, 'Pão de forma'), (self.casa, 'empadas'), (self.praia, 'pão ralado'),
+            (self.praia, 'papaia'), (alheia, 'pão'),
+        ):
+            Artigo.objects.create(lista=lista, nome=nome)
+        self.client.force_login(self.user)
+
+    def procurar(self, termo):
+        dados = self.client.get('/procurar/', {'q': termo}).json()
+        return [(grupo['nome'], [a['nome'] for a in grupo['artigos']]) for grupo in dados['listas']], dados['mais']
+
+    def test_sem_acentos_nem_maiusculas_em_todas_as_listas(self):
+        self.assertEqual(self.procurar('PAO'), ([('Casa', ['Pão de forma']), ('Praia', ['pão ralado'])], False))
+
+    def test_prefixos_primeiro(self):
+        self.assertEqual(
+            self.procurar('pa'),
+            ([('Casa', ['Pão de forma', 'empadas']), ('Praia', ['pão ralado', 'papaia'])], False),
+        )
+        self.assertEqual(self.procurar('forma'), ([('Casa', ['Pão de forma'])], False))
+
+    def test_uma_letra_so_prefixos(self):
+        self.assertEqual(self.procurar('e'), ([('Casa', ['empadas'])], False))
+
+    def test_limite_de_resultados(self):
+        with mock.patch.object(views, 'PESQUISA_MAX', 1):
+            self.assertEqual(self.procurar('pa'), ([('Casa', ['Pão de forma'])], True))
+
+
+@override_settings(REPLICA_VISTAS=[])
+class SugestoesTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The LRU outlives the rolled-back rows of each test
+        lru = mock.patch.object(sugestoes, '_cache', sugestoes._LRU(64, 30))
+        lru.start()
+        self.addCleanup(lru.stop)
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        self.client.force_login(self.user)
+        self.client.get('/')  # makes the list active
+
+    def sugerir(self, termo, url='/sugestoes/'):
+        return [(s['nome'], s['quantidade']) for s in self.client.get(url, {'q': termo}).json()['sugestoes']]
+
+    def test_mais_usadas_primeiro_com_a_ultima_quantidade(self):
+        for nome, quantidade in (('leite', '1'), ('Leitão', '1'), ('LEITE', '2 L'), ('pão', '1')):
+            self.client.post('/adicionar/', {'nome': nome, 'quantidade': quantidade})
+        self.assertEqual(self.sugerir('lei'), [('LEITE', '2 L'), ('Leitão', '1')])
+        leitao = self.lista.artigos.get(nome='Leitão')
+        for _ in range(2):
+            self.client.post(f'/editar/{leitao.pk}/', {'nome': 'leitão', 'quantidade': '3x'})
+        self.assertEqual(self.sugerir('LEI'), [('leitão', '3x'), ('LEITE', '2 L')])
+
+    def test_consulta_repetida_sem_sql(self):
+        self.client.post('/adicionar/', {'nome': 'leite'})
+        self.assertEqual(sugestoes.sugerir(self.lista.pk, self.user.pk, 'le'), [{'nome': 'leite', 'quantidade': '1'}])
+        with self.assertNumQueries(0):
+            sugestoes.sugerir(self.lista.pk, self.user.pk, 'le')
+
+    def test_link_so_com_permissao_de_adicionar(self):
+        self.client.post('/adicionar/', {'nome': 'leite'})
+        link = LinkPartilha.objects.create(lista=self.lista, expira_em=timezone.now() + timedelta(days=1))
+        url = f'/link/{tokens.token_publico(link)}/sugestoes/'
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {'q': 'le'}).status_code, 404)
+        link = LinkPartilha.objects.create(
+            lista=self.lista, expira_em=timezone.now() + timedelta(days=1), pode_adicionar=True,
+        )
+        self.assertEqual(self.sugerir('le', f'/link/{tokens.token_publico(link)}/sugestoes/'), [('leite', '1')])
+
+
+class ClonarListaTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        self.client.force_login(self.user)
+
+    def clonar(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(f'/lista/{self.lista.pk}/clonar/')
+        return Lista.objects.filter(dono=self.user).latest('pk'), len(consultas)
+
+    def test_copia_artigos_com_nome_livre(self):
+        for nome in ('Casa (cópia)', 'Casa (cópia) 2', 'Casa (cópia) 4'):
+            Lista.objects.create(nome=nome, dono=self.user)
+        Artigo.objects.create(lista=self.lista, nome='leite', quantidade='2x', comprar=True)
+        Artigo.objects.create(lista=self.lista, nome='ovos', quantidade='meia dúzia')
+        copia, _ = self.clonar()
+        self.assertEqual(copia.nome, 'Casa (cópia) 3')
+        self.assertEqual(
+            [(a.nome, a.quantidade, a.comprar) for a in copia.artigos.order_by('pk')],
+            [('leite', '2x', True), ('ovos', 'meia dúzia', False)],
+        )
+        self.assertEqual(self.client.session['lista_ativa'], copia.pk)
+
+    def test_consultas_nao_crescem_com_artigos(self):
+        Artigo.objects.bulk_create([Artigo(lista=self.lista, nome=f'a{n}') for n in range(3)])
+        _, poucos = self.clonar()
+        Artigo.objects.bulk_create([Artigo(lista=self.lista, nome=f'b{n}') for n in range(500)])
+        copia, muitos = self.clonar()
+        self.assertEqual(muitos, poucos)
+        self.assertEqual(copia.artigos.count(), 503)
+
+
+class ColarLinhasTests(CacheIsoladoTestCase):
+
+    def test_bloco_colado_num_so_insert(self):
+        user = User.objects.create(username='ana')
+        lista = Lista.objects.create(nome='Casa', dono=user)
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.post(
+                '/adicionar/', {'linhas': '2x leite\n- pão\n\n500 g farinha\nLeite 1x\n'},
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertTrue(resposta.json()['ok'])
+        inserts = [
+            q['sql'] for q in consultas.captured_queries
+            if q['sql'].startswith('INSERT INTO') and q['sql'].split()[2].strip('"`') == 'compras_artigo'
+        ]
+        self.assertEqual(len(inserts), 1)
+        # Duplicates collapsed, first line on top
+        self.assertEqual(
+            [artigo.quantidade + ' ' + artigo.nome for artigo in lista.artigos.all()],
+            ['3x leite', '1 pão', '500 g farinha'],
+        )
+
+
+class QuantidadeTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        self.artigo = Artigo.objects.create(lista=self.lista, nome='leite', quantidade='2x')
+        self.client.force_login(self.user)
+
+    def tocar(self, direcao, artigo=None):
+        self.client.post(f'/quantidade/{(artigo or self.artigo).pk}/{direcao}/')
+
+    def test_mais_e_menos_nunca_abaixo_de_um(self):
+        quantidades = []
+        for direcao in ('mais', 'menos', 'menos', 'menos'):
+            self.tocar(direcao)
+            self.artigo.refresh_from_db()
+            quantidades.append(self.artigo.quantidade)
+        self.assertEqual(quantidades, ['3x', '2x', '1x', '1x'])
+
+    def test_mover_e_editar_nao_desfazem_incremento(self):
+        # Each read before a concurrent +1 landed, then saved after it
+        for guardar in (
+            lambda artigo: views._mover(artigo, 'despensa') or views._guardar_artigo(artigo, ['comprar']),
+            lambda artigo: setattr(artigo, 'nome', 'leite magro') or views._guardar_artigo(artigo, ['nome']),
+        ):
+            lido = Artigo.objects.get(pk=self.artigo.pk)
+            antes = lido.qtd
+            self.tocar('mais')
+            guardar(lido)
+            self.artigo.refresh_from_db()
+            self.assertEqual(self.artigo.qtd, antes + 1)
+        self.assertEqual((self.artigo.nome, self.artigo.comprar), ('leite magro', False))
+
+    def test_quantidade_sem_numero_fica_como_escrita(self):
+        artigo = Artigo.objects.create(lista=self.lista, nome='ovos', quantidade='meia dúzia')
+        self.tocar('mais', artigo)
+        artigo.refresh_from_db()
+        self.assertEqual(artigo.quantidade, 'meia dúzia')
+        self.client.post(f'/editar/{artigo.pk}/', {'nome': 'ovos', 'quantidade': '6'})
+        self.tocar('mais', artigo)
+        artigo.refresh_from_db()
+        self.assertEqual(artigo.quantidade, '7')
+
+
+class MigracaoQuantidadeTests(TransactionTestCase):
+    """Backfill of qtd/unidade from the old free-text quantidade (0007)."""
+
+    antes = [('compras', '0006_artigo_revisao_artigoapagado')]
+    depois = [('compras', '0007_artigo_qtd_unidade')]
+
+    def migrar(self, alvo):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(alvo)
+        return executor.loader.project_state(alvo).apps
+
+    def tearDown(self):
+        self.migrar(MigrationExecutor(connection).loader.graph.leaf_nodes('compras'))
+        super().tearDown()
+
+    def test_preenche_qtd_e_unidade(self):
+        apps = self.migrar(self.antes)
+        Lista = apps.get_model('compras', 'Lista')
+        Artigo = apps.get_model('compras', 'Artigo')
+        dono = apps.get_model('auth', 'User').objects.create(username='ana')
+        lista = Lista.objects.create(nome='Casa', dono=dono)
+        escritas = ['1x', '2', '1,5 L', '500g', 'meia dúzia', '']
+        for quantidade in escritas:
+            Artigo.objects.create(lista=lista, nome='x', quantidade=quantidade)
+        apps = self.migrar(self.depois)
+        artigos = apps.get_model('compras', 'Artigo').objects.order_by('pk')
+        self.assertEqual(
+            [(artigo.qtd, artigo.unidade) for artigo in artigos],
+            [(1, 'x'), (2, ''), (Decimal('1.5'), ' L'), (500, 'g'), (None, 'meia dúzia'), (1, '')],
+        )
+        self.assertEqual(
+            [formatar_quantidade(artigo.qtd, artigo.unidade) for artigo in artigos],
+            ['1x', '2', '1.5 L', '500g', 'meia dúzia', '1'],
+        )
+
+
+class SincronizarTests(CacheIsoladoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        self.artigo = Artigo.objects.create(lista=self.lista, nome='leite', quantidade='1')
+        self.client.force_login(self.user)
+
+    def sincronizar(self, operacoes, **corpo):
+        return self.client.post(
+            '/sincronizar/', json.dumps({'lista': self.lista.pk, 'operacoes': operacoes, **corpo}),
+            content_type='application/json',
+        )
+
+    def test_fila_reenviada_aplica_uma_vez(self):
+        mais = {'op': 'quantidade', 'id': self.artigo.pk, 'direcao': 'mais'}
+        fila = [{'op_id': 'a', **mais}, {'op_id': 'b', 'op': 'adicionar', 'nome': 'pão'}]
+        primeira = self.sincronizar(fila).json()['resultados']
+        # The answer was lost: the queue is sent again, grown meanwhile
+        segunda = self.sincronizar(fila + [{'op_id': 'c', **mais}, {'op_id': 'c', **mais}]).json()['resultados']
+        self.assertEqual(segunda[:2], [{**resultado, 'repetida': True} for resultado in primeira])
+        self.assertEqual([r.get('repetida', False) for r in segunda[2:]], [False, True])
+        self.artigo.refresh_from_db()
+        self.assertEqual(self.artigo.quantidade, '3')
+        self.assertEqual(self.lista.artigos.count(), 2)
+
+    def test_pedido_invalido(self):
+        self.assertEqual(self.sincronizar([{'op': 'apagar', 'id': self.artigo.pk}]).status_code, 400)
+        self.assertEqual(self.sincronizar([{'op_id': 'a', 'op': 'apagar', 'id': self.artigo.pk}], lista=None).status_code, 403)
+        self.assertTrue(Artigo.objects.filter(pk=self.artigo.pk).exists())
+
+    def test_campos_de_tipo_errado(self):
+        for op in (
+            {'op_id': ['x'], 'op': 'apagar', 'id': self.artigo.pk},
+            {'op_id': 'a', 'op': 'apagar', 'id': [self.artigo.pk]},
+            {'op_id': 'a', 'op': 'apagar', 'id': True},
+            {'op_id': 'a', 'op': 'adicionar', 'nome': 'pão', 'quantidade': None},
+            {'op_id': 'a', 'op': 'editar', 'id': self.artigo.pk, 'nome': 5},
+        ):
+            with self.subTest(op=op):
+                self.assertEqual(self.sincronizar([op]).status_code, 400)
+                self.assertEqual(self.client.post(
+                    '/lote/', json.dumps({'lista': self.lista.pk, 'operacoes': [op]}), content_type='application/json',
+                ).status_code, 400)
+        self.assertEqual([(a.nome, a.quantidade) for a in self.lista.artigos.all()], [('leite', '1')])
+
+    def test_lote_sem_alteracoes_mantem_revisao(self):
+        fila = [{'op_id': 'a', 'op': 'quantidade', 'id': self.artigo.pk, 'direcao': 'mais'}]
+        rev = self.sincronizar(fila).json()['rev']
+        self.assertEqual(self.sincronizar(fila).json()['rev'], rev)
+        self.assertEqual(self.sincronizar([{'op_id': 'b', 'op': 'voar'}]).json()['rev'], rev)
+        self.lista.refresh_from_db()
+        self.assertEqual(self.lista.revisao, rev)
+
+    def test_link_so_aplica_operacoes_permitidas(self):
+        self.lista.refresh_from_db()
+        rev = self.lista.revisao
+        link = LinkPartilha.objects.create(
+            lista=self.lista, expira_em=timezone.now() + timedelta(hours=1), pode_toggle=True,
+        )
+        operacoes = [
+            {'op': 'adicionar', 'nome': 'pão'},
+            {'op': 'editar', 'id': self.artigo.pk, 'nome': 'natas'},
+            {'op': 'quantidade', 'id': self.artigo.pk, 'direcao': 'mais'},
+            {'op': 'apagar', 'id': self.artigo.pk},
+            {'op': 'toggle', 'id': self.artigo.pk},
+        ]
+        self.client.logout()
+        for i, fim in enumerate(('lote', 'sincronizar')):
+            with self.subTest(vista=fim):
+                resposta = self.client.post(
+                    f'/link/{tokens.token_publico(link)}/{fim}/',
+                    json.dumps({'operacoes': [{**op, 'op_id': f'{fim}{n}'} for n, op in enumerate(operacoes)]}),
+                    content_type='application/json',
+                ).json()
+                self.assertEqual([r['ok'] for r in resposta['resultados']], [False] * 4 + [True])
+                self.assertEqual({r.get('erro') for r in resposta['resultados'][:4]}, {'Sem permissão.'})
+                # Only the move bumps the revision
+                self.assertEqual(resposta['rev'], rev + 1 + i)
+        self.artigo.refresh_from_db()
+        self.assertEqual((self.artigo.nome, self.artigo.quantidade, self.artigo.comprar), ('leite', '1', False))
+        self.assertEqual(self.lista.artigos.count(), 1)
+
+    def test_lista_so_de_quem_a_partilha(self):
+        self.client.force_login(User.objects.create(username='rui'))
+        apagar = [{'op_id': 'a', 'op': 'apagar', 'id': self.artigo.pk}]
+        self.assertEqual(self.sincronizar(apagar).status_code, 403)
+        self.assertEqual(self.client.post(
+            '/lote/', json.dumps({'lista': self.lista.pk, 'operacoes': apagar}), content_type='application/json',
+        ).status_code, 403)
+        self.assertTrue(Artigo.objects.filter(pk=self.artigo.pk).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            ListaPartilha.objects.create(lista=self.lista, utilizador=User.objects.get(username='rui'))
+        self.assertEqual(self.sincronizar(apagar).json()['resultados'], [{'ok': True, 'id': self.artigo.pk}])
+        self.assertFalse(Artigo.objects.filter(pk=self.artigo.pk).exists())
+
+    def test_service_worker_na_raiz(self):
+        resposta = self.client.get('/sw.js')
+        self.assertEqual(resposta['Content-Type'], 'text/javascript; charset=utf-8')
+        self.assertIn(static('compras/js/offline.js'), resposta.content.decode())
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'eventos'}},
+    STORAGES=STORAGES_TESTES,
+    EVENTOS_BACKEND='compras.eventos.MemoriaBackend',
+    REPLICA_VISTAS=[],
+)
+class EventosTests(TransactionTestCase):
+    """Event streams through the ASGI handler of lista_compras.asgi, as uvicorn runs them."""
+
+    def setUp(self):
+        patcher = mock.patch.object(eventos, '_backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = Handler()
+        self.user = User.objects.create(username='ana')
+        self.lista = Lista.objects.create(nome='Casa', dono=self.user)
+        link = LinkPartilha.objects.create(
+            lista=self.lista, expira_em=timezone.now() + timedelta(hours=1), pode_toggle=True,
+        )
+        self.url_link = f'/link/{tokens.token_publico(link)}/eventos/'
+
+    async def abrir(self, caminho, cookies=''):
+        return await abrir_asgi(self.app, caminho, cookies)
+
+    async def ler(self, mensagens):
+        """Next body part of a stream, as text."""
+        mensagem = await asyncio.wait_for(mensagens.get(), 5)
+        return mensagem['body'].decode()
+
+    def estado(self, parte):
+        evento, dados = parte.strip().split('\n')
+        self.assertEqual(evento, 'event: estado')
+        return json.loads(dados.removeprefix('data: '))
+
+    async def test_link_recebe_cada_revisao(self):
+        rev = self.lista.revisao
+        tarefa, mensagens = await self.abrir(self.url_link)
+        try:
+            inicio = await asyncio.wait_for(mensagens.get(), 5)
+            self.assertEqual(inicio['status'], 200)
+            self.assertIn((b'Content-Type', b'text/event-stream'), inicio['headers'])
+            self.assertEqual(await self.ler(mensagens), 'retry: 3000\n\n')
+            self.assertEqual(self.estado(await self.ler(mensagens)), {'rev': rev})
+            await sync_to_async(views._tocar_lista)(self.lista.pk)
+            self.assertEqual(self.estado(await self.ler(mensagens)), {'rev': rev + 1})
+        finally:
+            tarefa.cancel()
+
+    async def test_utilizador_recebe_lista_ativa(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        sessao = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        tarefa, mensagens = await self.abrir('/eventos/', sessao)
+        try:
+            inicio = await asyncio.wait_for(mensagens.get(), 5)
+            self.assertEqual(inicio['status'], 200)
+            # Counted by MetricasMiddleware, though they ran in sync_to_async threads
+            self.assertNotIn(b'"0 queries"', dict(inicio['headers'])[b'Server-Timing'])
+            await self.ler(mensagens)
+            estado = self.estado(await self.ler(mensagens))
+            self.assertEqual((estado['lista'], estado['rev']), (self.lista.pk, self.lista.revisao))
+            await sync_to_async(views._tocar_lista)(self.lista.pk)
+            self.assertEqual(self.estado(await self.ler(mensagens))['rev'], self.lista.revisao + 1)
+        finally:
+            tarefa.cancel()
+
+    async def test_sem_sessao(self):
+        tarefa, mensagens = await self.abrir('/eventos/')
+        self.assertEqual((await asyncio.wait_for(mensagens.get(), 5))['status'], 401)
+        await tarefa
+
+    def test_streams_abertos_nao_ocupam_threads(self):
+        # In an event loop of its own, as under uvicorn: inside async_to_sync
+        # (async tests) thread-sensitive calls would all run in this thread
+        asyncio.run(self.streams_abertos())
+
+    async def streams_abertos(self):
+        antes = threading.active_count()
+        abertos = [await self.abrir(self.url_link) for _ in range(20)]
+        try:
+            for _, mensagens in abertos:
+                await asyncio.wait_for(mensagens.get(), 5)
+                await self.ler(mensagens)
+                await self.ler(mensagens)
+            # At most the shared sync_to_async thread, not one per stream
+            self.assertLessEqual(threading.active_count(), antes + 1)
+        finally:
+            for tarefa, _ in abertos:
+                tarefa.cancel()
+
+
+class FanOutTests(TransactionTestCase):
+    """The backends of compras.eventos, without any stream."""
+
+    async def test_publicar_de_outra_thread_acorda_todos(self):
+        backend = eventos.MemoriaBackend()
+        backend.publicar('lista:1', 3)
+        esperas = [backend.esperar({'lista:1': 3}, timeout=5) for _ in range(3)]
+        threading.Timer(0.05, backend.publicar, ('lista:1', 4)).start()
+        self.assertEqual(await asyncio.gather(*esperas), [{'lista:1': 4}] * 3)
+
+    async def test_revisao_antiga_ou_outro_canal_nao_acorda(self):
+        backend = eventos.MemoriaBackend()
+        backend.publicar('lista:1', 3)
+        threading.Timer(0.05, backend.publicar, ('lista:1', 2)).start()
+        threading.Timer(0.05, backend.publicar, ('lista:2', 9)).start()
+        self.assertEqual(await backend.esperar({'lista:1': 3}, timeout=0.3), {})
+        # Already past the revision the subscriber knows: no wait at all
+        self.assertEqual(await backend.esperar({'lista:1': 1, 'lista:2': 9}, timeout=0), {'lista:1': 3})
+
+    @override_settings(EVENTOS_CANAIS_INATIVOS=2)
+    async def test_so_lembra_os_canais_inativos_mais_recentes(self):
+        backend = eventos.MemoriaBackend()
+        backend.publicar('lista:1', 1)
+        espera = asyncio.ensure_future(backend.esperar({'lista:1': 1}, timeout=5))
+        await asyncio.sleep(0)
+        for pk in range(2, 12):
+            backend.publicar(f'lista:{pk}', 1)
+        self.assertEqual(set(backend._revisoes), {'lista:1', 'lista:10', 'lista:11'})
+        backend.publicar('lista:1', 2)
+        self.assertEqual(await espera, {'lista:1': 2})
+        # Published between two waits of a stream: still seen by the next one
+        backend.publicar('lista:1', 3)
+        self.assertEqual(await backend.esperar({'lista:1': 2}, timeout=0), {'lista:1': 3})
+        self.assertEqual(set(backend._revisoes), {'lista:1', 'lista:11'})
+
+    @override_settings(EVENTOS_INTERVALO=0.05)
+    async def test_base_de_dados_ve_escritas_de_outros_processos(self):
+        user = await User.objects.acreate(username='ana')
+        lista = await Lista.objects.acreate(nome='Casa', dono=user)
+        backend = eventos.BaseDadosBackend()
+        canal = eventos.canal_lista(lista.pk)
+        backend.publicar(canal, lista.revisao)  # as the stream views do
+        # Written without publishing, as another worker would
+        threading.Timer(0.1, Lista.objects.filter(pk=lista.pk).update, kwargs={'revisao': 7}).start()
+        self.assertEqual(await backend.esperar({canal: lista.revisao}, timeout=5), {canal: 7})
+
+
+# Own cache, so primary pins left by other tests don't leak in
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'replica'}},
+    STORAGES=STORAGES_TESTES,
+)
+class ReplicaTests(TransactionTestCase):
+    # The replica mirrors the test database; it only sees committed rows
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # Without DB_REPLICA_HOST, a second connection to the test database
+        # stands in for the replica, as TEST['MIRROR'] would make it
+        if replicas.REPLICA not in connections:
+            primario = connections[DEFAULT_DB_ALIAS].settings_dict
+            connections.settings[replicas.REPLICA] = {
+                **primario, 'TEST': {**primario['TEST'], 'MIRROR': DEFAULT_DB_ALIAS},
+            }
+            cls.addClassCleanup(cls.remover_replica)
+        super().setUpClass()
+
+    @staticmethod
+    def remover_replica():
+        connections[replicas.REPLICA].close()
+        del connections[replicas.REPLICA]
+        del connections.settings[replicas.REPLICA]
+
+    def test_quem_escreveu_le_do_primario(self):
+        user = User.objects.create(username='ana')
+        Lista.objects.create(nome='Casa', dono=user)
+        self.client.force_login(user)
+        self.client.get('/check_updates/')
+        with CaptureQueriesContext(connections[replicas.REPLICA]) as replica:
+            self.client.get('/check_updates/')
+        self.assertTrue(replica.captured_queries)
+        self.client.post('/adicionar/', {'nome': 'leite'})
+        with CaptureQueriesContext(connections[replicas.REPLICA]) as replica:
+            self.client.get('/check_updates/')
+        self.assertFalse(replica.captured_queries)
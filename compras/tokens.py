@@ -0,0 +1,83 @@
+"""
+Signed share-link tokens.
+
+A signed token carries the link id, list id, expiry and permission bits:
+
+    <link>.<lista>.<expira>.<permissoes>:<assinatura HMAC>
+
+so expired or forged tokens are rejected without touching the database.
+The original UUID tokens keep working; both formats share the ``token``
+path converter registered in compras/urls.py.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+
+PERMISSOES = ('pode_adicionar', 'pode_editar', 'pode_apagar', 'pode_toggle')
+
+_signer = signing.Signer(salt='compras.links')
+
+
+class TokenLinkConverter:
+    """Match either a UUID token or a signed token."""
+    regex = (
+        r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+        r'|\d+\.\d+\.\d+\.\d+:[A-Za-z0-9_-]+'
+    )
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return str(value)
+
+
+def _permissoes(link):
+    return sum(1 << i for i, nome in enumerate(PERMISSOES) if getattr(link, nome))
+
+
+def assinar(link):
+    """Build the signed token for a LinkPartilha."""
+    expira = int(link.expira_em.timestamp())
+    return _signer.sign(f'{link.pk}.{link.lista_id}.{expira}.{_permissoes(link)}')
+
+
+def token_publico(link):
+    """Token to put in public URLs: signed when LINKS_ASSINADOS is on, else the UUID."""
+    if getattr(settings, 'LINKS_ASSINADOS', False):
+        return assinar(link)
+    return str(link.token)
+
+
+def chave_cache(link_pk):
+    """Cache key of a LinkPartilha resolved from a signed token."""
+    return f'compras:link:{link_pk}'
+
+
+def e_assinado(token):
+    return ':' in str(token)
+
+
+def verificar(token):
+    """
+    Check signature and expiry of a signed token, in pure CPU.
+    Return {'link', 'lista', 'expira', 'permissoes'} or None if invalid.
+    """
+    try:
+        valor = _signer.unsign(token)
+        link, lista, expira, permissoes = (int(parte) for parte in valor.split('.'))
+    except (signing.BadSignature, ValueError):
+        return None
+    if expira <= time.time():
+        return None
+    return {'link': link, 'lista': lista, 'expira': expira, 'permissoes': permissoes}
+
+
+def corresponde(dados, link):
+    """Check that a verified token still describes the given link."""
+    return (
+        dados['lista'] == link.lista_id
+        and dados['expira'] == int(link.expira_em.timestamp())
+        and dados['permissoes'] == _permissoes(link)
+    )
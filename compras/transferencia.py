@@ -0,0 +1,165 @@
+"""
+Export and import of lists as CSV or NDJSON, one item per row with the
+fields lista, nome, quantidade and seccao ('comprar' or 'despensa').
+
+exportar() is an async generator that yields the file a chunk at a time:
+lists one after another, their items read by keyset in pages of LOTE, each
+page fetched through sync_to_async. Under ASGI Django would read a sync
+iterator to the end before sending anything, and MySQL drivers buffer whole
+result sets, so neither a sync generator nor .iterator() keeps memory flat. Items come oldest
+first, so importing an export rebuilds each section in the same order (the
+newest item of a section is shown at the top).
+
+ler() parses an upload row by row from the (possibly on-disk) file, and
+em_lotes() groups the rows, so an import never holds the whole file either.
+"""
+import codecs
+import csv
+import io
+import json
+from itertools import chain, islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Artigo, formatar_quantidade
+
+CAMPOS = ('lista', 'nome', 'quantidade', 'seccao')
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+# Items per query when exporting, and per INSERT when importing
+LOTE = 1000
+
+SECCOES = {'comprar': True, 'despensa': False}
+# Cells spreadsheets would run as formulas get a leading apostrophe
+FORMULA = ('=', '+', '-', '@')
+
+
+class FicheiroInvalido(ValueError):
+    """The upload can't be imported; the message is shown to the user."""
+
+
+# ── Export ───────────────────────────────────────────────────────
+
+def _pagina(lista_id, comprar, ultimo):
+    """(nome, qtd, unidade, movido_em, pk) of up to LOTE items of a section after ``ultimo``, oldest first."""
+    artigos = Artigo.objects.filter(lista_id=lista_id, comprar=comprar).order_by('movido_em', 'id')
+    if ultimo is not None:
+        movido_em, pk = ultimo
+        artigos = artigos.filter(movido_em__gte=movido_em).exclude(movido_em=movido_em, pk__lte=pk)
+    return list(artigos.values_list('nome', 'qtd', 'unidade', 'movido_em', 'pk')[:LOTE])
+
+
+async def _paginas(lista_id):
+    """Pages of (nome, qtd, unidade, comprar) of one list, section by section, oldest first."""
+    for comprar in (True, False):
+        ultimo = None
+        while True:
+            pagina = await sync_to_async(_pagina)(lista_id, comprar, ultimo)
+            if pagina:
+                yield [(nome, qtd, unidade, comprar) for nome, qtd, unidade, _, _ in pagina]
+            if len(pagina) < LOTE:
+                break
+            ultimo = pagina[-1][3:]
+
+
+def _celula(texto):
+    return f"'{texto}" if texto.startswith(FORMULA) else texto
+
+
+def _csv(linhas):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(linhas)
+    return buffer.getvalue()
+
+
+async def exportar(listas, formato):
+    """Yield the export of ``listas`` ((pk, nome) pairs) in ``formato``, a page of items per chunk."""
+    if formato == 'csv':
+        # The BOM makes spreadsheet programs read the file as UTF-8
+        yield '\ufeff' + _csv([CAMPOS])
+    for lista_id, nome_lista in listas:
+        async for pagina in _paginas(lista_id):
+            linhas = [
+                (nome_lista, nome, formatar_quantidade(qtd, unidade), 'comprar' if comprar else 'despensa')
+                for nome, qtd, unidade, comprar in pagina
+            ]
+            if formato == 'csv':
+                yield _csv([[_celula(campo) for campo in linha] for linha in linhas])
+            else:
+                yield ''.join(
+                    json.dumps(dict(zip(CAMPOS, linha)), ensure_ascii=False) + '\n' for linha in linhas
+                )
+
+
+# ── Import ───────────────────────────────────────────────────────
+
+def formato_de(nome_ficheiro):
+    """Format from the file extension: .ndjson/.jsonl/.json are NDJSON, anything else CSV."""
+    return 'ndjson' if nome_ficheiro.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def _linhas_csv(texto):
+    primeira = texto.readline()
+    # Spreadsheets set to Portuguese save CSV with semicolons
+    separador = ';' if primeira.count(';') > primeira.count(',') else ','
+    leitor = csv.reader(chain([primeira], texto), delimiter=separador)
+    cabecalho = [campo.strip().lower() for campo in next(leitor, [])]
+    if 'nome' not in cabecalho:
+        raise FicheiroInvalido('A primeira linha do CSV tem de ter os nomes das colunas, incluindo "nome".')
+    for numero, linha in enumerate(leitor, start=2):
+        campos = dict(zip(cabecalho, linha))
+        for campo, valor in campos.items():
+            # Undo _celula
+            if valor[:1] == "'" and valor[1:].startswith(FORMULA):
+                campos[campo] = valor[1:]
+        yield numero, campos
+
+
+def _linhas_ndjson(texto):
+    for numero, linha in enumerate(texto, start=1):
+        if not linha.strip():
+            continue
+        try:
+            campos = json.loads(linha)
+        except ValueError:
+            campos = None
+        if not isinstance(campos, dict):
+            raise FicheiroInvalido(f'Linha {numero}: não é um objeto JSON.')
+        yield numero, campos
+
+
+def ler(ficheiro, formato):
+    """
+    Yield (lista, nome, quantidade, comprar) for each row of the uploaded
+    ``ficheiro``, reading it incrementally. Rows without a name are skipped;
+    lista is '' when the row doesn't name one. Raise FicheiroInvalido on the
+    first malformed row.
+    """
+    texto = codecs.getreader('utf-8-sig')(ficheiro)
+    linhas = _linhas_csv(texto) if formato == 'csv' else _linhas_ndjson(texto)
+    try:
+        for numero, campos in linhas:
+            nome = str(campos.get('nome') or '').strip()
+            if not nome:
+                continue
+            lista = str(campos.get('lista') or '').strip()
+            quantidade = str(campos.get('quantidade') or '1').strip()
+            seccao = str(campos.get('seccao') or 'comprar').strip().lower()
+            if seccao not in SECCOES:
+                raise FicheiroInvalido(f'Linha {numero}: secção "{seccao}" desconhecida (comprar ou despensa).')
+            if len(nome) > 500 or len(lista) > 200:
+                raise FicheiroInvalido(f'Linha {numero}: nome demasiado longo.')
+            yield lista, nome, quantidade, SECCOES[seccao]
+    except UnicodeDecodeError:
+        raise FicheiroInvalido('O ficheiro tem de estar em UTF-8.')
+    except csv.Error as e:
+        raise FicheiroInvalido(f'CSV inválido: {e}')
+
+
+def em_lotes(linhas, tamanho=LOTE):
+    """Lists of up to ``tamanho`` consecutive rows."""
+    linhas = iter(linhas)
+    while lote := list(islice(linhas, tamanho)):
+        yield lote
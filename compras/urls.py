@@ -1,5 +1,8 @@
-from django.urls import path
+from django.urls import path, register_converter
 from . import views
+from .tokens import TokenLinkConverter
+
+register_converter(TokenLinkConverter, 'token')
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -19,19 +22,36 @@ urlpatterns = [
     path('lista/<int:pk>/link/criar/', views.criar_link_partilha, name='criar_link_partilha'),
     path('lista/<int:pk>/link/<int:link_pk>/apagar/', views.apagar_link_partilha, name='apagar_link_partilha'),
     path('lista/<int:pk>/links/', views.listar_links_partilha, name='listar_links_partilha'),
+    path('lista/<int:pk>/artigos/', views.pagina_artigos, name='pagina_artigos'),
     path('responder-link/', views.responder_link, name='responder_link'),
     path('adicionar/', views.adicionar, name='adicionar'),
     path('editar/<int:pk>/', views.editar, name='editar'),
     path('apagar/<int:pk>/', views.apagar, name='apagar'),
     path('toggle/<int:pk>/', views.toggle, name='toggle'),
     path('quantidade/<int:pk>/<str:direcao>/', views.quantidade_update, name='quantidade_update'),
+    path('lote/', views.lote, name='lote'),
+    path('sincronizar/', views.sincronizar, name='sincronizar'),
     path('check_updates/', views.check_updates, name='check_updates'),
+    path('eventos/', views.eventos_stream, name='eventos'),
+    path('alteracoes/', views.alteracoes, name='alteracoes'),
+    path('procurar/', views.procurar, name='procurar'),
+    path('sugestoes/', views.sugerir_artigos, name='sugerir_artigos'),
+    path('exportar/', views.exportar, name='exportar'),
+    path('importar/', views.importar, name='importar'),
+    path('metricas/', views.ver_metricas, name='metricas'),
+    path('sw.js', views.service_worker, name='service_worker'),
     # Public link routes
-    path('link/<uuid:token>/', views.ver_link, name='ver_link'),
-    path('link/<uuid:token>/adicionar/', views.link_adicionar, name='link_adicionar'),
-    path('link/<uuid:token>/toggle/<int:pk>/', views.link_toggle, name='link_toggle'),
-    path('link/<uuid:token>/editar/<int:pk>/', views.link_editar, name='link_editar'),
-    path('link/<uuid:token>/apagar/<int:pk>/', views.link_apagar, name='link_apagar'),
-    path('link/<uuid:token>/quantidade/<int:pk>/<str:direcao>/', views.link_quantidade, name='link_quantidade'),
-    path('link/<uuid:token>/check_updates/', views.link_check_updates, name='link_check_updates'),
+    path('link/<token:token>/', views.ver_link, name='ver_link'),
+    path('link/<token:token>/adicionar/', views.link_adicionar, name='link_adicionar'),
+    path('link/<token:token>/toggle/<int:pk>/', views.link_toggle, name='link_toggle'),
+    path('link/<token:token>/editar/<int:pk>/', views.link_editar, name='link_editar'),
+    path('link/<token:token>/apagar/<int:pk>/', views.link_apagar, name='link_apagar'),
+    path('link/<token:token>/quantidade/<int:pk>/<str:direcao>/', views.link_quantidade, name='link_quantidade'),
+    path('link/<token:token>/lote/', views.link_lote, name='link_lote'),
+    path('link/<token:token>/sincronizar/', views.link_sincronizar, name='link_sincronizar'),
+    path('link/<token:token>/check_updates/', views.link_check_updates, name='link_check_updates'),
+    path('link/<token:token>/eventos/', views.link_eventos, name='link_eventos'),
+    path('link/<token:token>/alteracoes/', views.link_alteracoes, name='link_alteracoes'),
+    path('link/<token:token>/artigos/', views.link_pagina_artigos, name='link_pagina_artigos'),
+    path('link/<token:token>/sugestoes/', views.link_sugerir_artigos, name='link_sugerir_artigos'),
 ]
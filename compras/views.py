@@ -1,23 +1,59 @@
-import re
-from datetime import timedelta
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlsplit
+from decimal import Decimal
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth import login, logout, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.hashers import make_password
+from django.views.decorators.http import require_POST
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.conf import settings as django_settings
+from django.core.cache import cache
 from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q, Count, F, Max, Case, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
-from .models import Artigo, Lista, ListaPartilha, LinkPartilha
+from .models import (
+    Artigo, ArtigoApagado, Lista, ListaPartilha, LinkPartilha, OperacaoAplicada, RevisaoUtilizador,
+    formatar_quantidade, ler_linhas, normalizar_nome,
+)
 from .backends import HashedPasswordBackend
+from . import (
+    acessos, correio, eventos, fragmentos, metricas, replicas, senhas, sugestoes, tokens, transferencia,
+)
 
 User = get_user_model()
 
+# Rows per INSERT when cloning a list
+CLONAR_BATCH = 1000
+
+# Maximum number of operations accepted by one batch request (lote)
+LOTE_MAX = 500
+
+# Items per page of a list section; the page loads further ones on scroll
+PAGINA_ARTIGOS = getattr(django_settings, 'PAGINA_ARTIGOS', 100)
+
+# Most items returned by one search
+PESQUISA_MAX = 200
+
+# Most items, and most new lists, created by one import
+IMPORTAR_MAX = 100_000
+IMPORTAR_MAX_LISTAS = 50
+
+# Longest client-generated operation id accepted by sincronizar
+OP_ID_MAX = 64
+
 
 # ── Helpers ──────────────────────────────────────────────────────
 
@@ -30,9 +66,8 @@ def _listas_do_utilizador(user):
 
 def _lista_ativa(request):
     """Return the currently-selected list (from session) or the first available."""
-    user = request.user
     lista_id = request.session.get('lista_ativa')
-    listas = _listas_do_utilizador(user)
+    listas = Lista.objects.filter(pk__in=acessos.listas_acessiveis(request.user))
     if lista_id:
         lista = listas.filter(pk=lista_id).first()
         if lista:
@@ -43,30 +78,137 @@ def _lista_ativa(request):
     return lista
 
 
-def _pode_aceder_lista(user, lista):
-    """Check if user owns or has shared access to the list."""
-    if lista.dono == user:
-        return True
-    return lista.partilhas.filter(utilizador=user).exists()
+def _pode_aceder_lista(user, lista_id):
+    """Check if user owns or has shared access to the list (no query once cached)."""
+    return lista_id in acessos.listas_acessiveis(user)
+
+
+def _tocar_lista(lista_id):
+    """Atomically bump the list revision and return the new value."""
+    with transaction.atomic():
+        Lista.objects.filter(pk=lista_id).update(revisao=F('revisao') + 1)
+        rev = Lista.objects.filter(pk=lista_id).values_list('revisao', flat=True).first()
+        transaction.on_commit(lambda: eventos.publicar(eventos.canal_lista(lista_id), rev))
+    return rev
+
+
+def _guardar_artigo(artigo, campos=None):
+    """
+    Save the item stamped with a new revision of its list. An existing item
+    writes only ``campos``, so a concurrent +1/-1 (_incrementar_quantidade)
+    is not overwritten with the quantity read before it.
+    """
+    with transaction.atomic():
+        artigo.revisao = _tocar_lista(artigo.lista_id) or 0
+        if campos is None:
+            artigo.save()
+        else:
+            artigo.save(update_fields=[*campos, 'revisao', 'movido_em'])
+
+
+def _apagar_artigo(artigo):
+    """Delete the item, leaving a tombstone at a new revision of its list."""
+    with transaction.atomic():
+        rev = _tocar_lista(artigo.lista_id)
+        if rev is not None:
+            ArtigoApagado.objects.create(lista_id=artigo.lista_id, artigo_id=artigo.pk, revisao=rev)
+        artigo.delete()
+
+
+def _mover(artigo, destino):
+    """Move to an explicit destination (idempotent), or flip when none is given."""
+    if destino == 'despensa':
+        artigo.comprar = False
+    elif destino == 'comprar':
+        artigo.comprar = True
+    else:
+        artigo.comprar = not artigo.comprar
+
+
+def _ajustar_quantidade(artigo, direcao):
+    """+1/-1 on an item already locked in memory (batch path), never below 1."""
+    if artigo.qtd is None:
+        return
+    if direcao == 'mais':
+        artigo.qtd += 1
+    elif direcao == 'menos' and artigo.qtd > 1:
+        artigo.qtd = max(artigo.qtd - 1, 1)
+
+
+def _incrementar_quantidade(lista_id, pk, direcao):
+    """
+    +1/-1 on the quantity as one relative UPDATE, so concurrent taps never
+    overwrite each other. Never goes below 1; a quantity with no number stays
+    as typed. Return the number of rows changed.
+    """
+    if direcao == 'mais':
+        qtd = F('qtd') + 1
+    elif direcao == 'menos':
+        qtd = Case(
+            When(qtd__gt=1, then=Greatest(F('qtd') - 1, Value(Decimal(1)))),
+            default=F('qtd'),
+        )
+    else:
+        return 0
+    with transaction.atomic():
+        rev = _tocar_lista(lista_id) or 0
+        alterados = Artigo.objects.filter(pk=pk, lista_id=lista_id).update(
+            qtd=qtd, revisao=rev, movido_em=timezone.now()
+        )
+        if not alterados:
+            transaction.set_rollback(True)
+    return alterados
+
+
+def _utilizadores_da_lista(lista):
+    """Return the ids of the owner and of every user the list is shared with."""
+    return {lista.dono_id, *lista.partilhas.values_list('utilizador_id', flat=True)}
+
+
+def _tocar_utilizadores(user_ids):
+    """Bump the "lists changed" revision of each user (creating rows as needed)."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    revisoes = RevisaoUtilizador.objects.filter(utilizador_id__in=user_ids)
+    if revisoes.update(revisao=F('revisao') + 1) < len(user_ids):
+        existentes = set(revisoes.values_list('utilizador_id', flat=True))
+        RevisaoUtilizador.objects.bulk_create(
+            [RevisaoUtilizador(utilizador_id=uid, revisao=1) for uid in user_ids - existentes],
+            ignore_conflicts=True,
+        )
+    for uid, rev in revisoes.values_list('utilizador_id', 'revisao'):
+        transaction.on_commit(
+            lambda uid=uid, rev=rev: eventos.publicar(eventos.canal_utilizador(uid), rev)
+        )
 
 
 # ── Auth views ───────────────────────────────────────────────────
 
-def _associar_link_lista(request, user):
-    """If session has a pending link token, store it for the popup confirmation."""
-    token = request.session.pop('link_token', None)
-    if token:
-        try:
-            link = LinkPartilha.objects.select_related('lista').get(token=token)
-            if link.esta_ativo and link.lista.dono != user:
-                already_shared = ListaPartilha.objects.filter(
-                    lista=link.lista, utilizador=user
-                ).exists()
-                if not already_shared:
-                    request.session['pending_link_token'] = str(token)
-                    request.session['pending_link_lista_nome'] = link.lista.nome
-        except LinkPartilha.DoesNotExist:
-            pass
+ERRO_TENTATIVAS = 'Demasiadas tentativas. Tente novamente dentro de alguns minutos.'
+ERRO_SOBRECARGA = 'O servidor está ocupado. Tente novamente dentro de instantes.'
+
+
+def _token_do_next(next_url):
+    """Token of the shared link page the user came from (?next=/link/<token>/), if any."""
+    try:
+        match = resolve(urlsplit(next_url or '').path)
+    except Resolver404:
+        return None
+    return match.kwargs.get('token') if match.url_name == 'ver_link' else None
+
+
+def _associar_link_lista(request, user, next_url):
+    """If the user came from a shared link, store it for the popup confirmation."""
+    token = _token_do_next(next_url)
+    link = _resolver_link(token) if token else None
+    if link and link.esta_ativo and link.lista.dono_id != user.pk:
+        already_shared = ListaPartilha.objects.filter(
+            lista=link.lista, utilizador=user
+        ).exists()
+        if not already_shared:
+            request.session['pending_link_token'] = str(token)
+            request.session['pending_link_lista_nome'] = link.lista.nome
 
 
 def registar(request):
@@ -74,28 +216,32 @@ def registar(request):
         return redirect('index')
     next_url = request.GET.get('next', '')
     erro = ''
+    status = 200
     if request.method == 'POST':
         next_url = request.POST.get('next', '')
         username = request.POST.get('username', '').strip()
         password_hash = request.POST.get('password_hash', '').strip()
         if not username or not password_hash:
             erro = 'Preencha todos os campos.'
+        elif senhas.bloqueado(request):
+            erro, status = ERRO_TENTATIVAS, 429
         elif User.objects.filter(username=username).exists():
             erro = 'Este nome de utilizador já existe.'
         else:
-            user = User(username=username)
-            user.password = make_password(password_hash)
-            user.save()
-            Lista.objects.create(nome='Casa', dono=user)
-            backend = HashedPasswordBackend()
-            user = backend.authenticate(request, username=username, password_hash=password_hash)
-            if user:
+            try:
+                password = senhas.cifrar(password_hash)
+            except senhas.Sobrecarga:
+                erro, status = ERRO_SOBRECARGA, 503
+            else:
+                user = User(username=username, password=password)
+                user.save()
+                Lista.objects.create(nome='Casa', dono=user)
+                # Just hashed: no need to verify it again through the backend
                 login(request, user, backend='compras.backends.HashedPasswordBackend')
-                request.session.pop('link_token', None)
-            if next_url:
-                return redirect(next_url)
-            return redirect('index')
-    return render(request, 'compras/registar.html', {'erro': erro, 'next': next_url})
+                if next_url:
+                    return redirect(next_url)
+                return redirect('index')
+    return render(request, 'compras/registar.html', {'erro': erro, 'next': next_url}, status=status)
 
 
 def entrar(request):
@@ -107,11 +253,22 @@ def entrar(request):
         next_url = request.POST.get('next', '')
         username = request.POST.get('username', '').strip()
         password_hash = request.POST.get('password_hash', '').strip()
-        backend = HashedPasswordBackend()
-        user = backend.authenticate(request, username=username, password_hash=password_hash)
+        if senhas.bloqueado(request, username):
+            return render(request, 'compras/entrar.html', {
+                'erro': ERRO_TENTATIVAS, 'next': next_url,
+            }, status=429)
+        try:
+            user = HashedPasswordBackend().authenticate(
+                request, username=username, password_hash=password_hash
+            )
+        except senhas.Sobrecarga:
+            return render(request, 'compras/entrar.html', {
+                'erro': ERRO_SOBRECARGA, 'next': next_url,
+            }, status=503)
         if user:
+            senhas.esquecer_tentativas(username)
             login(request, user, backend='compras.backends.HashedPasswordBackend')
-            _associar_link_lista(request, user)
+            _associar_link_lista(request, user, next_url)
             if not user.email:
                 request.session['next_after_email'] = next_url or ''
                 return redirect('adicionar_email')
@@ -121,6 +278,7 @@ def entrar(request):
                 return redirect(next_url)
             return redirect('index')
         else:
+            senhas.falhou(username)
             erro = 'Nome de utilizador ou palavra-passe incorretos.'
     return render(request, 'compras/entrar.html', {'erro': erro, 'next': next_url})
 
@@ -177,12 +335,11 @@ def recuperar_password(request):
                     'user': user,
                     'reset_url': reset_url,
                 })
-                send_mail(
+                # Sent by `manage.py enviar_emails`, never inside the request
+                correio.enfileirar(
                     'Recuperação de palavra-passe — ListaIsto',
                     corpo,
-                    django_settings.DEFAULT_FROM_EMAIL,
-                    [email],
-                    fail_silently=False,
+                    email,
                 )
             except User.DoesNotExist:
                 pass
@@ -212,44 +369,196 @@ def reset_password(request, uidb64, token):
         if not password_hash:
             erro = 'Introduza uma nova palavra-passe.'
         else:
-            user.password = make_password(password_hash)
-            user.save()
-            sucesso = True
+            try:
+                user.password = senhas.cifrar(password_hash)
+            except senhas.Sobrecarga:
+                erro = ERRO_SOBRECARGA
+            else:
+                user.save()
+                sucesso = True
     return render(request, 'compras/reset_password.html', {
         'erro': erro, 'sucesso': sucesso, 'invalido': False,
     })
 
 
+# ── Conditional GET ──────────────────────────────────────────────
+
+def _cookie_csrf(request):
+    # Pages embed tokens masked from this secret, so a new one needs a new body
+    return request.COOKIES.get(django_settings.CSRF_COOKIE_NAME, '')
+
+
+def _condicional(request, partes, gerar, **cache_control):
+    """
+    Strong ETag from ``partes`` (everything the body depends on). A matching
+    If-None-Match gets a bodiless 304; otherwise the response is built with
+    ``gerar()``. Both carry the ETag and the given Cache-Control directives.
+    """
+    etag = '"%s"' % hashlib.sha256(repr(partes).encode()).hexdigest()[:32]
+    resposta = get_conditional_response(request, etag=etag)
+    if resposta is None:
+        resposta = gerar()
+    resposta['ETag'] = etag
+    patch_cache_control(resposta, **cache_control)
+    return resposta
+
+
+# ── Item pages ───────────────────────────────────────────────────
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _cursor(artigo):
+    """Opaque keyset position of ``artigo`` in its section: "<movido_em µs>_<id>"."""
+    return f'{(artigo.movido_em - EPOCA) // timedelta(microseconds=1)}_{artigo.pk}'
+
+
+def _ler_cursor(texto):
+    """Parse a cursor made by _cursor(), or return None if it is malformed."""
+    try:
+        micro, pk = texto.split('_')
+        return EPOCA + timedelta(microseconds=int(micro)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def _pagina_artigos(lista, comprar, depois=None):
+    """
+    One page of a section in display order (-movido_em, -id), starting after
+    the ``depois`` position, and the cursor of the next page (None at the end).
+    Seeks through artigo_lista_comprar_idx, so every page costs the same.
+    """
+    artigos = lista.artigos.filter(comprar=comprar)
+    if depois:
+        movido_em, pk = depois
+        artigos = artigos.filter(movido_em__lte=movido_em).exclude(movido_em=movido_em, pk__gte=pk)
+    artigos = list(artigos[:PAGINA_ARTIGOS + 1])
+    if len(artigos) > PAGINA_ARTIGOS:
+        del artigos[PAGINA_ARTIGOS:]
+        return artigos, _cursor(artigos[-1])
+    return artigos, None
+
+
+def _totais(lista):
+    """Item count of each section, counted in the index without loading rows."""
+    totais = lista.artigos.aggregate(
+        n_comprar=Count('pk', filter=Q(comprar=True)),
+        n_despensa=Count('pk', filter=Q(comprar=False)),
+    )
+    return {'comprar': totais['n_comprar'], 'despensa': totais['n_despensa']}
+
+
+def _responder_pagina(request, lista, partial, forma, contexto):
+    """JSON with the next page of ?seccao= after the ?depois= cursor, items rendered by ``partial``."""
+    seccao = request.GET.get('seccao')
+    depois = request.GET.get('depois')
+    cursor = _ler_cursor(depois) if depois else None
+    if seccao not in ('comprar', 'despensa') or (depois and cursor is None):
+        return JsonResponse({'ok': False, 'erro': 'Pedido inválido.'}, status=400)
+
+    def gerar():
+        artigos, seguinte = _pagina_artigos(lista, seccao == 'comprar', cursor)
+        html = render_to_string('compras/_artigos.html', {
+            **contexto, 'partial': partial, 'artigos': artigos,
+        }, request=request)
+        return JsonResponse({'html': html, 'depois': seguinte})
+
+    partes = (
+        'pagina', fragmentos.versao(), _cookie_csrf(request), lista.pk, lista.revisao,
+        forma, seccao, depois,
+    )
+    return _condicional(request, partes, gerar, private=True, no_cache=True)
+
+
+# ── Cached fragments ─────────────────────────────────────────────
+
+def _revisao_listas(user):
+    """The user's "lists changed" revision (0 until the first change)."""
+    return RevisaoUtilizador.objects.filter(
+        pk=user.pk
+    ).values_list('revisao', flat=True).first() or 0
+
+
+def _seccoes_artigos(request, lista, partial, forma, contexto=None):
+    """
+    The "to buy" and pantry sections of ``lista``: their totals and first page,
+    each item rendered by ``partial``. Cached per list revision and permission
+    shape ``forma``; the item queries only run on a miss.
+    """
+    def gerar():
+        a_comprar, depois_comprar = _pagina_artigos(lista, True)
+        despensa, depois_despensa = _pagina_artigos(lista, False)
+        return {
+            **(contexto or {}),
+            'partial': partial,
+            'totais': _totais(lista),
+            'a_comprar': a_comprar,
+            'despensa': despensa,
+            'depois_comprar': depois_comprar,
+            'depois_despensa': depois_despensa,
+        }
+
+    return fragmentos.renderizar(
+        request,
+        fragmentos.chave('artigos', lista.pk, lista.revisao, forma),
+        'compras/_seccoes.html',
+        gerar,
+    )
+
+
+def _menu_listas(request, lista, rev_listas):
+    """The sidebar list menu, cached per user, lists revision and active list."""
+    user = request.user
+    return fragmentos.renderizar(
+        request,
+        fragmentos.chave('listas', user.pk, rev_listas, lista.pk if lista else 0),
+        'compras/_listas.html',
+        lambda: {
+            'listas': _listas_do_utilizador(user).annotate(
+                n_partilhas=Count('partilhas')
+            ).order_by('-criado_em'),
+            'lista_ativa_id': lista.pk if lista else None,
+            'user_id': user.pk,
+        },
+    )
+
+
 # ── Main index ───────────────────────────────────────────────────
 
 @login_required
 def index(request):
     lista = _lista_ativa(request)
-    listas = _listas_do_utilizador(request.user).annotate(
-        n_partilhas=Count('partilhas')
-    ).order_by('-criado_em')
-    if lista:
-        despensa = lista.artigos.filter(comprar=False)
-        a_comprar = lista.artigos.filter(comprar=True)
-        partilhas = lista.partilhas.select_related('utilizador')
-        e_dono = lista.dono == request.user
-    else:
-        despensa = Artigo.objects.none()
-        a_comprar = Artigo.objects.none()
-        partilhas = ListaPartilha.objects.none()
-        e_dono = False
+    rev_listas = _revisao_listas(request.user)
     pending_link_token = request.session.get('pending_link_token')
     pending_link_nome = request.session.get('pending_link_lista_nome')
-    return render(request, 'compras/index.html', {
-        'despensa': despensa,
-        'a_comprar': a_comprar,
-        'lista_ativa': lista,
-        'listas': listas,
-        'partilhas': partilhas,
-        'e_dono': e_dono,
-        'pending_link_token': pending_link_token,
-        'pending_link_nome': pending_link_nome,
-    })
+    partes = (
+        'index', fragmentos.versao(), _cookie_csrf(request), request.user.pk, rev_listas,
+        lista and (lista.pk, lista.revisao, lista.nome, lista.dono_id),
+        pending_link_token, pending_link_nome,
+    )
+
+    def gerar():
+        if lista:
+            # Owners and shared users see the same item markup
+            seccoes = _seccoes_artigos(request, lista, 'compras/_artigo.html', 'conta')
+            partilhas = lista.partilhas.select_related('utilizador')
+            e_dono = lista.dono_id == request.user.pk
+        else:
+            seccoes = ''
+            partilhas = ListaPartilha.objects.none()
+            e_dono = False
+        return render(request, 'compras/index.html', {
+            'seccoes': seccoes,
+            'lista_ativa': lista,
+            'menu_listas': _menu_listas(request, lista, rev_listas),
+            'rev_listas': rev_listas,
+            'partilhas': partilhas,
+            'e_dono': e_dono,
+            'pending_link_token': pending_link_token,
+            'pending_link_nome': pending_link_nome,
+        })
+
+    return _condicional(request, partes, gerar, private=True, no_cache=True)
 
 
 # ── Accept / reject shared link ──────────────────────────────────
@@ -261,16 +570,14 @@ def responder_link(request):
         aceitar = request.POST.get('aceitar') == '1'
         token = request.session.pop('pending_link_token', None)
         request.session.pop('pending_link_lista_nome', None)
-        if aceitar and token:
-            try:
-                link = LinkPartilha.objects.select_related('lista').get(token=token)
-                if link.esta_ativo and link.lista.dono != request.user:
-                    ListaPartilha.objects.get_or_create(
-                        lista=link.lista, utilizador=request.user
-                    )
-                    request.session['lista_ativa'] = link.lista.pk
-            except LinkPartilha.DoesNotExist:
-                pass
+        link = _resolver_link(token) if aceitar and token else None
+        if link and link.esta_ativo and link.lista.dono_id != request.user.pk:
+            _, created = ListaPartilha.objects.get_or_create(
+                lista=link.lista, utilizador=request.user
+            )
+            if created:
+                _tocar_utilizadores(_utilizadores_da_lista(link.lista))
+            request.session['lista_ativa'] = link.lista.pk
     return redirect('index')
 
 
@@ -282,15 +589,16 @@ def criar_lista(request):
         nome = request.POST.get('nome', '').strip()
         if nome:
             lista, created = Lista.objects.get_or_create(nome=nome, dono=request.user)
+            if created:
+                _tocar_utilizadores([request.user.pk])
             request.session['lista_ativa'] = lista.pk
     return redirect('index')
 
 
 @login_required
 def selecionar_lista(request, pk):
-    lista = get_object_or_404(Lista, pk=pk)
-    if _pode_aceder_lista(request.user, lista):
-        request.session['lista_ativa'] = lista.pk
+    if _pode_aceder_lista(request.user, pk):
+        request.session['lista_ativa'] = pk
     return redirect('index')
 
 
@@ -301,30 +609,37 @@ def renomear_lista(request, pk):
         nome = request.POST.get('nome', '').strip()
         if nome:
             lista.nome = nome
-            lista.save()
+            # Only the name: the revision read with it may already be stale
+            lista.save(update_fields=['nome'])
+            _tocar_lista(lista.pk)
+            _tocar_utilizadores(_utilizadores_da_lista(lista))
     return redirect('index')
 
 
 @login_required
 def clonar_lista(request, pk):
     lista = get_object_or_404(Lista, pk=pk)
-    if not _pode_aceder_lista(request.user, lista):
+    if not _pode_aceder_lista(request.user, lista.pk):
         return redirect('index')
     if request.method == 'POST':
         nome_base = lista.nome + ' (cópia)'
+        existentes = set(Lista.objects.filter(
+            dono=request.user, nome__startswith=nome_base
+        ).values_list('nome', flat=True))
         nome = nome_base
         n = 1
-        while Lista.objects.filter(nome=nome, dono=request.user).exists():
+        while nome in existentes:
             n += 1
             nome = f"{nome_base} {n}"
-        nova_lista = Lista.objects.create(nome=nome, dono=request.user)
-        for artigo in lista.artigos.all():
-            Artigo.objects.create(
-                lista=nova_lista,
-                nome=artigo.nome,
-                quantidade=artigo.quantidade,
-                comprar=artigo.comprar,
-            )
+        # Oldest first, so the new ids keep the original order among equal movido_em
+        artigos = lista.artigos.order_by('movido_em', 'pk').values_list('nome', 'qtd', 'unidade', 'comprar')
+        with transaction.atomic():
+            nova_lista = Lista.objects.create(nome=nome, dono=request.user)
+            Artigo.objects.bulk_create([
+                Artigo(lista=nova_lista, nome=nome_artigo, qtd=qtd, unidade=unidade, comprar=comprar)
+                for nome_artigo, qtd, unidade, comprar in artigos
+            ], batch_size=CLONAR_BATCH)
+        _tocar_utilizadores([request.user.pk])
         request.session['lista_ativa'] = nova_lista.pk
     return redirect('index')
 
@@ -335,7 +650,9 @@ def apagar_lista(request, pk):
     if request.method == 'POST':
         if request.session.get('lista_ativa') == lista.pk:
             request.session.pop('lista_ativa', None)
+        utilizadores = _utilizadores_da_lista(lista)
         lista.delete()
+        _tocar_utilizadores(utilizadores)
     return redirect('index')
 
 
@@ -356,6 +673,8 @@ def partilhar_lista(request, pk):
         try:
             outro = User.objects.get(username=nome_utilizador)
             _, created = ListaPartilha.objects.get_or_create(lista=lista, utilizador=outro)
+            if created:
+                _tocar_utilizadores(_utilizadores_da_lista(lista))
             if is_ajax:
                 if created:
                     return JsonResponse({'ok': True, 'msg': f'Lista partilhada com "{nome_utilizador}".'})
@@ -371,7 +690,9 @@ def partilhar_lista(request, pk):
 def remover_partilha(request, pk, user_pk):
     lista = get_object_or_404(Lista, pk=pk, dono=request.user)
     if request.method == 'POST':
-        ListaPartilha.objects.filter(lista=lista, utilizador_id=user_pk).delete()
+        utilizadores = _utilizadores_da_lista(lista)
+        if ListaPartilha.objects.filter(lista=lista, utilizador_id=user_pk).delete()[0]:
+            _tocar_utilizadores(utilizadores)
     return redirect('index')
 
 
@@ -380,86 +701,616 @@ def remover_partilha(request, pk, user_pk):
 @login_required
 def adicionar(request):
     lista = _lista_ativa(request)
-    if request.method == 'POST' and lista and _pode_aceder_lista(request.user, lista):
+    if request.method == 'POST' and lista:
+        if 'linhas' in request.POST:
+            return _adicionar_linhas(request, lista.pk, redirect('index'))
         nome = request.POST.get('nome', '').strip()
         quantidade = request.POST.get('quantidade', '1').strip()
         if nome:
             if not quantidade:
                 quantidade = '1'
-            Artigo.objects.create(lista=lista, nome=nome, quantidade=quantidade, comprar=True)
+            artigo = Artigo(lista=lista, nome=nome, quantidade=quantidade, comprar=True)
+            _guardar_artigo(artigo)
+            sugestoes.registar(lista.pk, request.user.pk, [artigo])
     return redirect('index')
 
 
 @login_required
 def editar(request, pk):
     artigo = get_object_or_404(Artigo, pk=pk)
-    if artigo.lista and not _pode_aceder_lista(request.user, artigo.lista):
+    if artigo.lista_id and not _pode_aceder_lista(request.user, artigo.lista_id):
         return redirect('index')
     if request.method == 'POST':
         nome = request.POST.get('nome', '').strip()
-        quantidade = request.POST.get('quantidade', '1').strip()
+        quantidade = request.POST.get('quantidade')
         if nome:
             artigo.nome = nome
-            artigo.quantidade = quantidade if quantidade else '1'
-            artigo.save()
+            campos = ['nome']
+            if quantidade is not None:
+                artigo.quantidade = quantidade.strip() or '1'
+                campos += ['qtd', 'unidade']
+            _guardar_artigo(artigo, campos)
+            sugestoes.registar(artigo.lista_id, request.user.pk, [artigo])
     return redirect('index')
 
 
 @login_required
 def apagar(request, pk):
     artigo = get_object_or_404(Artigo, pk=pk)
-    if artigo.lista and not _pode_aceder_lista(request.user, artigo.lista):
+    if artigo.lista_id and not _pode_aceder_lista(request.user, artigo.lista_id):
         return redirect('index')
     if request.method == 'POST':
-        artigo.delete()
+        _apagar_artigo(artigo)
     return redirect('index')
 
 
 @login_required
 def toggle(request, pk):
     artigo = get_object_or_404(Artigo, pk=pk)
-    if artigo.lista and not _pode_aceder_lista(request.user, artigo.lista):
+    if artigo.lista_id and not _pode_aceder_lista(request.user, artigo.lista_id):
         return redirect('index')
     if request.method == 'POST':
-        destino = request.POST.get('destino')
-        if destino == 'despensa':
-            artigo.comprar = False
-        elif destino == 'comprar':
-            artigo.comprar = True
-        else:
-            artigo.comprar = not artigo.comprar
-        artigo.save()
+        _mover(artigo, request.POST.get('destino'))
+        _guardar_artigo(artigo, ['comprar'])
     return redirect('index')
 
 
+def _estado_utilizador(request):
+    """Revision of the active list and of the user's set of lists."""
+    lista_id = request.session.get('lista_ativa')
+    if not _pode_aceder_lista(request.user, lista_id):
+        lista = _lista_ativa(request)
+        lista_id = lista.pk if lista else None
+    rev = None
+    if lista_id:
+        rev = Lista.objects.filter(pk=lista_id).values_list('revisao', flat=True).first()
+    return {'lista': lista_id, 'rev': rev, 'rev_listas': _revisao_listas(request.user)}
+
+
 @login_required
 def check_updates(request):
+    """Poll for updates: revision of the active list and of the user's lists."""
+    estado = _estado_utilizador(request)
+    return _condicional(
+        request, ('estado', estado), lambda: JsonResponse(estado), private=True, no_cache=True,
+    )
+
+
+def _ler_desde(request):
+    """Parse the client's last-known revision from ?desde=."""
+    try:
+        return max(0, int(request.GET.get('desde', 0)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _delta_lista(request, lista, desde, template, contexto):
+    """
+    Items written and deleted after revision ``desde`` up to the list's current
+    revision, with each item rendered by ``template`` so the page can patch the
+    DOM in place. Items come oldest first, so inserting each at the top of its
+    section keeps the ``-movido_em`` order. A revision the server can't answer
+    for (ahead of the list, or older than the tombstones kept) gets
+    ``recarregar``: the page reloads instead.
+    """
+    rev = lista.revisao
+    if desde > rev or desde < lista.revisao_purgada:
+        return {'lista': lista.pk, 'rev': rev, 'recarregar': True}
+    artigos = lista.artigos.filter(
+        revisao__gt=desde, revisao__lte=rev
+    ).order_by('movido_em', 'pk')
+    apagados = lista.artigos_apagados.filter(
+        revisao__gt=desde, revisao__lte=rev
+    ).values_list('artigo_id', flat=True)
+    return {
+        'lista': lista.pk,
+        'rev': rev,
+        'totais': _totais(lista),
+        'artigos': [{
+            'id': artigo.pk,
+            'comprar': artigo.comprar,
+            'html': render_to_string(template, {**contexto, 'artigo': artigo}, request=request),
+        } for artigo in artigos],
+        'apagados': list(apagados),
+    }
+
+
+@login_required
+def alteracoes(request):
+    """Delta sync for the active list since the client's revision (?desde=)."""
     lista = _lista_ativa(request)
-    if lista:
-        qs = lista.artigos.all()
-    else:
-        qs = Artigo.objects.none()
-    ultimo = qs.order_by('-movido_em').values_list('movido_em', flat=True).first()
-    ts = ultimo.isoformat() if ultimo else ''
-    count = qs.count()
-    n_listas = _listas_do_utilizador(request.user).count()
-    return JsonResponse({'ts': ts, 'count': count, 'n_listas': n_listas})
+    if lista is None:
+        return JsonResponse({'lista': None, 'recarregar': True})
+    return JsonResponse(_delta_lista(request, lista, _ler_desde(request), 'compras/_artigo.html', {}))
+
+
+@login_required
+def pagina_artigos(request, pk):
+    """Further items of a section of one of the user's lists (scroll loading)."""
+    if not _pode_aceder_lista(request.user, pk):
+        raise Http404
+    lista = get_object_or_404(Lista.objects.only('revisao'), pk=pk)
+    return _responder_pagina(request, lista, 'compras/_artigo.html', 'conta', {})
+
+
+def _stream_eventos(conhecidas, formatar):
+    """
+    Build an event-stream response: send the current state, then one
+    ``estado`` event per change and a comment as heartbeat. The stream closes
+    after EVENTOS_DURACAO_MAX seconds and EventSource reconnects by itself, so
+    connections abandoned by the client are always released.
+    """
+    backend = eventos.backend()
+    heartbeat = getattr(django_settings, 'EVENTOS_HEARTBEAT', 25)
+    fim = time.monotonic() + getattr(django_settings, 'EVENTOS_DURACAO_MAX', 300)
+
+    async def stream():
+        yield 'retry: 3000\n\n'
+        yield f'event: estado\ndata: {json.dumps(formatar(conhecidas))}\n\n'
+        while (restante := fim - time.monotonic()) > 0:
+            alteradas = await backend.esperar(conhecidas, timeout=min(heartbeat, restante))
+            if alteradas:
+                conhecidas.update(alteradas)
+                yield f'event: estado\ndata: {json.dumps(formatar(conhecidas))}\n\n'
+            else:
+                yield ': ping\n\n'
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _estado_inicial(request):
+    """Sync part of eventos(): resolve the active list and read both revisions."""
+    if not request.user.is_authenticated:
+        return None
+    dados = _estado_utilizador(request)
+    conhecidas = {eventos.canal_utilizador(request.user.pk): dados['rev_listas']}
+    if dados['rev'] is not None:
+        conhecidas[eventos.canal_lista(dados['lista'])] = dados['rev']
+    for canal, rev in conhecidas.items():
+        eventos.publicar(canal, rev)
+    return dados['lista'], conhecidas
+
+
+async def eventos_stream(request):
+    """Server-Sent Events: push the state of check_updates whenever it changes."""
+    inicial = await sync_to_async(_estado_inicial)(request)
+    if inicial is None:
+        return HttpResponse(status=401)
+    lista_id, conhecidas = inicial
+    canal_user = next(iter(conhecidas))
+    canal_lista = eventos.canal_lista(lista_id)
+
+    def formatar(conhecidas):
+        return {
+            'lista': lista_id,
+            'rev': conhecidas.get(canal_lista),
+            'rev_listas': conhecidas[canal_user],
+        }
+
+    return _stream_eventos(conhecidas, formatar)
 
 
 @login_required
 def quantidade_update(request, pk, direcao):
-    artigo = get_object_or_404(Artigo, pk=pk)
-    if artigo.lista and not _pode_aceder_lista(request.user, artigo.lista):
+    artigo = get_object_or_404(Artigo.objects.only('lista_id'), pk=pk)
+    if artigo.lista_id and not _pode_aceder_lista(request.user, artigo.lista_id):
         return redirect('index')
     if request.method == 'POST':
-        match = re.match(r'^(\d+)', artigo.quantidade)
-        num = int(match.group(1)) if match else 1
-        if direcao == 'mais':
-            num += 1
-        elif direcao == 'menos' and num > 1:
-            num -= 1
-        artigo.quantidade = f"{num}"
-        artigo.save()
+        _incrementar_quantidade(artigo.lista_id, pk, direcao)
+    return redirect('index')
+
+
+# ── Search ───────────────────────────────────────────────────────
+
+@login_required
+def procurar(request):
+    """
+    Items whose name contains ?q= (ignoring case and accents) in every list
+    the user owns or shares, grouped by list. Names starting with the term
+    come first; a one-letter term only matches name prefixes.
+    """
+    termo = normalizar_nome(request.GET.get('q', ''))
+    if not termo:
+        return JsonResponse({'listas': [], 'mais': False})
+    artigos = Artigo.objects.filter(lista_id__in=acessos.listas_acessiveis(request.user))
+    if len(termo) < 2:
+        artigos = artigos.filter(nome_normalizado__istartswith=termo)
+    else:
+        artigos = artigos.filter(nome_normalizado__icontains=termo)
+    # Columns are already folded, so the i-lookups only choose a plain LIKE,
+    # which MySQL can run on artigo_lista_nome_idx (LIKE BINARY can't)
+    artigos = list(artigos.select_related('lista').annotate(
+        prefixo=Case(When(nome_normalizado__istartswith=termo, then=Value(0)), default=Value(1)),
+    ).order_by('prefixo', 'nome_normalizado', 'pk')[:PESQUISA_MAX + 1])
+
+    lista_ativa = request.session.get('lista_ativa')
+    grupos = {}
+    for artigo in artigos[:PESQUISA_MAX]:
+        grupo = grupos.get(artigo.lista_id)
+        if grupo is None:
+            grupo = grupos[artigo.lista_id] = {
+                'id': artigo.lista_id,
+                'nome': artigo.lista.nome,
+                'ativa': artigo.lista_id == lista_ativa,
+                'artigos': [],
+            }
+        grupo['artigos'].append({
+            'id': artigo.pk,
+            'nome': artigo.nome,
+            'quantidade': artigo.quantidade,
+            'comprar': artigo.comprar,
+        })
+    return JsonResponse({'listas': list(grupos.values()), 'mais': len(artigos) > PESQUISA_MAX})
+
+
+# ── Name suggestions ─────────────────────────────────────────────
+
+def _responder_sugestoes(request, lista_id, utilizador_id):
+    resposta = JsonResponse({
+        'sugestoes': sugestoes.sugerir(lista_id, utilizador_id, request.GET.get('q', '')),
+    })
+    # Retyping a prefix (backspace) is answered by the browser
+    patch_cache_control(resposta, private=True, max_age=10)
+    return resposta
+
+
+@login_required
+def sugerir_artigos(request):
+    """Names starting with ?q= from the active list's and the user's history."""
+    lista_id = request.session.get('lista_ativa')
+    if not _pode_aceder_lista(request.user, lista_id):
+        lista_id = None
+    return _responder_sugestoes(request, lista_id, request.user.pk)
+
+
+# ── Batch mutations ──────────────────────────────────────────────
+
+# Operation → LinkPartilha permission required to run it through a link
+PERMISSOES_OPERACAO = {
+    'adicionar': 'pode_adicionar',
+    'editar': 'pode_editar',
+    'quantidade': 'pode_editar',
+    'apagar': 'pode_apagar',
+    'toggle': 'pode_toggle',
+}
+
+# JSON type of each field an operation may carry (others are ignored)
+CAMPOS_OPERACAO = {
+    'op': str, 'op_id': str, 'id': int, 'nome': str, 'quantidade': str, 'destino': str, 'direcao': str,
+}
+
+
+def _operacao_valida(op):
+    return isinstance(op, dict) and all(
+        isinstance(op[campo], tipo) and not isinstance(op[campo], bool)
+        for campo, tipo in CAMPOS_OPERACAO.items() if campo in op
+    )
+
+
+def _ler_lote(request):
+    """
+    Parse a {"operacoes": [...]} JSON body; return the dict, or None if
+    malformed, including any operation with a field of the wrong type.
+    """
+    try:
+        dados = json.loads(request.body)
+        operacoes = dados['operacoes']
+    except (ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(operacoes, list) or len(operacoes) > LOTE_MAX:
+        return None
+    if not all(_operacao_valida(op) for op in operacoes):
+        return None
+    return dados
+
+
+def _aplicar_lote(lista_id, operacoes, permitidas, utilizador_id=None):
+    """
+    Apply an ordered list of operations to one list in a single transaction:
+    one SELECT of the referenced items, then at most one revision bump, one
+    bulk INSERT, one bulk UPDATE and one DELETE. A batch that changes nothing
+    (only replays or rejected operations) leaves the revision alone, so
+    pollers don't refetch an unchanged list. Operations are applied in
+    memory in order, so later ones see the effect of earlier ones. Added and
+    edited names then go to the suggestions of the list and of utilizador_id.
+    Return (revision, per-operation results).
+
+    Operations with an "op_id" (a client-generated string) run at most once
+    per list: their results are stored in OperacaoAplicada, and an op_id seen
+    before gets its stored result back, marked "repetida", without being
+    applied again. The list row is locked first, so concurrent replays of the
+    same operations wait for each other instead of both applying them.
+    """
+    ids = {op.get('id') for op in operacoes if isinstance(op.get('id'), int)}
+    chaves = {op['op_id'] for op in operacoes if isinstance(op.get('op_id'), str)}
+    resultados = []
+    novos, alterados, apagados = [], {}, set()
+    editados = {}
+    # op_id → index of its result, for the operations applied by this batch
+    por_chave = {}
+    with transaction.atomic():
+        rev = Lista.objects.select_for_update().filter(
+            pk=lista_id,
+        ).values_list('revisao', flat=True).first()
+        aplicadas = dict(OperacaoAplicada.objects.filter(
+            lista_id=lista_id, chave__in=chaves,
+        ).values_list('chave', 'resultado')) if chaves else {}
+        artigos = Artigo.objects.select_for_update().filter(lista_id=lista_id).in_bulk(ids)
+        for op in operacoes:
+            chave = op.get('op_id')
+            if chave in aplicadas:
+                resultados.append({**aplicadas[chave], 'repetida': True})
+                continue
+            if chave in por_chave:
+                resultados.append({'repete': por_chave[chave]})
+                continue
+            if isinstance(chave, str):
+                por_chave[chave] = len(resultados)
+            tipo = op.get('op')
+            if tipo not in PERMISSOES_OPERACAO:
+                resultados.append({'ok': False, 'erro': 'Operação desconhecida.'})
+                continue
+            if tipo not in permitidas:
+                resultados.append({'ok': False, 'erro': 'Sem permissão.'})
+                continue
+            if tipo == 'adicionar':
+                nome = op.get('nome', '').strip()
+                if not nome:
+                    resultados.append({'ok': False, 'erro': 'Nome em falta.'})
+                    continue
+                quantidade = op.get('quantidade', '').strip() or '1'
+                novos.append(Artigo(lista_id=lista_id, nome=nome, quantidade=quantidade, comprar=True))
+                resultados.append({'ok': True, 'artigo': novos[-1]})
+                continue
+            artigo = artigos.get(op.get('id'))
+            if artigo is None or artigo.pk in apagados:
+                resultados.append({'ok': False, 'erro': 'Artigo não encontrado.'})
+                continue
+            if tipo == 'apagar':
+                apagados.add(artigo.pk)
+                alterados.pop(artigo.pk, None)
+            elif tipo == 'toggle':
+                _mover(artigo, op.get('destino'))
+                alterados[artigo.pk] = artigo
+            elif tipo == 'quantidade':
+                _ajustar_quantidade(artigo, op.get('direcao'))
+                alterados[artigo.pk] = artigo
+            elif tipo == 'editar':
+                nome = op.get('nome', '').strip()
+                if not nome:
+                    resultados.append({'ok': False, 'erro': 'Nome em falta.'})
+                    continue
+                artigo.nome = nome
+                if 'quantidade' in op:
+                    artigo.quantidade = op['quantidade'].strip() or '1'
+                alterados[artigo.pk] = artigo
+                editados[artigo.pk] = artigo
+            resultados.append({'ok': True, 'artigo': artigo})
+
+        if novos or alterados or apagados:
+            rev = _tocar_lista(lista_id)
+        if novos:
+            for artigo in novos:
+                artigo.revisao = rev
+            Artigo.objects.bulk_create(novos)
+        if alterados:
+            agora = timezone.now()
+            for artigo in alterados.values():
+                artigo.revisao = rev
+                artigo.movido_em = agora
+            Artigo.objects.bulk_update(
+                alterados.values(), ['nome', 'qtd', 'unidade', 'comprar', 'revisao', 'movido_em']
+            )
+        if apagados:
+            ArtigoApagado.objects.bulk_create([
+                ArtigoApagado(lista_id=lista_id, artigo_id=pk, revisao=rev) for pk in apagados
+            ])
+            Artigo.objects.filter(pk__in=apagados).delete()
+
+        for resultado in resultados:
+            artigo = resultado.pop('artigo', None)
+            if artigo is not None:
+                resultado['id'] = artigo.pk
+                if artigo.pk not in apagados:
+                    resultado.update(comprar=artigo.comprar, nome=artigo.nome, quantidade=artigo.quantidade)
+        if por_chave:
+            OperacaoAplicada.objects.bulk_create([
+                OperacaoAplicada(lista_id=lista_id, chave=chave, resultado=resultados[i])
+                for chave, i in por_chave.items()
+            ])
+
+    sugestoes.registar(
+        lista_id, utilizador_id,
+        novos + [artigo for pk, artigo in editados.items() if pk not in apagados],
+    )
+    # The same op_id twice in one batch: the second repeats the first
+    resultados = [
+        {**resultados[r['repete']], 'repetida': True} if 'repete' in r else r
+        for r in resultados
+    ]
+    return rev, resultados
+
+
+@login_required
+@require_POST
+def lote(request):
+    """
+    Apply a batch of item operations (JSON) to the active list, or to the
+    list given in "lista", with a single access check.
+    """
+    dados = _ler_lote(request)
+    if dados is None:
+        return JsonResponse({'ok': False, 'erro': 'Pedido inválido.'}, status=400)
+    try:
+        lista_id = int(dados.get('lista') or request.session.get('lista_ativa') or 0)
+    except (TypeError, ValueError):
+        lista_id = 0
+    if not _pode_aceder_lista(request.user, lista_id):
+        return JsonResponse({'ok': False, 'erro': 'Sem acesso à lista.'}, status=403)
+    rev, resultados = _aplicar_lote(
+        lista_id, dados['operacoes'], PERMISSOES_OPERACAO.keys(), request.user.pk,
+    )
+    return JsonResponse({'ok': True, 'lista': lista_id, 'rev': rev, 'resultados': resultados})
+
+
+def _ler_fila(request):
+    """_ler_lote for sincronizar: every operation must carry an "op_id" string."""
+    dados = _ler_lote(request)
+    if dados is None:
+        return None
+    for op in dados['operacoes']:
+        chave = op.get('op_id')
+        if not isinstance(chave, str) or not 0 < len(chave) <= OP_ID_MAX:
+            return None
+    return dados
+
+
+@login_required
+@require_POST
+def sincronizar(request):
+    """
+    Replay the operations queued offline by the service worker on the list
+    given in "lista". Like lote, but each operation is applied once however
+    often the queue is sent again (see _aplicar_lote), and the list never
+    comes from the session, which may have changed since they were queued.
+    """
+    dados = _ler_fila(request)
+    if dados is None:
+        return JsonResponse({'ok': False, 'erro': 'Pedido inválido.'}, status=400)
+    lista_id = dados.get('lista')
+    if not isinstance(lista_id, int) or not _pode_aceder_lista(request.user, lista_id):
+        return JsonResponse({'ok': False, 'erro': 'Sem acesso à lista.'}, status=403)
+    rev, resultados = _aplicar_lote(
+        lista_id, dados['operacoes'], PERMISSOES_OPERACAO.keys(), request.user.pk,
+    )
+    return JsonResponse({'ok': True, 'lista': lista_id, 'rev': rev, 'resultados': resultados})
+
+
+def _adicionar_linhas(request, lista_id, destino):
+    """
+    Add every item of a pasted block (POST "linhas", one item per line, see
+    models.ler_linhas) as one batch: one revision bump, one INSERT and one
+    change notification. Answer JSON to fetch() and ``destino`` otherwise.
+    """
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    artigos = ler_linhas(request.POST['linhas'])
+    if len(artigos) > LOTE_MAX:
+        if is_ajax:
+            return JsonResponse({'ok': False, 'erro': f'No máximo {LOTE_MAX} artigos de cada vez.'}, status=400)
+        return destino
+    rev, resultados = None, []
+    if artigos:
+        # The newest item is shown first, so insert the first line last
+        operacoes = [
+            {'op': 'adicionar', 'nome': nome, 'quantidade': formatar_quantidade(qtd, unidade)}
+            for nome, qtd, unidade in reversed(artigos)
+        ]
+        rev, resultados = _aplicar_lote(lista_id, operacoes, {'adicionar'}, request.user.pk)
+        resultados.reverse()
+    if is_ajax:
+        return JsonResponse({'ok': True, 'lista': lista_id, 'rev': rev, 'resultados': resultados})
+    return destino
+
+
+# ── Export / import ──────────────────────────────────────────────
+
+@login_required
+def exportar(request):
+    """
+    Download every list the user can see, as CSV or NDJSON (?formato=),
+    streamed from an async generator (see transferencia.exportar).
+    """
+    formato = request.GET.get('formato', 'csv')
+    if formato not in transferencia.FORMATOS:
+        return JsonResponse({'ok': False, 'erro': 'Formato desconhecido.'}, status=400)
+    listas = list(
+        Lista.objects.filter(pk__in=acessos.listas_acessiveis(request.user))
+        .order_by('nome', 'pk').values_list('pk', 'nome')
+    )
+    resposta = StreamingHttpResponse(
+        transferencia.exportar(listas, formato), content_type=transferencia.FORMATOS[formato],
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="listas.{formato}"'
+    patch_cache_control(resposta, private=True, no_store=True)
+    return resposta
+
+
+def _importar(user, linhas, lista_padrao):
+    """
+    Insert the rows of transferencia.ler() transferencia.LOTE at a time.
+    Rows go to the user's own list of that name (created when missing), or
+    to lista_padrao when they name none. Each list gets one revision bump,
+    shared by all its imported items. A bulk load is not a use of the
+    names, so the suggestions aren't counted. Run inside a transaction.
+    Return (items imported, lists created).
+    """
+    destinos = {}
+    criadas = 0
+    total = 0
+    for bloco in transferencia.em_lotes(linhas):
+        total += len(bloco)
+        if total > IMPORTAR_MAX:
+            raise transferencia.FicheiroInvalido(f'O ficheiro tem mais de {IMPORTAR_MAX} artigos.')
+        por_lista = {}
+        for nome_lista, nome, quantidade, comprar in bloco:
+            if nome_lista not in destinos:
+                if not nome_lista:
+                    if lista_padrao is None:
+                        raise transferencia.FicheiroInvalido('Indique a lista de cada artigo na coluna "lista".')
+                    lista_id = lista_padrao.pk
+                else:
+                    lista, criada = Lista.objects.get_or_create(nome=nome_lista, dono=user)
+                    criadas += criada
+                    if criadas > IMPORTAR_MAX_LISTAS:
+                        raise transferencia.FicheiroInvalido(
+                            f'O ficheiro criaria mais de {IMPORTAR_MAX_LISTAS} listas.'
+                        )
+                    lista_id = lista.pk
+                destinos[nome_lista] = (lista_id, _tocar_lista(lista_id) or 0)
+            lista_id, rev = destinos[nome_lista]
+            por_lista.setdefault(lista_id, []).append(Artigo(
+                lista_id=lista_id, nome=nome, quantidade=quantidade, comprar=comprar, revisao=rev,
+            ))
+        for artigos in por_lista.values():
+            Artigo.objects.bulk_create(artigos, batch_size=transferencia.LOTE)
+    if criadas:
+        _tocar_utilizadores([user.pk])
+    return total, criadas
+
+
+@login_required
+@require_POST
+def importar(request):
+    """
+    Add the items of an uploaded CSV or NDJSON file (same columns as the
+    export; only "nome" is required), all or nothing.
+    """
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    ficheiro = request.FILES.get('ficheiro')
+    if ficheiro is None:
+        if is_ajax:
+            return JsonResponse({'ok': False, 'msg': 'Escolha um ficheiro.'}, status=400)
+        return redirect('index')
+    formato = request.POST.get('formato') or transferencia.formato_de(ficheiro.name)
+    if formato not in transferencia.FORMATOS:
+        formato = 'csv'
+    try:
+        with transaction.atomic():
+            artigos, listas = _importar(
+                request.user, transferencia.ler(ficheiro, formato), _lista_ativa(request),
+            )
+    except transferencia.FicheiroInvalido as e:
+        if is_ajax:
+            return JsonResponse({'ok': False, 'msg': str(e)}, status=400)
+        return redirect('index')
+    if is_ajax:
+        msg = f'{artigos} artigos importados'
+        if listas:
+            msg += f' ({listas} listas novas)'
+        return JsonResponse({'ok': True, 'msg': msg + '.', 'artigos': artigos, 'listas': listas})
     return redirect('index')
 
 
@@ -492,8 +1343,9 @@ def criar_link_partilha(request, pk):
         )
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
         if is_ajax:
-            url = request.build_absolute_uri(f'/link/{link.token}/')
-            return JsonResponse({'ok': True, 'url': url, 'token': str(link.token)})
+            token = tokens.token_publico(link)
+            url = request.build_absolute_uri(f'/link/{token}/')
+            return JsonResponse({'ok': True, 'url': url, 'token': token})
     return redirect('index')
 
 
@@ -515,25 +1367,65 @@ def listar_links_partilha(request, pk):
     """Return JSON list of active links for a list (AJAX)."""
     lista = get_object_or_404(Lista, pk=pk, dono=request.user)
     links = lista.links_partilha.filter(expira_em__gt=timezone.now())
-    data = []
-    for lnk in links:
-        data.append({
-            'id': lnk.pk,
-            'url': request.build_absolute_uri(f'/link/{lnk.token}/'),
-            'expira_em': lnk.expira_em.strftime('%d/%m/%Y %H:%M'),
-            'pode_adicionar': lnk.pode_adicionar,
-            'pode_editar': lnk.pode_editar,
-            'pode_apagar': lnk.pode_apagar,
-            'pode_toggle': lnk.pode_toggle,
-        })
-    return JsonResponse({'links': data})
+    # Links are only ever created or deleted, and pks only grow, so the count
+    # and the highest pk of the active ones identify the set
+    resumo = links.aggregate(n=Count('pk'), ultimo=Max('pk'))
+
+    def gerar():
+        data = []
+        for lnk in links:
+            data.append({
+                'id': lnk.pk,
+                'url': request.build_absolute_uri(f'/link/{tokens.token_publico(lnk)}/'),
+                'expira_em': lnk.expira_em.strftime('%d/%m/%Y %H:%M'),
+                'pode_adicionar': lnk.pode_adicionar,
+                'pode_editar': lnk.pode_editar,
+                'pode_apagar': lnk.pode_apagar,
+                'pode_toggle': lnk.pode_toggle,
+            })
+        return JsonResponse({'links': data})
+
+    partes = ('links', lista.pk, resumo['n'], resumo['ultimo'], request.get_host())
+    return _condicional(request, partes, gerar, private=True, no_cache=True)
+
+
+def _resolver_link(token):
+    """
+    Return the LinkPartilha for a UUID or signed token, or None.
+    Signed tokens are checked in pure CPU first, so expired or forged ones
+    never reach the database; valid ones are served from a short-lived cache
+    that is dropped on revocation (see signals.invalidar_link).
+    """
+    if not tokens.e_assinado(token):
+        return LinkPartilha.objects.select_related('lista').filter(token=token).first()
+    dados = tokens.verificar(token)
+    if dados is None:
+        return None
+    chave = tokens.chave_cache(dados['link'])
+    link = cache.get(chave)
+    if link is None:
+        with replicas.primario():
+            link = LinkPartilha.objects.filter(pk=dados['link']).first()
+        if link is None:
+            return None
+        ttl = min(getattr(django_settings, 'LINKS_CACHE_TTL', 60), dados['expira'] - time.time())
+        cache.set(chave, link, max(1, int(ttl)))
+    if not tokens.corresponde(dados, link):
+        return None
+    return link
+
+
+def _forma_link(link, token):
+    """Permission shape of a link page; item URLs embed the token, so each link has its own."""
+    return 'link:{}:{:d}{:d}{:d}'.format(
+        fragmentos.chave_token(token), link.pode_toggle, link.pode_editar, link.pode_apagar,
+    )
 
 
 def _get_link_or_404(token):
     """Get an active link or 404."""
-    link = get_object_or_404(LinkPartilha, token=token)
-    if not link.esta_ativo:
-        from django.http import Http404
+    link = _resolver_link(token)
+    if link is None or not link.esta_ativo:
         raise Http404
     return link
 
@@ -542,17 +1434,35 @@ def ver_link(request, token):
     """Public page: view a list via shared link."""
     link = _get_link_or_404(token)
     lista = link.lista
-    despensa = lista.artigos.filter(comprar=False)
-    a_comprar = lista.artigos.filter(comprar=True)
-    # Store token in session so auth views can associate the list
-    request.session['link_token'] = str(token)
-    return render(request, 'compras/link.html', {
-        'link': link,
-        'lista': lista,
-        'despensa': despensa,
-        'a_comprar': a_comprar,
-        'token': token,
-    })
+    cookie_csrf = _cookie_csrf(request)
+    partes = (
+        'link', fragmentos.versao(), cookie_csrf, str(token), lista.pk, lista.revisao, lista.nome,
+        link.pode_adicionar, link.pode_editar, link.pode_apagar, link.pode_toggle,
+    )
+
+    def gerar():
+        seccoes = _seccoes_artigos(
+            request, lista, 'compras/_artigo_link.html', _forma_link(link, token),
+            {'link': link, 'token': token},
+        )
+        # No session write: anonymous viewers get no session row; the login and
+        # register links carry the token in ?next= (see _associar_link_lista)
+        return render(request, 'compras/link.html', {
+            'link': link,
+            'lista': lista,
+            'seccoes': seccoes,
+            'token': token,
+        })
+
+    # Shared caches may keep the page (one copy per cookie) but must revalidate
+    # it, so revocation and expiry apply at once. A first visit also sets the
+    # CSRF cookie, and that response must not be handed to anyone else.
+    resposta = _condicional(
+        request, partes, gerar, no_cache=True, must_revalidate=True,
+        **({'public': True} if cookie_csrf else {'private': True}),
+    )
+    patch_vary_headers(resposta, ('Cookie',))
+    return resposta
 
 
 def link_adicionar(request, token):
@@ -561,12 +1471,16 @@ def link_adicionar(request, token):
     if not link.pode_adicionar:
         return redirect('ver_link', token=token)
     if request.method == 'POST':
+        if 'linhas' in request.POST:
+            return _adicionar_linhas(request, link.lista_id, redirect('ver_link', token=token))
         nome = request.POST.get('nome', '').strip()
         quantidade = request.POST.get('quantidade', '1').strip()
         if nome:
             if not quantidade:
                 quantidade = '1'
-            Artigo.objects.create(lista=link.lista, nome=nome, quantidade=quantidade, comprar=True)
+            artigo = Artigo(lista=link.lista, nome=nome, quantidade=quantidade, comprar=True)
+            _guardar_artigo(artigo)
+            sugestoes.registar(link.lista_id, request.user.pk, [artigo])
     return redirect('ver_link', token=token)
 
 
@@ -577,14 +1491,8 @@ def link_toggle(request, token, pk):
         return redirect('ver_link', token=token)
     artigo = get_object_or_404(Artigo, pk=pk, lista=link.lista)
     if request.method == 'POST':
-        destino = request.POST.get('destino')
-        if destino == 'despensa':
-            artigo.comprar = False
-        elif destino == 'comprar':
-            artigo.comprar = True
-        else:
-            artigo.comprar = not artigo.comprar
-        artigo.save()
+        _mover(artigo, request.POST.get('destino'))
+        _guardar_artigo(artigo, ['comprar'])
     return redirect('ver_link', token=token)
 
 
@@ -596,11 +1504,15 @@ def link_editar(request, token, pk):
     artigo = get_object_or_404(Artigo, pk=pk, lista=link.lista)
     if request.method == 'POST':
         nome = request.POST.get('nome', '').strip()
-        quantidade = request.POST.get('quantidade', '1').strip()
+        quantidade = request.POST.get('quantidade')
         if nome:
             artigo.nome = nome
-            artigo.quantidade = quantidade if quantidade else '1'
-            artigo.save()
+            campos = ['nome']
+            if quantidade is not None:
+                artigo.quantidade = quantidade.strip() or '1'
+                campos += ['qtd', 'unidade']
+            _guardar_artigo(artigo, campos)
+            sugestoes.registar(artigo.lista_id, request.user.pk, [artigo])
     return redirect('ver_link', token=token)
 
 
@@ -611,7 +1523,7 @@ def link_apagar(request, token, pk):
         return redirect('ver_link', token=token)
     artigo = get_object_or_404(Artigo, pk=pk, lista=link.lista)
     if request.method == 'POST':
-        artigo.delete()
+        _apagar_artigo(artigo)
     return redirect('ver_link', token=token)
 
 
@@ -620,24 +1532,130 @@ def link_quantidade(request, token, pk, direcao):
     link = _get_link_or_404(token)
     if not link.pode_editar:
         return redirect('ver_link', token=token)
-    artigo = get_object_or_404(Artigo, pk=pk, lista=link.lista)
-    if request.method == 'POST':
-        match = re.match(r'^(\d+)', artigo.quantidade)
-        num = int(match.group(1)) if match else 1
-        if direcao == 'mais':
-            num += 1
-        elif direcao == 'menos' and num > 1:
-            num -= 1
-        artigo.quantidade = f"{num}"
-        artigo.save()
+    if request.method == 'POST' and not _incrementar_quantidade(link.lista_id, pk, direcao):
+        raise Http404
     return redirect('ver_link', token=token)
 
 
+@require_POST
+def link_lote(request, token):
+    """Batch of item operations via shared link, limited by the link's permissions."""
+    link = _get_link_or_404(token)
+    dados = _ler_lote(request)
+    if dados is None:
+        return JsonResponse({'ok': False, 'erro': 'Pedido inválido.'}, status=400)
+    permitidas = {op for op, permissao in PERMISSOES_OPERACAO.items() if getattr(link, permissao)}
+    rev, resultados = _aplicar_lote(link.lista_id, dados['operacoes'], permitidas, request.user.pk)
+    return JsonResponse({'ok': True, 'rev': rev, 'resultados': resultados})
+
+
+@require_POST
+def link_sincronizar(request, token):
+    """Operations queued offline on a link page, applied once each (see sincronizar)."""
+    link = _get_link_or_404(token)
+    dados = _ler_fila(request)
+    if dados is None:
+        return JsonResponse({'ok': False, 'erro': 'Pedido inválido.'}, status=400)
+    permitidas = {op for op, permissao in PERMISSOES_OPERACAO.items() if getattr(link, permissao)}
+    rev, resultados = _aplicar_lote(link.lista_id, dados['operacoes'], permitidas, request.user.pk)
+    return JsonResponse({'ok': True, 'rev': rev, 'resultados': resultados})
+
+
+def link_pagina_artigos(request, token):
+    """Further items of a section of a link page (scroll loading)."""
+    link = _get_link_or_404(token)
+    lista = Lista.objects.only('revisao').get(pk=link.lista_id)
+    return _responder_pagina(
+        request, lista, 'compras/_artigo_link.html', _forma_link(link, token),
+        {'link': link, 'token': token},
+    )
+
+
+def link_sugerir_artigos(request, token):
+    """Names starting with ?q= from the list's history, for links that may add items."""
+    link = _get_link_or_404(token)
+    if not link.pode_adicionar:
+        raise Http404
+    return _responder_sugestoes(request, link.lista_id, request.user.pk)
+
+
 def link_check_updates(request, token):
     """Poll for updates on a link page."""
     link = _get_link_or_404(token)
-    qs = link.lista.artigos.all()
-    ultimo = qs.order_by('-movido_em').values_list('movido_em', flat=True).first()
-    ts = ultimo.isoformat() if ultimo else ''
-    count = qs.count()
-    return JsonResponse({'ts': ts, 'count': count})
+    rev = Lista.objects.filter(pk=link.lista_id).values_list('revisao', flat=True).first()
+    return _condicional(
+        request, ('rev', link.lista_id, rev), lambda: JsonResponse({'rev': rev}),
+        public=True, no_cache=True, must_revalidate=True,
+    )
+
+
+def link_alteracoes(request, token):
+    """Delta sync for a link page since the client's revision (?desde=)."""
+    link = _get_link_or_404(token)
+    return JsonResponse(_delta_lista(
+        request, link.lista, _ler_desde(request),
+        'compras/_artigo_link.html', {'link': link, 'token': token},
+    ))
+
+
+async def link_eventos(request, token):
+    """Server-Sent Events for a link page: push the list revision on change."""
+    link = await sync_to_async(_get_link_or_404)(token)
+    rev = await sync_to_async(
+        Lista.objects.filter(pk=link.lista_id).values_list('revisao', flat=True).first
+    )()
+    canal = eventos.canal_lista(link.lista_id)
+    eventos.publicar(canal, rev)
+    return _stream_eventos({canal: rev}, lambda c: {'rev': c[canal]})
+
+
+# ── Service worker ───────────────────────────────────────────────
+
+# App shell: static files the service worker caches when it is installed
+SW_ESTATICOS = (
+    'compras/css/index.css',
+    'compras/css/link.css',
+    'compras/js/index.js',
+    'compras/js/link.js',
+    'compras/js/offline.js',
+    'compras/logo3.png',
+    'compras/favicon.svg',
+    'compras/favicon-96x96.png',
+    'compras/apple-touch-icon.png',
+    'compras/site.webmanifest',
+)
+
+
+def service_worker(request):
+    """
+    The service worker script (templates/compras/sw.js), served from the site
+    root so it controls every page. It carries the hashed URLs of the app
+    shell, so any change to those files changes the script and browsers
+    install the new version.
+    """
+    estaticos = [static(caminho) for caminho in SW_ESTATICOS]
+    response = render(request, 'compras/sw.js', {
+        'estaticos': json.dumps(estaticos),
+        'versao': hashlib.sha256('\n'.join(estaticos).encode()).hexdigest()[:12],
+        'lote_max': LOTE_MAX,
+    }, content_type='text/javascript; charset=utf-8')
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+# ── Metrics ──────────────────────────────────────────────────────
+
+def _pode_ver_metricas(request):
+    """Staff users, or a scraper with the METRICAS_TOKEN bearer token."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(django_settings, 'METRICAS_TOKEN', '')
+    cabecalho = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(cabecalho, f'Bearer {token}')
+
+
+def ver_metricas(request):
+    """Per-view request metrics of every worker, in Prometheus text format."""
+    if not _pode_ver_metricas(request):
+        raise Http404
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
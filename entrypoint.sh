@@ -1,3 +1,6 @@
 #!/bin/sh
 python manage.py collectstatic --noinput
-exec gunicorn lista_compras.wsgi:application --bind 0.0.0.0:8000 --workers 3
+# Per-worker metric snapshots of a previous run (pids get reused)
+rm -rf "${METRICAS_DIR:-/tmp/lista_compras_metricas}"
+exec gunicorn lista_compras.asgi:application --bind 0.0.0.0:8000 --workers 3 \
+    --worker-class uvicorn.workers.UvicornWorker
@@ -8,9 +8,54 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
+import re
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lista_compras.settings')
 
-application = get_asgi_application()
+# Server-Sent Events routes (compras.views.eventos_stream and link_eventos),
+# after any root_path
+EVENTOS = re.compile(r'/(link/[^/]+/)?eventos/\Z')
+
+
+class _Adiada:
+    """Stands in for send(): keeps the response to send it later."""
+
+    def __init__(self):
+        self.response = None
+
+
+class Handler(ASGIHandler):
+    """
+    Django's ASGI handler, but an event stream is sent only once its request
+    has left its ThreadSensitiveContext. Django runs request_started, the sync
+    middleware and the views' sync_to_async calls in a thread of that context,
+    and the thread lives until the context ends; streamed inside it, every open
+    stream would keep its own idle thread for up to EVENTOS_DURACAO_MAX. The
+    stream itself only awaits compras.eventos, so it needs no thread.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not EVENTOS.search(scope['path']):
+            return await super().__call__(scope, receive, send)
+        adiada = _Adiada()
+        async with ThreadSensitiveContext():
+            await self.handle(scope, receive, adiada)
+            # Its database connections belong to the thread that is ending
+            await sync_to_async(connections.close_all)()
+        if adiada.response is not None:
+            await super().send_response(adiada.response, send)
+
+    async def send_response(self, response, send):
+        if isinstance(send, _Adiada):
+            send.response = response
+        else:
+            await super().send_response(response, send)
+
+
+django.setup(set_prefix=False)
+application = Handler()
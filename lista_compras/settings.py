@@ -56,11 +56,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoiseMiddleware, async-capable: the whole stack is, so ASGI runs it on the event loop
+    'compras.estaticos.EstaticosMiddleware',
+    'compras.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'compras.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,7 +72,8 @@ ROOT_URLCONF = 'lista_compras.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render time to MetricasMiddleware
+        'BACKEND': 'compras.metricas.TemplatesMedidos',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -103,6 +107,58 @@ DATABASES = {
     }
 }
 
+# Optional read replica of the primary (compras/replicas.py): GET requests of
+# REPLICA_VISTAS read from it, except for a user or share link that wrote in
+# the last REPLICA_FIXAR seconds. Point DB_REPLICA_HOST at the primary itself
+# (or at a second local MariaDB) to try it out.
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': config('DB_REPLICA_HOST'),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['compras.replicas.Router']
+REPLICA_VISTAS = ['check_updates', 'link_check_updates', 'ver_link', 'listar_links_partilha']
+REPLICA_FIXAR = 10
+
+
+# Cache
+# Shared by every gunicorn worker: memcached when MEMCACHED_LOCATION is set
+# (docker-compose), otherwise files on the local disk of the container.
+
+if config('MEMCACHED_LOCATION', default=''):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': config('MEMCACHED_LOCATION'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default='/tmp/lista_compras_cache'),
+        }
+    }
+
+# Lifetime of the cached per-user access records (compras/acessos.py)
+ACESSOS_TTL = 3600
+
+# Sessions are read from the cache and written through to the database only
+# when their data changed (compras/sessoes.py). Expired rows are purged in
+# batches by `manage.py limpar_expirados` (or `clearsessions`).
+SESSION_ENGINE = 'compras.sessoes'
+
+# Lifetime of the rendered item sections and list menu (compras/fragmentos.py).
+# Entries are keyed by revision, so this only bounds how long stale ones linger.
+FRAGMENTOS_TTL = 3600
+
+# Name suggestions of the add forms (compras/sugestoes.py): per-worker LRU of
+# SUGESTOES_CACHE prefix lookups, each kept SUGESTOES_TTL seconds
+SUGESTOES_CACHE = 1024
+SUGESTOES_TTL = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -141,6 +197,13 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic writes content-hashed copies (css/index.3f2a….css) plus gzip and
+# brotli versions; WhiteNoise serves them with far-future immutable headers.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -158,6 +221,60 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
 EMAIL_USE_SSL = config('EMAIL_USE_SSL', default=True, cast=bool)
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='ListaIsto <geral@listaisto.pt>')
+EMAIL_TIMEOUT = 30
+
+# Email outbox (compras/correio.py): `manage.py enviar_emails --ciclo` (the
+# "correio" service) checks it every EMAILS_INTERVALO seconds. A failed email
+# is retried after EMAILS_ESPERA seconds, doubling each time, up to
+# EMAILS_TENTATIVAS attempts.
+EMAILS_INTERVALO = 5
+EMAILS_ESPERA = 60
+EMAILS_TENTATIVAS = 6
+
+# Server-Sent Events (compras/eventos.py)
+# BaseDadosBackend: one polling thread per process, shared by every open stream.
+# MemoriaBackend: in-process only, for a single worker.
+EVENTOS_BACKEND = config('EVENTOS_BACKEND', default='compras.eventos.BaseDadosBackend')
+EVENTOS_INTERVALO = config('EVENTOS_INTERVALO', default=2, cast=float)
+EVENTOS_HEARTBEAT = 25
+EVENTOS_DURACAO_MAX = 300
+# Revisions remembered for channels no stream of this process listens to
+EVENTOS_CANAIS_INATIVOS = 1000
+
+# Share links: new links get HMAC-signed tokens (compras/tokens.py) that are
+# validated without a DB lookup; the old UUID links keep working.
+LINKS_ASSINADOS = config('LINKS_ASSINADOS', default=True, cast=bool)
+LINKS_CACHE_TTL = 60
+
+# `manage.py limpar_expirados --ciclo` (the "limpeza" service) deletes links
+# expired more than LINKS_CARENCIA_DIAS ago, expired sessions, item tombstones
+# older than APAGADOS_RETENCAO_DIAS (a page that last synced before that
+# reloads) and the ids of offline operations (OperacaoAplicada) older than
+# OPERACOES_RETENCAO_DIAS every LIMPEZA_INTERVALO seconds, sleeping
+# LIMPEZA_PAUSA seconds between batches
+LINKS_CARENCIA_DIAS = 7
+APAGADOS_RETENCAO_DIAS = 30
+OPERACOES_RETENCAO_DIAS = 30
+LIMPEZA_INTERVALO = 3600
+LIMPEZA_PAUSA = 0.1
+
+# Request metrics (compras/metricas.py): each worker writes its histograms to
+# METRICAS_DIR, and /metricas/ sums them in Prometheus format. The endpoint
+# answers staff users, or scrapers sending "Authorization: Bearer <METRICAS_TOKEN>".
+METRICAS_DIR = config('METRICAS_DIR', default='/tmp/lista_compras_metricas')
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+METRICAS_INTERVALO = 5
+
+# Password hashing (compras/senhas.py): at most SENHAS_CONCORRENCIA hashes run
+# at once per worker, SENHAS_FILA more may wait, further logins get a 503.
+SENHAS_CONCORRENCIA = config('SENHAS_CONCORRENCIA', default=2, cast=int)
+SENHAS_FILA = config('SENHAS_FILA', default=8, cast=int)
+
+# Login/registration attempts allowed per TENTATIVAS_JANELA seconds: failed logins
+# per username, and every attempt per client IP
+TENTATIVAS_JANELA = 300
+TENTATIVAS_MAX_UTILIZADOR = 10
+TENTATIVAS_MAX_IP = 50
 
 AUTHENTICATION_BACKENDS = [
     'compras.backends.HashedPasswordBackend',